@@ -0,0 +1,83 @@
+# benchmarks/bench_diff.py
+"""
+Diff preview cost: fs_ops.compute_unified_diff (interned lines, patience + Myers) versus
+difflib.unified_diff on 10k- and 100k-line inputs.
+
+Two shapes are generated: lockfile-like content (few distinct lines, lots of repetition,
+which is where difflib goes quadratic) and source-like content (mostly unique lines).
+difflib runs are skipped once a single run exceeds --difflib-timeout seconds on the
+smaller size, since the larger one would take far longer.
+
+    python benchmarks/bench_diff.py --sizes 10000 100000
+"""
+import argparse
+import difflib
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fs_ops  # noqa: E402
+
+
+def lockfile(size: int, rnd: random.Random) -> list:
+    return [f'  "pkg-{rnd.randint(0, 300)}": "^1.{rnd.randint(0, 9)}.0",\n' for _ in range(size)]
+
+
+def source(size: int, rnd: random.Random) -> list:
+    return [f"    value_{i} = compute({rnd.randint(0, 10**6)})\n" for i in range(size)]
+
+
+def mutate(lines: list, edits: int, rnd: random.Random) -> list:
+    new = list(lines)
+    for n in range(edits):
+        at = rnd.randrange(len(new))
+        choice = rnd.random()
+        if choice < 0.4:
+            new[at] = f"    changed_{n} = True\n"
+        elif choice < 0.7:
+            new.insert(at, f"    inserted_{n} = None\n")
+        else:
+            del new[at]
+    return new
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--edits", type=int, default=200)
+    parser.add_argument("--difflib-timeout", type=float, default=20.0)
+    args = parser.parse_args()
+
+    print(f"{'shape':<10} {'lines':>8} {'fast s':>9} {'difflib s':>10} {'same output':>12}")
+    for shape, make in (("lockfile", lockfile), ("source", source)):
+        skip_difflib = False
+        for size in args.sizes:
+            rnd = random.Random(size)
+            old_lines = make(size, rnd)
+            new_lines = mutate(old_lines, args.edits, rnd)
+            old, new = "".join(old_lines), "".join(new_lines)
+
+            result = {}
+            fast = timed(lambda: result.setdefault("fast", fs_ops.compute_unified_diff(old, new, "f")))
+            if skip_difflib:
+                print(f"{shape:<10} {size:>8} {fast:>9.3f} {'skipped':>10} {'-':>12}")
+                continue
+            slow = timed(lambda: result.setdefault("difflib", "".join(difflib.unified_diff(old_lines, new_lines, "a/f", "b/f"))))
+            same = "yes" if result["fast"] == result["difflib"] else "no*"
+            print(f"{shape:<10} {size:>8} {fast:>9.3f} {slow:>10.3f} {same:>12}")
+            skip_difflib = slow > args.difflib_timeout
+    print("\n* both are valid diffs; they differ only in which of several equal-cost alignments is shown.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_engine_overhead.py
+"""
+Per-prompt overhead of the REPL engine: one `python main.py` subprocess per prompt
+(the old behaviour) versus a single in-process Engine reused across prompts.
+
+Only the dead time before the first model request is measured (interpreter start,
+imports, client construction, memory load, git checks), so no API key or network
+access is needed.
+
+    python benchmarks/bench_engine_overhead.py --iterations 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# What a fresh `python main.py "<prompt>"` does before it talks to the model.
+SUBPROCESS_SNIPPET = (
+    "import main; "
+    "engine = main.Engine(); "
+    "engine.prepare(); "
+    "main.build_response_messages(main.SYSTEM_PROMPT, engine.turns, 'hello'); "
+    "engine.close()"
+)
+
+
+def bench_subprocess(iterations: int, env: dict) -> list:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", SUBPROCESS_SNIPPET], cwd=ROOT, env=env, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_in_process(iterations: int) -> list:
+    import main
+
+    engine = main.Engine()
+    engine.prepare()  # paid once when the REPL starts
+    timings = []
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            engine.prepare()
+            main.build_response_messages(main.SYSTEM_PROMPT, engine.turns, "hello")
+            timings.append(time.perf_counter() - start)
+    finally:
+        engine.close()
+    return timings
+
+
+def report(label: str, timings: list) -> None:
+    median_ms = statistics.median(timings) * 1000
+    best_ms = min(timings) * 1000
+    print(f"{label:<12} median {median_ms:9.2f} ms   best {best_ms:9.2f} ms   (n={len(timings)})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    # Client construction only needs a key to be present, not a valid one.
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+
+    before = bench_subprocess(args.iterations, dict(os.environ))
+    after = bench_in_process(args.iterations)
+    report("subprocess", before)
+    report("in-process", after)
+    saved = statistics.median(before) - statistics.median(after)
+    print(f"saved per prompt: {saved * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_git_commit.py
+"""
+Commit latency of one edited file in a large repository: the old `git add` + `git commit`
+pair versus git_ops.commit_paths (update-index / write-tree / commit-tree / update-ref,
+with HEAD resolved by a long-lived cat-file process).
+
+The repository gets --files tracked files spread over nested directories plus an
+untracked directory of --untracked files, which `git commit` has to walk past and the
+plumbing path never looks at.
+
+    python benchmarks/bench_git_commit.py --files 100000 --untracked 20000 --commits 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import git_ops  # noqa: E402
+
+
+def git(root: Path, *args: str) -> None:
+    subprocess.run(["git", *args], cwd=root, check=True, capture_output=True)
+
+
+def populate(root: Path, count: int, prefix: str) -> None:
+    for i in range(count):
+        folder = root / prefix / f"d{i % 100}" / f"e{i % 1000 // 100}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"f{i}.txt").write_text(f"file {i}\n")
+
+
+def legacy_commit(root: Path, paths, message: str) -> None:
+    git(root, "add", *paths)
+    git(root, "commit", "-m", message)
+
+
+def time_commits(root: Path, commit, label: str, commits: int) -> list:
+    target = root / "src" / "d0" / "e0" / "f0.txt"
+    timings = []
+    for n in range(commits):
+        target.write_text(f"{label} edit {n}\n")
+        start = time.perf_counter()
+        commit(root, [str(target.relative_to(root))], f"feat(agent): {label} {n}")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--untracked", type=int, default=20_000)
+    parser.add_argument("--commits", type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault("GIT_AUTHOR_NAME", "bench")
+    os.environ.setdefault("GIT_AUTHOR_EMAIL", "bench@example.com")
+    os.environ.setdefault("GIT_COMMITTER_NAME", "bench")
+    os.environ.setdefault("GIT_COMMITTER_EMAIL", "bench@example.com")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"creating {args.files} tracked and {args.untracked} untracked files...")
+        git(root, "init", "-q")
+        populate(root, args.files, "src")
+        git(root, "add", "-A")
+        git(root, "commit", "-q", "-m", "base")
+        populate(root, args.untracked, "scratch")
+
+        plumbing = lambda root, paths, message: git_ops.commit_paths(paths, message, root=str(root))  # noqa: E731
+        results = {
+            "git add + git commit": time_commits(root, legacy_commit, "legacy", args.commits),
+            "plumbing (commit_paths)": time_commits(root, plumbing, "plumbing", args.commits),
+        }
+        print(f"\n{'approach':<26} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+        for label, timings in results.items():
+            ms = [t * 1000 for t in timings]
+            print(f"{label:<26} {statistics.median(ms):>10.1f} {min(ms):>8.1f} {max(ms):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
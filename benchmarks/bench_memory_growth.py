@@ -0,0 +1,91 @@
+# benchmarks/bench_memory_growth.py
+"""
+Intent-prompt size over a long session: the old memory (last 40 turns, assistant
+summaries carrying full intents) versus the token-budgeted memory with digests and a
+rolling summary.
+
+Each simulated prompt alternates between creating a file of `--file-kb` KB, editing a
+file and running a command, which is what makes the old prompts balloon. No model calls
+are made; sizes are measured on the messages that would be sent.
+
+    python benchmarks/bench_memory_growth.py --turns 100 --file-kb 8
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import main  # noqa: E402
+import memory  # noqa: E402
+from llm import estimate_tokens  # noqa: E402
+
+OLD_MAX_TURNS = 40
+
+
+def simulated_prompt(n: int, file_kb: int):
+    body = "\n".join(f"line {n}.{i}: " + "x" * 40 for i in range(file_kb * 1024 // 50))
+    if n % 3 == 0:
+        intent = {"type": "create_file", "path": f"pkg/module_{n}.py", "contents": body}
+        plan = [
+            {"kind": "show_diff", "path": intent["path"], "contents": body},
+            {"kind": "write_file", "path": intent["path"], "contents": body},
+        ]
+        actions = [{"type": "write_file", "path": intent["path"], "applied": True, "committed": True}]
+        prompt = f"create pkg/module_{n}.py with a helper for task {n}"
+    elif n % 3 == 1:
+        intent = {"type": "edit_file", "path": f"pkg/module_{n - 1}.py", "instructions": f"rename helper {n}", "patch": None}
+        plan = [{"kind": "read_file", "path": intent["path"]}, {"kind": "synthesize_patch", "path": intent["path"]}]
+        actions = [{"type": "write_file", "path": intent["path"], "applied": True, "committed": True}]
+        prompt = f"rename the helper in module {n - 1}"
+    else:
+        intent = {"type": "run_command", "command": "pytest", "args": ["-q"]}
+        plan = [{"kind": "run_command", "command": "pytest", "args": ["-q"]}]
+        output = "\n".join(f"tests/test_{i}.py ....." for i in range(60))
+        actions = [{"type": "run_command", "command": "pytest", "args": ["-q"], "decision": "executed",
+                    "exit_code": 0, "stdout": main.truncate_text(output, 500)}]
+        prompt = "run the tests"
+    return prompt, SimpleNamespace(model_dump=lambda intent=intent: intent), plan, actions
+
+
+def old_summary(intent, plan, actions) -> str:
+    return json.dumps({"intent": intent.model_dump(), "plan": plan, "actions": actions}, indent=2, ensure_ascii=False)
+
+
+def prompt_tokens(turns, prompt: str) -> int:
+    msgs = main.build_response_messages(main.SYSTEM_PROMPT, turns, prompt)
+    return estimate_tokens(json.dumps(msgs, ensure_ascii=False))
+
+
+def main_bench(turns: int, file_kb: int, budget: int) -> None:
+    old_turns, new_turns = [], []
+    print(f"{'prompt':>6} {'old tokens':>12} {'new tokens':>12}")
+    checkpoints = {1, 5, 10, 25, 50, 75, turns}
+    for n in range(1, turns + 1):
+        prompt, intent, plan, actions = simulated_prompt(n, file_kb)
+        old_size = prompt_tokens(old_turns, prompt)
+        new_size = prompt_tokens(new_turns, prompt)
+        if n in checkpoints:
+            print(f"{n:>6} {old_size:>12} {new_size:>12}")
+
+        old_turns += [{"role": "user", "content": prompt}, {"role": "assistant", "content": old_summary(intent, plan, actions)}]
+        old_turns = old_turns[-OLD_MAX_TURNS:]
+        new_turns += [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": main.build_assistant_summary(intent, plan, actions)},
+        ]
+        new_turns = memory.trim_turns(new_turns, budget=budget)
+    print(f"\nbudget: {budget} tokens; new history ends with {len(new_turns)} turns "
+          f"({memory.history_tokens(new_turns)} tokens)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--file-kb", type=int, default=8)
+    parser.add_argument("--budget", type=int, default=memory.MEMORY_TOKEN_BUDGET)
+    args = parser.parse_args()
+    main_bench(args.turns, args.file_kb, args.budget)
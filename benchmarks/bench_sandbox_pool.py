@@ -0,0 +1,68 @@
+# benchmarks/bench_sandbox_pool.py
+"""
+Command latency with a sandbox per prompt versus the warm sandbox pool, offline, using
+the fake E2B SDK with a simulated boot time.
+
+"cold" boots an E2BSandbox for every prompt and kills it afterwards, which is what the
+engine did before the pool. "pooled" runs the same prompts through one PooledSandbox
+per prompt over a shared SandboxPool. Each prompt runs --commands commands with
+--think seconds of model time before each one.
+
+    python benchmarks/bench_sandbox_pool.py --boot 1.5 --prompts 10 --commands 2
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from providers.e2b_sandbox import E2BSandbox  # noqa: E402
+from providers.fake_e2b import FakeSandbox  # noqa: E402
+from providers.sandbox_pool import PooledSandbox, SandboxPool  # noqa: E402
+
+
+def run_prompts(make, prompts: int, commands: int, think: float) -> list:
+    timings = []
+    for _ in range(prompts):
+        sandbox = None
+        for _ in range(commands):
+            time.sleep(think)
+            start = time.perf_counter()
+            if sandbox is None:
+                sandbox = make()  # created lazily, on the prompt's first command
+            sandbox.run("echo", ["ok"])
+            timings.append(time.perf_counter() - start)
+        sandbox.close()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--boot", type=float, default=1.5, help="simulated sandbox boot seconds")
+    parser.add_argument("--prompts", type=int, default=10)
+    parser.add_argument("--commands", type=int, default=2)
+    parser.add_argument("--think", type=float, default=0.2, help="seconds between commands")
+    parser.add_argument("--prewarm", type=int, default=1)
+    args = parser.parse_args()
+
+    FakeSandbox.boot_sec = args.boot
+    pool = SandboxPool(lambda: E2BSandbox(sdk=FakeSandbox), prewarm=args.prewarm)
+    try:
+        results = {
+            "cold (sandbox per prompt)": run_prompts(lambda: E2BSandbox(sdk=FakeSandbox), args.prompts, args.commands, args.think),
+            "pooled": run_prompts(lambda: PooledSandbox(pool), args.prompts, args.commands, args.think),
+        }
+    finally:
+        pool.close()
+    print(f"\n{'approach':<26} {'median ms':>10} {'mean ms':>9} {'max ms':>8}")
+    for label, timings in results.items():
+        ms = [t * 1000 for t in timings]
+        print(f"{label:<26} {statistics.median(ms):>10.1f} {statistics.mean(ms):>9.1f} {max(ms):>8.1f}")
+    print(f"\npool: {pool.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_symbols.py
+"""
+Symbol map refresh cost on a synthetic repository: cold (nothing cached), warm in the same
+process (the daemon/REPL case) and warm from a fresh process (index and symbol cache
+loaded from .agent/index/), plus the time to render the intent repo map.
+
+    python benchmarks/bench_symbols.py --files 5000
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import symbols  # noqa: E402
+from workspace import WorkspaceIndex  # noqa: E402
+
+
+def module_source(n: int, rnd: random.Random) -> str:
+    parts = [f'"""Module {n}."""\nimport os\n\n']
+    for c in range(rnd.randint(1, 3)):
+        parts.append(f"class Service{n}_{c}(object):\n")
+        for m in range(rnd.randint(2, 6)):
+            parts.append(f"    def method_{m}(self, value: int, *, flag: bool = False) -> int:\n")
+            parts.append("        total = value\n" * rnd.randint(3, 15) + "        return total\n\n")
+    for f in range(rnd.randint(1, 5)):
+        parts.append(f"def helper_{n}_{f}(path: str, retries: int = 3) -> str:\n    return path\n\n")
+    return "".join(parts)
+
+
+def make_repo(root: Path, files: int) -> None:
+    rnd = random.Random(files)
+    for n in range(files):
+        package = root / f"pkg{n % 50}"
+        package.mkdir(exist_ok=True)
+        (package / f"module_{n}.py").write_text(module_source(n, rnd))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def refresh(index: symbols.SymbolIndex) -> int:
+    index.workspace.refresh()
+    return index.refresh()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_repo(root, args.files)
+        print(f"{args.files} files, {symbols.SYMBOL_WORKERS} worker process(es)")
+
+        index = symbols.SymbolIndex(WorkspaceIndex(str(root)))
+        cold, parsed = timed(lambda: refresh(index))
+        print(f"cold refresh:               {cold:7.3f}s ({parsed} files parsed)")
+        warm, parsed = timed(lambda: refresh(index))
+        print(f"warm refresh, same process: {warm:7.3f}s ({parsed} files parsed)")
+
+        reloaded = symbols.SymbolIndex(WorkspaceIndex(str(root)))
+        warm_disk, parsed = timed(lambda: refresh(reloaded))
+        print(f"warm refresh, from disk:    {warm_disk:7.3f}s ({parsed} files parsed)")
+
+        touched = sorted(root.glob("pkg0/*.py"))[:10]
+        for path in touched:
+            path.write_text(path.read_text() + "\ndef added() -> None:\n    pass\n")
+        incremental, parsed = timed(lambda: refresh(reloaded))
+        print(f"after editing {len(touched)} files:     {incremental:7.3f}s ({parsed} files parsed)")
+
+        render, repo_map = timed(lambda: reloaded.repo_map())
+        print(f"repo map render:            {render:7.3f}s ({len(repo_map)} chars, {symbols.REPO_MAP_TOKENS} token budget)")
+
+
+if __name__ == "__main__":
+    main()
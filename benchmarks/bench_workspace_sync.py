@@ -0,0 +1,81 @@
+# benchmarks/bench_workspace_sync.py
+"""
+Workspace sync into a sandbox, offline, against the fake E2B SDK: the first push of
+--files files on one archive versus split across --workers archives, then a push after
+editing --edits files. Each upload is limited to --mbps, like one HTTP stream to the
+service; unpacking runs on the local disk.
+
+    python benchmarks/bench_workspace_sync.py --files 5000 --size 4096 --workers 4 --mbps 2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from providers.e2b_sandbox import E2BSandbox  # noqa: E402
+from providers.fake_e2b import FakeSandbox  # noqa: E402
+from providers.workspace_sync import WorkspaceSync  # noqa: E402
+from workspace import WorkspaceIndex  # noqa: E402
+
+
+def populate(root: Path, count: int, size: int) -> None:
+    for i in range(count):
+        folder = root / f"d{i % 50}"
+        folder.mkdir(parents=True, exist_ok=True)
+        # Half random, half repetitive: roughly source-code compressibility.
+        (folder / f"f{i}.py").write_bytes(os.urandom(size // 4).hex().encode()[: size // 2] + b"x = 1\n" * (size // 12))
+
+
+def first_push(root: Path, workers: int) -> float:
+    sandbox = E2BSandbox(sdk=FakeSandbox)
+    try:
+        result = WorkspaceSync(WorkspaceIndex(str(root)), workers=workers, parallel_min_bytes=1).push(sandbox)
+        print(f"  {workers} worker(s): {result.uploaded} files, {result.bytes / 1e6:.1f} MB in {result.archives} archive(s)")
+        return result.seconds
+    finally:
+        sandbox.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--edits", type=int, default=3)
+    parser.add_argument("--mbps", type=float, default=2.0, help="upload MB/s per stream (0: unlimited)")
+    args = parser.parse_args()
+
+    FakeSandbox.upload_bytes_per_sec = args.mbps * 1e6
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"creating {args.files} files of {args.size} bytes...")
+        populate(root, args.files, args.size)
+        WorkspaceIndex(str(root)).refresh()  # hash once, outside the timings
+
+        serial = first_push(root, 1)
+        parallel = first_push(root, args.workers)
+
+        sandbox = E2BSandbox(sdk=FakeSandbox)
+        try:
+            sync = WorkspaceSync(WorkspaceIndex(str(root)), workers=args.workers)
+            sync.push(sandbox)
+            for i in range(args.edits):
+                (root / f"d{i % 50}" / f"f{i}.py").write_text(f"edited = {time.time()}\n")
+            incremental = sync.push(sandbox)
+        finally:
+            sandbox.close()
+
+    print(f"\n{'push':<28} {'seconds':>8}")
+    print(f"{'first, 1 archive':<28} {serial:>8.3f}")
+    print(f"{'first, ' + str(args.workers) + ' archives':<28} {parallel:>8.3f}")
+    print(f"{'after ' + str(args.edits) + ' edits':<28} {incremental.seconds:>8.3f}  ({incremental.uploaded} uploaded)")
+
+
+if __name__ == "__main__":
+    main()
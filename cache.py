@@ -0,0 +1,171 @@
+# cache.py
+"""
+Content-addressed on-disk cache for model results under .agent/cache/.
+
+Keys are SHA-256 digests of everything that determines a model answer (model, system
+prompt, input messages, hash of the file being edited). Entries are JSON, optionally
+zlib-compressed, and the directory is kept under a byte budget by evicting the least
+recently used entries (access time is tracked through file mtimes).
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+CACHE_DIR = Path(".agent/cache")
+
+DEFAULT_MAX_BYTES = int(float(os.getenv("AGENT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+DEFAULT_COMPRESS = os.getenv("AGENT_CACHE_COMPRESS", "1").strip().lower() not in {"0", "false", "no"}
+
+_PLAIN_SUFFIX = ".json"
+_COMPRESSED_SUFFIX = ".json.z"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable digest of JSON-serialisable parts; dict ordering does not matter."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return content_hash(canonical)
+
+
+class DiskCache:
+    def __init__(
+        self,
+        root: Path = CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        compress: bool = DEFAULT_COMPRESS,
+        enabled: bool = True,
+    ) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None  # measured lazily on the first write
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        shard = self.root / key[:2]
+        return shard / (key + _COMPRESSED_SUFFIX), shard / (key + _PLAIN_SUFFIX)
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        for path in self._paths(key):
+            try:
+                raw = path.read_bytes()
+            except OSError:
+                continue
+            try:
+                if path.name.endswith(_COMPRESSED_SUFFIX):
+                    raw = zlib.decompress(raw)
+                value = json.loads(raw.decode("utf-8"))
+            except (zlib.error, ValueError):
+                self._discard(path)
+                continue
+            try:
+                os.utime(path)  # mark as recently used
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        compressed, plain = self._paths(key)
+        path = compressed if self.compress else plain
+        if self.compress:
+            data = zlib.compress(data, 6)
+        if len(data) > self.max_bytes:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        previous = self._size(path)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += len(data) - previous
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def clear(self) -> None:
+        for path, _, _ in self._entries():
+            self._discard(path)
+        with self._lock:
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    # --- housekeeping ---
+
+    @staticmethod
+    def _size(path: Path) -> int:
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+
+    def _entries(self) -> List[Tuple[Path, float, int]]:
+        entries: List[Tuple[Path, float, int]] = []
+        if not self.root.exists():
+            return entries
+        for path in self.root.glob("*/*"):
+            if not path.name.endswith((_PLAIN_SUFFIX, _COMPRESSED_SUFFIX)):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def _scan_total(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _discard(self, path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is back to 90% of its budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for path, _, size in entries:
+            if total <= target:
+                break
+            self._discard(path)
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._total_bytes = total
+            self.evictions += evicted
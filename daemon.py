@@ -0,0 +1,365 @@
+# daemon.py
+"""
+`cherno serve`: a long-lived process that owns one Engine (OpenAI client, warm sandbox,
+session memory, caches) and runs prompts for thin clients over a Unix domain socket.
+
+The protocol is newline-delimited JSON frames.
+
+client -> server: {"op": "run", "prompt", "options"} | {"op": "answer", "text"} | {"op": "cancel"}
+                  | {"op": "ping"} | {"op": "flush"} | {"op": "shutdown"}
+server -> client: {"op": "output", "data"} | {"op": "ask", "prompt"} | {"op": "done", "code"}
+                  | {"op": "pong"} | {"op": "error", "message"}
+
+"options" holds the keyword arguments of Engine.run (dry_run, debug, stream, ...).
+Everything the engine prints is forwarded as "output" frames, and every confirmation
+(`input()` in the in-process engine) becomes an "ask" frame answered by the client.
+While a prompt runs, the daemon keeps reading the connection: a "cancel" frame (sent on
+Ctrl-C) or the client going away cancels the run, closing any streaming model response.
+Requests are served one at a time, in arrival order.
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TextIO
+
+AGENT_DIR = Path(".agent")
+SOCKET_PATH = AGENT_DIR / "cherno.sock"
+LOG_PATH = AGENT_DIR / "daemon.log"
+
+IDLE_TIMEOUT_SEC = float(os.getenv("CHERNO_DAEMON_IDLE_SEC", "1800"))
+START_TIMEOUT_SEC = 15.0
+
+
+def daemon_supported() -> bool:
+    if not hasattr(socket, "AF_UNIX"):
+        return False
+    return os.getenv("CHERNO_NO_DAEMON", "").strip().lower() not in {"1", "true", "yes"}
+
+
+class Connection:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self._reader = sock.makefile("r", encoding="utf-8", newline="\n")
+
+    def send(self, op: str, **fields: Any) -> None:
+        frame = {"op": op, **fields}
+        self.sock.sendall((json.dumps(frame, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def recv(self) -> Optional[Dict[str, Any]]:
+        line = self._reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self) -> None:
+        try:
+            self._reader.close()
+        finally:
+            self.sock.close()
+
+
+class _OutputWriter(io.TextIOBase):
+    """File-like object that forwards everything written to it as output frames."""
+
+    def __init__(self, conn: Connection) -> None:
+        self._conn = conn
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: str) -> int:
+        if data:
+            self._conn.send("output", data=data)
+        return len(data)
+
+
+class _ClientFrames:
+    """
+    Reads the client's frames while a run is in progress, so a cancel (or the client going
+    away) is noticed even while the engine is busy streaming. Answers to "ask" frames are
+    handed to the engine's ask() through a queue.
+    """
+
+    def __init__(self, conn: Connection, on_cancel: Callable[[], None]) -> None:
+        self._conn = conn
+        self._on_cancel = on_cancel
+        self._answers: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.cancelled = False
+        self.disconnected = False
+        self._finished = False
+        self._thread = threading.Thread(target=self._read, name="daemon-client", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _read(self) -> None:
+        while True:
+            try:
+                frame = self._conn.recv()
+            except (OSError, ValueError):
+                frame = None
+            op = frame.get("op") if frame is not None else None
+            if op == "answer":
+                self._answers.put(str(frame.get("text", "")))
+                continue
+            if frame is None or op == "cancel":
+                if not self._finished and not self.cancelled:
+                    self.cancelled = True
+                    self._on_cancel()
+                self._answers.put(None)  # wakes a pending ask()
+                if frame is None:
+                    self.disconnected = True
+                    return
+
+    def ask(self, prompt: str) -> str:
+        if self.cancelled:
+            raise EOFError("Run cancelled by the client.")
+        self._conn.send("ask", prompt=prompt)
+        answer = self._answers.get()
+        if answer is None:
+            raise EOFError("Client cancelled or disconnected while waiting for confirmation.")
+        return answer
+
+    def stop(self) -> None:
+        self._finished = True
+        try:
+            self._conn.sock.shutdown(socket.SHUT_RD)  # ends the reader's recv()
+        except OSError:
+            pass
+        self._thread.join(timeout=5)
+
+
+def _no_client_ask(prompt: str) -> str:
+    raise EOFError("No client attached to answer confirmations.")
+
+
+# --- server ---
+
+
+def _handle(engine: Any, conn: Connection) -> bool:
+    """Serve one connection. Returns False when the client asked the daemon to stop."""
+    frame = conn.recv()
+    if frame is None:
+        return True
+    op = frame.get("op")
+    if op == "ping":
+        conn.send("pong", pid=os.getpid())
+        return True
+    if op == "shutdown":
+        conn.send("done", code=0)
+        return False
+    if op == "flush":
+        # Pending background commits, so a rollback in the client sees them in HEAD.
+        writer = _OutputWriter(conn)
+        try:
+            with redirect_stdout(writer), redirect_stderr(writer):
+                engine.flush_commits()
+            conn.send("done", code=0)
+        except Exception as ex:
+            conn.send("error", message=str(ex))
+        return True
+    if op != "run":
+        conn.send("error", message=f"Unknown op: {op}")
+        return True
+
+    options = frame.get("options") or {}
+    writer = _OutputWriter(conn)
+    client = _ClientFrames(conn, getattr(engine, "cancel", lambda: None))
+    engine.ask = client.ask
+    client.start()
+    try:
+        with redirect_stdout(writer), redirect_stderr(writer):
+            code = engine.run(str(frame.get("prompt", "")), **options)
+        conn.send("done", code=int(code or 0))
+    except (EOFError, BrokenPipeError, ConnectionError):
+        if client.cancelled and not client.disconnected:
+            try:
+                conn.send("done", code=130)  # a confirmation was pending when the client cancelled
+            except OSError:
+                pass
+    except Exception as ex:
+        try:
+            conn.send("error", message=str(ex))
+        except OSError:
+            pass
+    finally:
+        engine.ask = _no_client_ask
+        client.stop()
+    return True
+
+
+def _bind(socket_path: Path) -> socket.socket:
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        if _connect(socket_path) is not None:
+            raise RuntimeError(f"A cherno daemon is already listening on {socket_path}")
+        socket_path.unlink()  # stale socket from a crashed daemon
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(str(socket_path))
+    srv.listen(8)
+    return srv
+
+
+def serve(
+    socket_path: Path = SOCKET_PATH,
+    idle_timeout: Optional[float] = IDLE_TIMEOUT_SEC,
+    engine_factory: Optional[Callable[[], Any]] = None,
+) -> None:
+    """Run the daemon in the foreground until shutdown or `idle_timeout` seconds without clients."""
+    if engine_factory is None:
+        from main import Engine
+
+        engine_factory = Engine
+    engine = engine_factory()
+    engine.ask = _no_client_ask
+    srv = _bind(socket_path)
+    srv.settimeout(idle_timeout if idle_timeout and idle_timeout > 0 else None)
+    try:
+        while True:
+            try:
+                sock, _ = srv.accept()
+            except socket.timeout:
+                break
+            sock.settimeout(None)
+            conn = Connection(sock)
+            try:
+                keep_running = _handle(engine, conn)
+            finally:
+                conn.close()
+            if not keep_running:
+                break
+    finally:
+        srv.close()
+        try:
+            socket_path.unlink()
+        except OSError:
+            pass
+        engine.close()
+
+
+# --- client ---
+
+
+def _connect(socket_path: Path) -> Optional[socket.socket]:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _spawn(socket_path: Path) -> None:
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    main_py = Path(__file__).resolve().with_name("main.py")
+    argv = [sys.executable, str(main_py), "--serve", "--socket", str(socket_path)]
+    with open(LOG_PATH, "ab") as log:
+        subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+
+
+def ensure_daemon(socket_path: Path = SOCKET_PATH, start_timeout: float = START_TIMEOUT_SEC) -> socket.socket:
+    """Connect to the daemon, starting it in the background if it isn't running."""
+    sock = _connect(socket_path)
+    if sock is not None:
+        return sock
+    _spawn(socket_path)
+    deadline = time.monotonic() + start_timeout
+    while time.monotonic() < deadline:
+        sock = _connect(socket_path)
+        if sock is not None:
+            return sock
+        time.sleep(0.05)
+    raise RuntimeError(f"cherno daemon did not start within {start_timeout:.0f}s (see {LOG_PATH})")
+
+
+def run_remote(
+    prompt: str,
+    ask: Callable[[str], str] = input,
+    out: Optional[TextIO] = None,
+    socket_path: Path = SOCKET_PATH,
+    **options: Any,
+) -> int:
+    """
+    Run one prompt on the daemon, relaying output and confirmations. `options` are passed
+    to Engine.run on the daemon side. Returns the exit code.
+    """
+    out = out or sys.stdout
+    conn = Connection(ensure_daemon(socket_path))
+    cancelled = False
+    try:
+        conn.send("run", prompt=prompt, options=options)
+        while True:
+            try:
+                frame = conn.recv()
+                if frame is None:
+                    raise RuntimeError("cherno daemon closed the connection unexpectedly")
+                op = frame.get("op")
+                if op == "output":
+                    out.write(frame.get("data", ""))
+                    out.flush()
+                elif op == "ask":
+                    conn.send("answer", text=ask(frame.get("prompt", "")))
+                elif op == "done":
+                    return int(frame.get("code", 0))
+                elif op == "error":
+                    raise RuntimeError(frame.get("message", "cherno daemon error"))
+            except KeyboardInterrupt:
+                if cancelled:
+                    raise  # a second Ctrl-C: drop the connection, which cancels too
+                # Stop the daemon's run (and any streaming synthesis), then show how it ends.
+                cancelled = True
+                conn.send("cancel")
+    finally:
+        conn.close()
+
+
+def flush_daemon(socket_path: Path = SOCKET_PATH, out: Optional[TextIO] = None) -> bool:
+    """Wait for a running daemon's queued commits. False if no daemon is running."""
+    sock = _connect(socket_path)
+    if sock is None:
+        return False
+    out = out or sys.stdout
+    conn = Connection(sock)
+    try:
+        conn.send("flush")
+        while True:
+            frame = conn.recv()
+            if frame is None or frame.get("op") == "done":
+                return True
+            if frame.get("op") == "output":
+                out.write(frame.get("data", ""))
+                out.flush()
+            elif frame.get("op") == "error":
+                raise RuntimeError(frame.get("message", "cherno daemon error"))
+    finally:
+        conn.close()
+
+
+def stop_daemon(socket_path: Path = SOCKET_PATH) -> bool:
+    sock = _connect(socket_path)
+    if sock is None:
+        return False
+    conn = Connection(sock)
+    try:
+        conn.send("shutdown")
+        conn.recv()
+    finally:
+        conn.close()
+    return True
@@ -0,0 +1,260 @@
+# edit_format.py
+"""
+Compact edit formats and a forgiving local applier.
+
+Two formats are understood:
+
+* SEARCH/REPLACE blocks (what the synthesis prompt asks for)::
+
+    <<<<<<< SEARCH
+    old lines
+    =======
+    new lines
+    >>>>>>> REPLACE
+
+* unified diff hunks (what `EditFile.patch` usually carries).
+
+Hunks are converted to blocks and applied in order. Each block is located with an
+exact line match first, then ignoring whitespace differences, then by fuzzy similarity,
+and the replacement is re-indented to the indentation actually found in the file.
+"""
+import difflib
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+# Minimum similarity for a fuzzy match, and a cap on how much fuzzy scanning one block may do.
+FUZZY_THRESHOLD = 0.85
+FUZZY_MAX_WORK = 400_000
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class EditBlock(NamedTuple):
+    search: List[str]   # lines without line endings
+    replace: List[str]
+    hint: Optional[int] = None  # 0-based line where the search text is expected, if known
+
+
+def looks_like_edit_blocks(text: str) -> bool:
+    return SEARCH_MARKER in text and REPLACE_MARKER in text
+
+
+def looks_like_unified_diff(text: str) -> bool:
+    return any(_HUNK_HEADER.match(line) for line in text.splitlines())
+
+
+def parse_edit_blocks(text: str, complete_only: bool = False) -> List[EditBlock]:
+    """
+    Parse SEARCH/REPLACE blocks. With complete_only, a trailing block that has not been
+    closed yet (as in a partially streamed response) is ignored instead of rejected.
+    """
+    blocks: List[EditBlock] = []
+    search: List[str] = []
+    replace: List[str] = []
+    state = "outside"
+    for line in text.splitlines():
+        marker = line.strip()
+        if state == "outside":
+            if marker == SEARCH_MARKER:
+                search, replace, state = [], [], "search"
+        elif state == "search":
+            if marker == DIVIDER:
+                state = "replace"
+            else:
+                search.append(line)
+        elif state == "replace":
+            if marker == REPLACE_MARKER:
+                blocks.append(EditBlock(search, replace))
+                state = "outside"
+            else:
+                replace.append(line)
+    if state != "outside" and not complete_only:
+        raise ValueError("Unterminated SEARCH/REPLACE block")
+    return blocks
+
+
+def parse_unified_diff(text: str) -> List[EditBlock]:
+    blocks: List[EditBlock] = []
+    search: Optional[List[str]] = None
+    replace: List[str] = []
+    hint: Optional[int] = None
+    # Lines the current hunk header still promises; while any remain, "--- x" is a removed
+    # "-- x" line rather than the next file's header.
+    old_left = new_left = 0
+
+    def flush() -> None:
+        if search is not None and (search or replace):
+            blocks.append(EditBlock(search, replace, hint))
+
+    for line in text.splitlines():
+        header = _HUNK_HEADER.match(line)
+        if header:
+            flush()
+            search, replace = [], []
+            old_start = int(header.group(1))
+            old_len = int(header.group(2)) if header.group(2) is not None else 1
+            old_left = old_len
+            new_left = int(header.group(4)) if header.group(4) is not None else 1
+            # "-0,0" (or "-N,0") means "insert after line N".
+            hint = old_start if old_len == 0 else old_start - 1
+            continue
+        if search is None or line.startswith("\\"):
+            continue
+        if old_left <= 0 and new_left <= 0 and line.startswith(("--- ", "+++ ", "diff --git", "index ")):
+            continue
+        if line.startswith("-"):
+            search.append(line[1:])
+            old_left -= 1
+        elif line.startswith("+"):
+            replace.append(line[1:])
+            new_left -= 1
+        else:
+            # Context line; some generators drop the leading space on blank lines.
+            body = line[1:] if line.startswith(" ") else line
+            search.append(body)
+            replace.append(body)
+            old_left -= 1
+            new_left -= 1
+    flush()
+    return blocks
+
+
+def _norm(line: str) -> str:
+    return " ".join(line.split())
+
+
+def _indent(line: str) -> str:
+    return line[: len(line) - len(line.lstrip())]
+
+
+def _trim_blank_edges(block: EditBlock) -> EditBlock:
+    """Models often add or drop blank lines around a block; don't let that defeat matching."""
+    search, replace = list(block.search), list(block.replace)
+    while search and not search[0].strip():
+        search.pop(0)
+        if replace and not replace[0].strip():
+            replace.pop(0)
+    while search and not search[-1].strip():
+        search.pop()
+        if replace and not replace[-1].strip():
+            replace.pop()
+    return EditBlock(search, replace, block.hint)
+
+
+def _pick(candidates: List[int], cursor: int, hint: Optional[int]) -> int:
+    if hint is not None:
+        return min(candidates, key=lambda i: abs(i - hint))
+    after = [i for i in candidates if i >= cursor]
+    return after[0] if after else candidates[0]
+
+
+def find_block(lines: List[str], search: List[str], cursor: int = 0, hint: Optional[int] = None) -> Optional[Tuple[int, bool]]:
+    """
+    Locate `search` in `lines` (both without line endings). Returns (start, exact) or None.
+    `exact` is False when whitespace or fuzzy matching was needed.
+    """
+    n = len(search)
+    if n == 0 or n > len(lines):
+        return None
+    last_start = len(lines) - n
+
+    first = search[0]
+    exact = [i for i in range(last_start + 1) if lines[i] == first and lines[i:i + n] == search]
+    if exact:
+        return _pick(exact, cursor, hint), True
+
+    normalized = [_norm(line) for line in lines]
+    wanted = [_norm(line) for line in search]
+    loose = [i for i in range(last_start + 1) if normalized[i] == wanted[0] and normalized[i:i + n] == wanted]
+    if loose:
+        return _pick(loose, cursor, hint), False
+
+    # Fuzzy: anchor on windows whose first or last line agrees, unless the file is small
+    # enough to score every window.
+    starts = [i for i in range(last_start + 1) if normalized[i] == wanted[0] or normalized[i + n - 1] == wanted[-1]]
+    if not starts and (last_start + 1) * n <= FUZZY_MAX_WORK:
+        starts = list(range(last_start + 1))
+    target = "\n".join(wanted)
+    best: Optional[Tuple[float, int]] = None
+    for i in starts:
+        matcher = difflib.SequenceMatcher(None, "\n".join(normalized[i:i + n]), target, autojunk=False)
+        if matcher.real_quick_ratio() < FUZZY_THRESHOLD or matcher.quick_ratio() < FUZZY_THRESHOLD:
+            continue
+        ratio = matcher.ratio()
+        if ratio >= FUZZY_THRESHOLD and (best is None or ratio > best[0]):
+            best = (ratio, i)
+    if best is not None:
+        return best[1], False
+    return None
+
+
+def _reindent(replace: List[str], search: List[str], found: List[str]) -> List[str]:
+    """Shift the replacement by the indentation difference between the search text and the file."""
+    want = next((_indent(l) for l in search if l.strip()), None)
+    have = next((_indent(l) for l in found if l.strip()), None)
+    if want is None or have is None or want == have:
+        return replace
+    if have.startswith(want):
+        extra = have[len(want):]
+        return [extra + l if l.strip() else l for l in replace]
+    if want.startswith(have):
+        cut = len(want) - len(have)
+        return [l[cut:] if l[:cut].strip() == "" else l.lstrip() for l in replace]
+    return replace
+
+
+def apply_blocks(original: str, blocks: List[EditBlock]) -> Tuple[Optional[str], List[str]]:
+    """
+    Apply blocks in order. Returns (new_text, []) on success or (None, failures) when any
+    block could not be located; a partial application is never returned.
+    """
+    ends_with_newline = original.endswith("\n") or not original
+    lines = original.splitlines()
+    failures: List[str] = []
+    cursor = 0
+    offset = 0  # how far earlier blocks shifted later unified-diff line hints
+
+    for number, raw in enumerate(blocks, start=1):
+        block = _trim_blank_edges(raw)
+        hint = block.hint + offset if block.hint is not None else None
+        if not block.search:
+            # Pure insertion: at the hinted line, or appended when there is no hint.
+            at = len(lines) if hint is None else max(0, min(hint, len(lines)))
+            lines[at:at] = block.replace
+            cursor = at + len(block.replace)
+            offset += len(block.replace)
+            continue
+        found = find_block(lines, block.search, cursor, hint)
+        if found is None:
+            preview = block.search[0].strip()[:60]
+            failures.append(f"Block {number}: could not find '{preview}'")
+            continue
+        start, exact = found
+        end = start + len(block.search)
+        replace = block.replace if exact else _reindent(block.replace, block.search, lines[start:end])
+        lines[start:end] = replace
+        cursor = start + len(replace)
+        offset += len(replace) - len(block.search)
+
+    if failures:
+        return None, failures
+    text = "\n".join(lines)
+    if lines and ends_with_newline:
+        text += "\n"
+    return text, []
+
+
+def apply_patch(original: str, patch: str) -> Tuple[Optional[str], List[str]]:
+    """
+    Apply `patch` (SEARCH/REPLACE blocks or unified diff hunks) to `original`.
+    Raises ValueError when the text is in neither format.
+    """
+    if looks_like_edit_blocks(patch):
+        return apply_blocks(original, parse_edit_blocks(patch))
+    if looks_like_unified_diff(patch):
+        return apply_blocks(original, parse_unified_diff(patch))
+    raise ValueError("Patch is neither SEARCH/REPLACE blocks nor a unified diff")
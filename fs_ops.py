@@ -1,17 +1,103 @@
 # fs_ops.py
+import bisect
+import codecs
+import mmap
+import os
+import stat
 from pathlib import Path
-from typing import Optional, Tuple
-import difflib
+from typing import Dict, List, Optional, Sequence, Tuple
 
-def read_file_text(path: str) -> Tuple[bool, Optional[str], Optional[str]]:
+# Files larger than this are refused before anything is read (or sent to the model).
+MAX_FILE_BYTES = int(os.getenv("AGENT_MAX_FILE_BYTES", str(1024 * 1024)))
+# Files at least this large are decoded straight from a memory map instead of read() into bytes.
+MMAP_THRESHOLD = 256 * 1024
+# Binary / encoding detection only looks at this much of the file.
+SNIFF_BYTES = 8192
+
+
+def sniff_text(prefix: bytes) -> Optional[str]:
+    """Cheap check of a file's first bytes. Returns why it is not UTF-8 text, or None if it is."""
+    if b"\x00" in prefix:
+        return "binary content (NUL bytes)"
+    try:
+        # Not final: the prefix may end in the middle of a multi-byte character.
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+    except UnicodeDecodeError as e:
+        return f"not valid UTF-8 (byte {e.start})"
+    return None
+
+
+def _decode(data: "bytes | memoryview") -> str:
+    # Same newline handling as Path.read_text.
+    text = str(data, "utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def read_file_text(path: str, max_bytes: Optional[int] = None) -> Tuple[bool, Optional[str], Optional[str]]:
+    """
+    Read a UTF-8 text file. Missing, oversized (> max_bytes, default MAX_FILE_BYTES), binary
+    and non-UTF-8 files are refused from a stat and a small prefix, without reading the rest.
+    """
     p = Path(path)
-    if not p.exists():
+    limit = MAX_FILE_BYTES if max_bytes is None else max_bytes
+    try:
+        st = p.stat()
+    except FileNotFoundError:
         return False, None, f"File not found: {path}"
+    except OSError as e:
+        return False, None, f"Failed to read {path}: {e}"
+    if not stat.S_ISREG(st.st_mode):
+        return False, None, f"Not a regular file: {path}"
+    if st.st_size > limit:
+        return False, None, f"Refusing {path}: {st.st_size} bytes exceeds the {limit}-byte limit (AGENT_MAX_FILE_BYTES)"
     try:
-        return True, p.read_text(encoding="utf-8"), None
+        with open(p, "rb") as fh:
+            problem = sniff_text(fh.read(SNIFF_BYTES))
+            if problem:
+                return False, None, f"Refusing {path}: {problem}"
+            if st.st_size < MMAP_THRESHOLD:
+                fh.seek(0)
+                return True, _decode(fh.read()), None
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return True, _decode(view), None
+    except UnicodeDecodeError as e:
+        return False, None, f"Refusing {path}: not valid UTF-8 (byte {e.start})"
     except Exception as e:
         return False, None, f"Failed to read {path}: {e}"
 
+
+class ReadCache:
+    """
+    Per-run memo of read_file_text keyed by (path, mtime, size): a file is read once per
+    prompt however many steps need it, and re-read only if it changed on disk.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Tuple[Tuple[int, int], Tuple[bool, Optional[str], Optional[str]]]] = {}
+
+    def read(self, path: str) -> Tuple[bool, Optional[str], Optional[str]]:
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(key)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            self._entries.pop(key, None)
+            return read_file_text(path, self.max_bytes)
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] == stamp:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        result = read_file_text(path, self.max_bytes)
+        self._entries[key] = (stamp, result)
+        return result
+
 def write_file_text(path: str, contents: str) -> Tuple[bool, Optional[str]]:
     p = Path(path)
     try:
@@ -21,13 +107,271 @@ def write_file_text(path: str, contents: str) -> Tuple[bool, Optional[str]]:
     except Exception as e:
         return False, f"Failed to write {path}: {e}"
 
+def write_files_atomic(files: List[Tuple[str, str]]) -> Tuple[bool, Optional[str]]:
+    """
+    Write several files as one unit: if any write fails, every file already written is
+    restored to its previous contents (or removed if it did not exist) before returning.
+    """
+    previous: List[Tuple[Path, Optional[bytes]]] = []
+    for path, contents in files:
+        p = Path(path)
+        try:
+            previous.append((p, p.read_bytes() if p.exists() else None))
+        except Exception as e:
+            return False, f"Failed to read {path} before writing: {e}"
+    for index, (path, contents) in enumerate(files):
+        ok, err = write_file_text(path, contents)
+        if ok:
+            continue
+        for p, old in previous[: index + 1]:
+            try:
+                if old is None:
+                    p.unlink(missing_ok=True)
+                else:
+                    p.write_bytes(old)
+            except Exception:
+                pass
+        return False, err
+    return True, None
+
+# --- Line diff ---------------------------------------------------------------
+# Lines are interned to ints, common prefix/suffix are trimmed, and the rest is aligned with
+# patience diff (lines unique on both sides become anchors) falling back to Myers' O(ND)
+# algorithm between anchors. A gap whose edit distance exceeds DIFF_MAX_COST is emitted as a
+# plain replacement, and a changed region larger than DIFF_MAX_LINES is only summarised.
+# Hunks are grouped and formatted exactly like difflib.unified_diff (3 lines of context).
+
+DIFF_MAX_LINES = int(os.getenv("AGENT_DIFF_MAX_LINES", "200000"))
+DIFF_MAX_COST = int(os.getenv("AGENT_DIFF_MAX_COST", "2000"))
+DIFF_CONTEXT = 3
+
+_NO_EOL = "\\ No newline at end of file\n"
+
+
+def _intern(old_lines: List[str], new_lines: List[str]) -> Tuple[List[int], List[int]]:
+    ids: Dict[str, int] = {}
+    a = [ids.setdefault(line, len(ids)) for line in old_lines]
+    b = [ids.setdefault(line, len(ids)) for line in new_lines]
+    return a, b
+
+
+def _myers(a: Sequence[int], alo: int, ahi: int, b: Sequence[int], blo: int, bhi: int, max_cost: int) -> Optional[List[Tuple[int, int]]]:
+    """Matched (i, j) pairs of a shortest edit script, or None if it costs more than max_cost."""
+    n, m = ahi - alo, bhi - blo
+    v: Dict[int, int] = {1: 0}
+    trace: List[Dict[int, int]] = []
+    for d in range(min(n + m, max_cost) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, n, m, alo, blo)
+    return None
+
+
+def _myers_backtrack(trace: List[Dict[int, int]], n: int, m: int, alo: int, blo: int) -> List[Tuple[int, int]]:
+    matches: List[Tuple[int, int]] = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            matches.append((alo + x, blo + y))
+        x, y = prev_x, prev_y
+    matches.reverse()
+    return matches
+
+
+def _longest_increasing(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Longest chain of (i, j) pairs (sorted by i) with increasing j: patience sorting."""
+    tails: List[int] = []           # j of the last pair of the best chain of each length
+    tail_index: List[int] = []
+    back: List[int] = []
+    for n, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        back.append(tail_index[pos - 1] if pos else -1)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(n)
+        else:
+            tails[pos] = j
+            tail_index[pos] = n
+    chain: List[Tuple[int, int]] = []
+    n = tail_index[-1] if tail_index else -1
+    while n >= 0:
+        chain.append(pairs[n])
+        n = back[n]
+    chain.reverse()
+    return chain
+
+
+def _diff_matches(a: List[int], b: List[int], max_cost: int) -> List[Tuple[int, int]]:
+    matches: List[Tuple[int, int]] = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+        counts: Dict[int, List[int]] = {}
+        for i in range(alo, ahi):
+            entry = counts.setdefault(a[i], [0, 0, i, 0])
+            entry[0] += 1
+        for j in range(blo, bhi):
+            entry = counts.get(b[j])
+            if entry is not None:
+                entry[1] += 1
+                entry[3] = j
+        unique = sorted((e[2], e[3]) for e in counts.values() if e[0] == 1 and e[1] == 1)
+        anchors = _longest_increasing(unique)
+        if not anchors:
+            found = _myers(a, alo, ahi, b, blo, bhi, max_cost)
+            if found:
+                matches.extend(found)
+            continue  # too expensive: leave the gap as a plain replacement
+        prev_i, prev_j = alo, blo
+        for i, j in anchors:
+            matches.append((i, j))
+            stack.append((prev_i, i, prev_j, j))
+            prev_i, prev_j = i + 1, j + 1
+        stack.append((prev_i, ahi, prev_j, bhi))
+    matches.sort()
+    return matches
+
+
+def _opcodes(matches: List[Tuple[int, int]], n: int, m: int) -> List[Tuple[str, int, int, int, int]]:
+    """difflib-style opcodes from sorted matched pairs."""
+    ops: List[Tuple[str, int, int, int, int]] = []
+    i = j = 0
+    for mi, mj in matches + [(n, m)]:
+        if i < mi and j < mj:
+            ops.append(("replace", i, mi, j, mj))
+        elif i < mi:
+            ops.append(("delete", i, mi, j, j))
+        elif j < mj:
+            ops.append(("insert", i, i, j, mj))
+        if mi == n and mj == m:
+            break
+        if ops and ops[-1][0] == "equal" and ops[-1][2] == mi:
+            tag, i1, _, j1, _ = ops.pop()
+            ops.append((tag, i1, mi + 1, j1, mj + 1))
+        else:
+            ops.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return ops or [("equal", 0, 0, 0, 0)]
+
+
+def _grouped(ops: List[Tuple[str, int, int, int, int]], n: int = DIFF_CONTEXT) -> List[List[Tuple[str, int, int, int, int]]]:
+    """Same hunk grouping as difflib.SequenceMatcher.get_grouped_opcodes."""
+    codes = list(ops)
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    nn = n + n
+    group: List[Tuple[str, int, int, int, int]] = []
+    groups = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            groups.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        groups.append(group)
+    return groups
+
+
+def _format_range(start: int, stop: int) -> str:
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return str(beginning)
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _split_lines(text: str) -> List[str]:
+    """Lines ending at "\n" only, like difflib's inputs and git; str.splitlines would also
+    break at form feeds, "\x85", "\u2028" and other separators."""
+    lines = text.split("\n")
+    tail = lines.pop()
+    out = [line + "\n" for line in lines]
+    if tail:
+        out.append(tail)
+    return out
+
+
+def _diff_line(prefix: str, line: str) -> str:
+    return prefix + line if line.endswith("\n") else prefix + line + "\n" + _NO_EOL
+
+
 def compute_unified_diff(old: str, new: str, path: str) -> str:
-    old_lines = old.splitlines(keepends=True)
-    new_lines = new.splitlines(keepends=True)
-    diff = difflib.unified_diff(
-        old_lines, new_lines,
-        fromfile=f"a/{path}",
-        tofile=f"b/{path}",
-        lineterm=""
-    )
-    return "".join(diff)
+    """
+    Unified diff of old -> new with a/ and b/ headers, in difflib.unified_diff's layout.
+    A final line without a newline is marked with "\\ No newline at end of file".
+    """
+    old_lines = _split_lines(old)
+    new_lines = _split_lines(new)
+    if old_lines == new_lines:
+        return ""
+
+    prefix = 0
+    limit = min(len(old_lines), len(new_lines))
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+    changed_old = len(old_lines) - prefix - suffix
+    changed_new = len(new_lines) - prefix - suffix
+    header = f"--- a/{path}\n+++ b/{path}\n"
+    if changed_old + changed_new > DIFF_MAX_LINES:
+        return header + (
+            f"@@ -{_format_range(prefix, prefix + changed_old)} +{_format_range(prefix, prefix + changed_new)} @@ "
+            f"diff summary: {changed_old} lines replaced by {changed_new} lines "
+            f"(over AGENT_DIFF_MAX_LINES={DIFF_MAX_LINES}, not shown)\n"
+        )
+
+    a, b = _intern(old_lines, new_lines)
+    ops = _opcodes(_diff_matches(a, b, DIFF_MAX_COST), len(a), len(b))
+    out: List[str] = [header]
+    for group in _grouped(ops):
+        first, last = group[0], group[-1]
+        out.append(f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                out.extend(_diff_line(" ", line) for line in old_lines[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                out.extend(_diff_line("-", line) for line in old_lines[i1:i2])
+            if tag in ("replace", "insert"):
+                out.extend(_diff_line("+", line) for line in new_lines[j1:j2])
+    return "".join(out)
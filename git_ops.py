@@ -1,10 +1,15 @@
 # git_ops.py
+import atexit
+import json
+import os
 import subprocess
+import threading
+import time
 from pathlib import Path
-from typing import Optional, List, Tuple
+from typing import Any, Dict, NamedTuple, Optional, List, Tuple
 
-def _run(args: List[str], cwd: Optional[str] = None) -> Tuple[int, str, str]:
-    p = subprocess.run(args, cwd=cwd, capture_output=True, text=True)
+def _run(args: List[str], cwd: Optional[str] = None, input: Optional[str] = None) -> Tuple[int, str, str]:
+    p = subprocess.run(args, cwd=cwd, capture_output=True, text=True, input=input)
     return p.returncode, p.stdout, p.stderr
 
 def ensure_repo(root: str = ".") -> None:
@@ -12,19 +17,518 @@ def ensure_repo(root: str = ".") -> None:
         code, out, err = _run(["git", "init"], cwd=root)
         if code != 0:
             raise RuntimeError(f"git init failed: {err or out}")
-        # initial commit (optional)
+        # initial commit (optional), so the first agent commit is a diff against the existing
+        # files rather than adding them wholesale; it only ever runs on `git init`.
         _run(["git", "add", "-A"], cwd=root)
         _run(["git", "commit", "-m", "chore(agent): init repo"], cwd=root)
 
-def commit_paths(paths: List[str], message: str, root: str = ".") -> None:
-    code, out, err = _run(["git", "add", *paths], cwd=root)
-    if code != 0:
-        raise RuntimeError(f"git add failed: {err or out}")
-    code, out, err = _run(["git", "commit", "-m", message], cwd=root)
-    if code != 0:
-        raise RuntimeError(f"git commit failed: {err or out}")
-
-def rollback_last(root: str = ".") -> None:
-    code, out, err = _run(["git", "reset", "--hard", "HEAD~1"], cwd=root)
-    if code != 0:
-        raise RuntimeError(f"git reset failed: {err or out}")
+
+CHECKPOINT_REFS = "refs/cherno/checkpoints/"
+
+# (mode, blob id) of a file, or None when the path does not exist.
+FileState = Optional[Tuple[str, str]]
+
+
+class Checkpoint(NamedTuple):
+    number: int
+    message: str
+    created: float
+    before: Dict[str, FileState]
+    after: Dict[str, FileState]
+
+    @property
+    def paths(self) -> List[str]:
+        return sorted(self.before)
+
+
+class _GitPipe:
+    """A long-lived git process that answers one request line at a time."""
+
+    def __init__(self, args: List[str], root: str) -> None:
+        self.args = args
+        self.root = root
+        self._proc: Optional[subprocess.Popen] = None
+
+    def request(self, line: str) -> bytes:
+        if "\n" in line:
+            raise ValueError(f"Invalid git request: {line!r}")
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                self.args, cwd=self.root, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+        try:
+            self._proc.stdin.write(line.encode("utf-8", "surrogateescape") + b"\n")
+            self._proc.stdin.flush()
+            reply = self._proc.stdout.readline()
+        except OSError as e:
+            self.close()
+            raise RuntimeError(f"{' '.join(self.args)} failed: {e}") from e
+        if not reply:
+            self.close()
+            raise RuntimeError(f"{' '.join(self.args)} exited unexpectedly")
+        return reply
+
+    def read(self, size: int) -> bytes:
+        return self._proc.stdout.read(size)
+
+    def close(self) -> None:
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self._proc.kill()
+            self._proc = None
+
+
+def _set_executable(path: str, executable: bool) -> None:
+    """Toggle only the execute bits, as git checkout does: x follows r, umask-filtered bits stay off."""
+    mode = os.stat(path).st_mode & 0o7777
+    new_mode = mode | (mode & 0o444) >> 2 if executable else mode & ~0o111
+    if new_mode != mode:
+        os.chmod(path, new_mode)
+
+
+class GitSession:
+    """
+    Commits through git plumbing, never scanning the worktree: only the touched index
+    entries are updated (`update-index`), and the commit is built with `write-tree`,
+    `commit-tree` and `update-ref`. Revisions are resolved by one long-lived
+    `git cat-file --batch-check` process instead of a `rev-parse` per lookup.
+    Commit hooks do not run on this path, as with any plumbing commit.
+
+    Agent writes are also recorded as checkpoints: refs/cherno/checkpoints/<n> points at
+    a parentless commit whose tree holds the before/after blobs of the touched paths and
+    whose message carries the manifest, so undo restores exactly those paths.
+    """
+
+    def __init__(self, root: str = ".") -> None:
+        self.root = root
+        self._lock = threading.RLock()
+        self._check = _GitPipe(["git", "cat-file", "--batch-check"], root)
+        self._cat = _GitPipe(["git", "cat-file", "--batch"], root)
+        # Checkpoints hold worktree bytes as-is (no clean/eol filters), so rollback can
+        # write blobs back verbatim.
+        self._hash = _GitPipe(["git", "hash-object", "-w", "--no-filters", "--stdin-paths"], root)
+        self.queue: Optional["CommitQueue"] = None
+
+    def resolve(self, rev: str) -> Optional[str]:
+        """Object id `rev` names (e.g. "HEAD", "HEAD^{tree}", "HEAD:path"), or None if missing."""
+        fields = self._check.request(rev).decode("utf-8", "replace").split()
+        if len(fields) != 3 or fields[-1] == "missing":
+            return None
+        return fields[0]
+
+    def read_blob(self, oid: str) -> bytes:
+        header = self._cat.request(oid).split()
+        if len(header) != 3 or header[1] != b"blob":
+            raise RuntimeError(f"git cat-file: {oid} is not a blob")
+        data = self._cat.read(int(header[2]) + 1)  # content plus the trailing LF
+        return data[:-1]
+
+    def file_state(self, path: str) -> FileState:
+        """Current (mode, blob id) of a worktree file, writing the blob to the object store."""
+        full = os.path.join(self.root, path)
+        try:
+            st = os.stat(full)
+        except FileNotFoundError:
+            return None
+        mode = "100755" if st.st_mode & 0o111 else "100644"
+        return mode, self._hash.request(os.path.abspath(full)).decode().strip()
+
+    def snapshot(self, paths: List[str]) -> Dict[str, FileState]:
+        with self._lock:
+            return {path: self.file_state(path) for path in paths}
+
+    def _ignored(self, paths: List[str]) -> List[str]:
+        # Only asked for paths new to HEAD; `git add` would refuse these too.
+        if not paths:
+            return []
+        code, out, err = _run(["git", "check-ignore", "-z", "--stdin"], cwd=self.root, input="\0".join(paths) + "\0")
+        if code not in (0, 1):
+            raise RuntimeError(f"git check-ignore failed: {err or out}")
+        return [p for p in out.split("\0") if p]
+
+    def commit(self, paths: List[str], message: str) -> str:
+        """Stage exactly `paths` (added, modified or deleted) and commit them. Returns the commit id."""
+        if not paths:
+            raise RuntimeError("git commit failed: no paths to commit")
+        with self._lock:
+            for path in paths:
+                if "\0" in path or "\n" in path:
+                    raise RuntimeError(f"git add failed: unsupported path {path!r}")
+            parent = self.resolve("HEAD")
+            new_paths = [p for p in paths if parent is None or self.resolve(f"HEAD:{p}") is None]
+            ignored = self._ignored([p for p in new_paths if os.path.lexists(os.path.join(self.root, p))])
+            if ignored:
+                raise RuntimeError(f"git add failed: paths are ignored by .gitignore: {', '.join(ignored)}")
+
+            code, out, err = _run(
+                ["git", "update-index", "--add", "--remove", "-z", "--stdin"],
+                cwd=self.root,
+                input="\0".join(paths) + "\0",
+            )
+            if code != 0:
+                raise RuntimeError(f"git add failed: {err or out}")
+            code, out, err = _run(["git", "write-tree"], cwd=self.root)
+            if code != 0:
+                raise RuntimeError(f"git write-tree failed: {err or out}")
+            tree = out.strip()
+            if parent is not None and tree == self.resolve("HEAD^{tree}"):
+                raise RuntimeError("git commit failed: nothing to commit")
+
+            args = ["git", "commit-tree", tree] + (["-p", parent] if parent else []) + ["-F", "-"]
+            code, out, err = _run(args, cwd=self.root, input=message if message.endswith("\n") else message + "\n")
+            if code != 0:
+                raise RuntimeError(f"git commit failed: {err or out}")
+            commit = out.strip()
+
+            subject = message.splitlines()[0] if message else ""
+            reflog = f"commit: {subject}" if parent else f"commit (initial): {subject}"
+            # The old value makes this a compare-and-swap against a concurrent commit.
+            old = parent or "0" * len(commit)
+            code, out, err = _run(["git", "update-ref", "-m", reflog, "HEAD", commit, old], cwd=self.root)
+            if code != 0:
+                raise RuntimeError(f"git update-ref failed: {err or out}")
+            return commit
+
+    # --- checkpoints ---
+
+    def _checkpoint_refs(self) -> List[Tuple[int, str, str]]:
+        """(number, commit id, manifest JSON) of every checkpoint, newest first."""
+        code, out, err = _run(
+            ["git", "for-each-ref", "--format=%(refname)%00%(objectname)%00%(contents:body)%00", CHECKPOINT_REFS],
+            cwd=self.root,
+        )
+        if code != 0:
+            raise RuntimeError(f"git for-each-ref failed: {err or out}")
+        found = []
+        fields = out.split("\0")
+        for i in range(0, len(fields) - 2, 3):
+            name = fields[i].strip()
+            suffix = name[len(CHECKPOINT_REFS):]
+            if name.startswith(CHECKPOINT_REFS) and suffix.isdigit():
+                found.append((int(suffix), fields[i + 1], fields[i + 2]))
+        return sorted(found, reverse=True)
+
+    def record_checkpoint(self, message: str, before: Dict[str, FileState], after: Dict[str, FileState]) -> int:
+        """Push a checkpoint for one agent write. Returns its number."""
+        with self._lock:
+            refs = self._checkpoint_refs()
+            number = refs[0][0] + 1 if refs else 1
+            entries = []
+            for i, path in enumerate(sorted(before)):
+                for prefix, state in (("b", before[path]), ("a", after.get(path))):
+                    if state is not None:
+                        entries.append(f"100644 blob {state[1]}\t{prefix}{i}\n")  # keeps the blobs reachable
+            code, out, err = _run(["git", "mktree"], cwd=self.root, input="".join(entries))
+            if code != 0:
+                raise RuntimeError(f"git mktree failed: {err or out}")
+            manifest = {
+                "created": time.time(),
+                "message": message,
+                "paths": {path: {"before": before[path], "after": after.get(path)} for path in sorted(before)},
+            }
+            body = f"cherno checkpoint {number}: {message}\n\n{json.dumps(manifest, sort_keys=True)}\n"
+            code, out, err = _run(["git", "commit-tree", out.strip(), "-F", "-"], cwd=self.root, input=body)
+            if code != 0:
+                raise RuntimeError(f"git commit-tree failed: {err or out}")
+            ref = f"{CHECKPOINT_REFS}{number}"
+            code, out2, err = _run(["git", "update-ref", ref, out.strip(), "0" * len(out.strip())], cwd=self.root)
+            if code != 0:
+                raise RuntimeError(f"git update-ref failed: {err or out2}")
+            return number
+
+    def checkpoints(self) -> List[Checkpoint]:
+        """All checkpoints, newest first."""
+        found = []
+        for number, _, body in self._checkpoint_refs():
+            try:
+                manifest = json.loads(body)
+            except ValueError:
+                continue
+            paths = manifest.get("paths", {})
+            found.append(
+                Checkpoint(
+                    number,
+                    manifest.get("message", ""),
+                    manifest.get("created", 0.0),
+                    {p: tuple(v["before"]) if v.get("before") else None for p, v in paths.items()},
+                    {p: tuple(v["after"]) if v.get("after") else None for p, v in paths.items()},
+                )
+            )
+        return found
+
+    def rollback(self, count: int = 1, force: bool = False) -> List[Checkpoint]:
+        """
+        Undo the newest `count` checkpoints by restoring the paths they touched (and nothing
+        else) from the object store, then commit the restored files and drop the refs.
+        Refuses, unless `force`, if a touched file changed after its checkpoint.
+        """
+        if count < 1:
+            raise ValueError("rollback count must be at least 1")
+        if self.queue is not None:
+            self.queue.flush()  # outside the lock: the worker needs it to commit
+        with self._lock:
+            undone = self.checkpoints()[:count]
+            if not undone:
+                raise RuntimeError("No agent checkpoints to roll back.")
+            # Walk newest to oldest, checking each step against what the newer undo leaves behind.
+            target: Dict[str, FileState] = {}
+            changed: List[str] = []
+            for checkpoint in undone:
+                for path in checkpoint.paths:
+                    current = target[path] if path in target else self.file_state(path)
+                    after = checkpoint.after.get(path)
+                    if (current and current[1]) != (after and after[1]):
+                        changed.append(path)
+                    target[path] = checkpoint.before[path]
+            if changed and not force:
+                raise RuntimeError(
+                    f"Files changed since checkpoint: {', '.join(sorted(set(changed)))} (force to overwrite)"
+                )
+            for path, state in target.items():
+                full = os.path.join(self.root, path)
+                if state is None:
+                    if os.path.lexists(full):
+                        os.unlink(full)
+                    continue
+                os.makedirs(os.path.dirname(full) or ".", exist_ok=True)
+                with open(full, "wb") as fh:
+                    fh.write(self.read_blob(state[1]))
+                _set_executable(full, state[0] == "100755")
+
+            numbers = ", ".join(str(c.number) for c in undone)
+            try:
+                self.commit(sorted(target), f"revert(agent): roll back checkpoint {numbers}")
+            except RuntimeError as e:
+                if "nothing to commit" not in str(e):
+                    raise RuntimeError(f"Files restored, but the commit failed: {e}") from e
+            finally:
+                deletes = "".join(f"delete {CHECKPOINT_REFS}{c.number}\n" for c in undone)
+                _run(["git", "update-ref", "--stdin"], cwd=self.root, input=deletes)
+            return undone
+
+    def close(self) -> None:
+        if self.queue is not None:
+            self.queue.close()
+        for pipe in (self._check, self._cat, self._hash):
+            pipe.close()
+
+
+COMMIT_POLICIES = ("per-edit", "session", "window")
+COMMIT_POLICY = os.getenv("AGENT_COMMIT_POLICY", "per-edit")
+COMMIT_WINDOW_SEC = float(os.getenv("AGENT_COMMIT_WINDOW_SEC", "30"))
+COMMIT_JOURNAL = os.path.join(".agent", "commits.jsonl")
+
+
+class PendingEdit(NamedTuple):
+    id: str
+    paths: List[str]
+    message: str
+    checkpoint: Optional[int]
+    queued: float
+
+
+class CommitQueue:
+    """
+    Commits agent edits on a background thread so a write returns as soon as the files are
+    on disk. The policy decides how edits map to commits: "per-edit" commits each one,
+    "window" squashes the edits made within `window` seconds of the first pending one, and
+    "session" squashes everything until `flush` (exit, rollback, session switch).
+
+    Every edit and every commit is appended to .agent/commits.jsonl, so the journal says
+    which edits (and checkpoints) ended up in which commit, and which never got one.
+    """
+
+    def __init__(self, session: GitSession, policy: Optional[str] = None, window: Optional[float] = None) -> None:
+        policy = policy or COMMIT_POLICY
+        if policy not in COMMIT_POLICIES:
+            raise ValueError(f"Unknown commit policy {policy!r} (expected one of {', '.join(COMMIT_POLICIES)})")
+        self.session = session
+        self.policy = policy
+        self.window = COMMIT_WINDOW_SEC if window is None else window
+        self.journal_path = os.path.join(session.root, COMMIT_JOURNAL)
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._pending: List[PendingEdit] = []
+        self._busy = False
+        self._flushing = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._failures: List[str] = []
+        self._seq = 0
+
+    def _journal(self, record: Dict[str, Any]) -> None:
+        record["ts"] = round(time.time(), 3)
+        line = json.dumps(record, sort_keys=True) + "\n"
+        with self._journal_lock:
+            try:
+                os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+                with open(self.journal_path, "a", encoding="utf-8") as fh:
+                    fh.write(line)
+            except OSError:
+                pass  # the journal is a record, never a reason to lose a commit
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending) + (1 if self._busy else 0)
+
+    def submit(self, paths: List[str], message: str, checkpoint: Optional[int] = None) -> str:
+        """Queue a commit of `paths` (already written). Returns the edit id used in the journal."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("commit queue is closed")
+            self._seq += 1
+            edit = PendingEdit(f"{int(time.time() * 1000):x}-{self._seq}", list(paths), message, checkpoint, time.monotonic())
+            self._journal({"event": "edit", "edit": edit.id, "paths": edit.paths, "message": message, "checkpoint": checkpoint})
+            self._pending.append(edit)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="cherno-commits", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return edit.id
+
+    def _take_ready(self) -> List[PendingEdit]:
+        if not self._pending:
+            return []
+        if self.policy == "per-edit":
+            return [self._pending.pop(0)]
+        due = self._flushing or self._closed
+        if self.policy == "window" and time.monotonic() - self._pending[0].queued >= self.window:
+            due = True
+        if not due:
+            return []
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    batch = self._take_ready()
+                    if batch:
+                        self._busy = True
+                        break
+                    if self._closed and not self._pending:
+                        return
+                    timeout = None
+                    if self.policy == "window" and self._pending:
+                        timeout = max(0.0, self._pending[0].queued + self.window - time.monotonic())
+                    self._cond.wait(timeout)
+            try:
+                self._commit(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _commit(self, batch: List[PendingEdit]) -> None:
+        paths: List[str] = []
+        for edit in batch:
+            paths += [p for p in edit.paths if p not in paths]
+        if len(batch) == 1:
+            message = batch[0].message
+        else:
+            lines = [f"- {e.message}" + (f" (checkpoint {e.checkpoint})" if e.checkpoint else "") for e in batch]
+            message = f"feat(agent): update {', '.join(paths)}\n\nSquashed {len(batch)} agent edits:\n" + "\n".join(lines)
+        edits = [edit.id for edit in batch]
+        try:
+            commit = commit_paths(paths, message, root=self.session.root)
+        except Exception as ex:
+            if "nothing to commit" in str(ex):
+                self._journal({"event": "commit", "commit": None, "edits": edits, "paths": paths, "note": "nothing to commit"})
+                return
+            with self._cond:
+                self._failures.append(f"{', '.join(paths)}: {ex}")
+            self._journal({"event": "commit_failed", "edits": edits, "paths": paths, "error": str(ex)})
+            return
+        self._journal({"event": "commit", "commit": commit, "edits": edits, "paths": paths, "message": message})
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Commit everything pending now and wait for it. False if `timeout` ran out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._busy:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing -= 1
+
+    def take_failures(self) -> List[str]:
+        """Commit errors since the last call (the worker has no console to report them on)."""
+        with self._cond:
+            failures, self._failures = self._failures, []
+            return failures
+
+    def close(self) -> None:
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_sessions: Dict[str, GitSession] = {}
+_sessions_lock = threading.Lock()
+
+def git_session(root: str = ".") -> GitSession:
+    """The shared GitSession for `root` (one per resolved path, closed at exit)."""
+    key = os.path.realpath(root)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = GitSession(key)
+        return session
+
+@atexit.register
+def _close_sessions() -> None:
+    for session in list(_sessions.values()):
+        session.close()  # flushes pending commits first
+
+def commit_queue(root: str = ".") -> CommitQueue:
+    """The background commit queue of `root`'s session, created on first use."""
+    session = git_session(root)
+    with _sessions_lock:
+        if session.queue is None:
+            session.queue = CommitQueue(session)
+        return session.queue
+
+def _queue_of(root: str) -> Optional[CommitQueue]:
+    session = _sessions.get(os.path.realpath(root))
+    return session.queue if session is not None else None
+
+def flush_commits(root: str = ".", timeout: Optional[float] = None) -> bool:
+    queue = _queue_of(root)
+    return queue.flush(timeout) if queue is not None else True
+
+def commit_failures(root: str = ".") -> List[str]:
+    queue = _queue_of(root)
+    return queue.take_failures() if queue is not None else []
+
+def commit_paths(paths: List[str], message: str, root: str = ".") -> str:
+    return git_session(root).commit(paths, message)
+
+def ignored_paths(paths: List[str], root: str = ".") -> List[str]:
+    """The subset of `paths` that .gitignore excludes."""
+    return git_session(root)._ignored(paths)
+
+def snapshot_paths(paths: List[str], root: str = ".") -> Dict[str, FileState]:
+    return git_session(root).snapshot(paths)
+
+def record_checkpoint(message: str, before: Dict[str, FileState], after: Dict[str, FileState], root: str = ".") -> int:
+    return git_session(root).record_checkpoint(message, before, after)
+
+def list_checkpoints(root: str = ".") -> List[Checkpoint]:
+    return git_session(root).checkpoints()
+
+def rollback_checkpoints(count: int = 1, root: str = ".", force: bool = False) -> List[Checkpoint]:
+    return git_session(root).rollback(count, force=force)
@@ -1,11 +1,24 @@
+import os
+import re
+import shlex
+from pathlib import Path
 from pydantic import BaseModel, Field, ValidationError
-from typing import List, Literal, Union, Optional, Dict, Any
+from typing import List, Literal, Union, Optional, Dict, Any, Sequence, Tuple
 
 class EditFile(BaseModel):
     type: Literal["edit_file"] = "edit_file"
     path: str = Field(..., description="Relative path in the project")
     instructions: str = Field(..., description="High level change description")
-    patch: Optional[str] = Field(None, description="Unified diff or direct replacement content")
+    patch: Optional[str] = Field(None, description="Unified diff hunks or SEARCH/REPLACE blocks (full replacement content is also accepted)")
+
+class FileEdit(BaseModel):
+    path: str = Field(..., description="Relative path in the project")
+    instructions: str = Field(..., description="What to change in this file")
+    patch: Optional[str] = None
+
+class MultiEdit(BaseModel):
+    type: Literal["multi_edit"] = "multi_edit"
+    edits: List[FileEdit] = Field(..., min_length=1, description="One entry per file to change")
 
 class CreateFile(BaseModel):
     type: Literal["create_file"] = "create_file"
@@ -18,7 +31,15 @@ class RunCommand(BaseModel):
     args: List[str] = []
 
 
-Intent = Union[EditFile, CreateFile, RunCommand]
+class SearchCode(BaseModel):
+    type: Literal["search_code"] = "search_code"
+    pattern: str = Field(..., min_length=1, description="Regular expression (or literal text) to look for")
+    literal: bool = False
+    globs: List[str] = Field(default_factory=list, description="Only search paths matching these globs")
+    max_results: int = Field(50, ge=1, le=500)
+
+
+Intent = Union[EditFile, MultiEdit, CreateFile, RunCommand, SearchCode]
 
 def intent_json_schema() -> Dict[str, Any]:
     """
@@ -35,11 +56,24 @@ def intent_json_schema() -> Dict[str, Any]:
                 "properties": {
                     "type": {
                         "type": "string",
-                        "enum": ["edit_file", "create_file", "run_command"],
+                        "enum": ["edit_file", "multi_edit", "create_file", "run_command", "search_code"],
                     },
                     "path": {"type": "string"},
                     "instructions": {"type": "string"},
                     "patch": {"type": ["string", "null"]},
+                    "edits": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "path": {"type": "string"},
+                                "instructions": {"type": "string"},
+                                "patch": {"type": ["string", "null"]},
+                            },
+                            "required": ["path", "instructions"],
+                            "additionalProperties": False,
+                        },
+                    },
                     "contents": {"type": "string"},
                     "command": {"type": "string"},
                     "args": {
@@ -47,6 +81,10 @@ def intent_json_schema() -> Dict[str, Any]:
                         "items": {"type": "string"},
                         "default": [],
                     },
+                    "pattern": {"type": "string"},
+                    "literal": {"type": "boolean"},
+                    "globs": {"type": "array", "items": {"type": "string"}},
+                    "max_results": {"type": "integer", "minimum": 1, "maximum": 500},
                 },
                 "required": ["type"],
                 "additionalProperties": False,
@@ -62,7 +100,10 @@ TOOL_DEFS = [
         "name": "emit_intent",
         "description": (
             "Return exactly one structured intent representing the user's request. "
-            "Prefer one of: edit_file, create_file, run_command."
+            "Prefer one of: edit_file, multi_edit, create_file, run_command, search_code. "
+            "Use multi_edit when one change spans several existing files. "
+            "Use search_code (regex or literal pattern, optional path globs) to find where code lives "
+            "before editing it; its matches are shown in the next turn."
         ),
         "parameters": intent_json_schema(),
         "strict": False,
@@ -76,13 +117,129 @@ def parse_intent(obj: dict) -> Intent:
     try:
         if t == "edit_file":
             return EditFile(**obj)
+        if t == "multi_edit":
+            return MultiEdit(**obj)
         if t == "create_file":
             return CreateFile(**obj)
         if t == "run_command":
             return RunCommand(**obj)
+        if t == "search_code":
+            return SearchCode(**obj)
     except ValidationError as ve:
         raise ValueError(str(ve)) from ve
     raise ValueError(f"Unknown or missing intent type: {t}")
 
 
+# --- Local fast path -------------------------------------------------------
+# Prompts such as "run pytest -q" or "create file notes.txt with contents 'hi'" are
+# unambiguous; they are turned into intents here without a model round trip. Anything
+# that scores below the threshold goes to the model as usual.
+
+LOCAL_INTENT_THRESHOLD = float(os.getenv("AGENT_LOCAL_INTENT_THRESHOLD", "0.9"))
+
+_RUN_PATTERN = re.compile(r"^(?:please\s+)?(?:run|execute|exec)\s+(?P<cmd>.+?)\s*!?$", re.IGNORECASE | re.DOTALL)
+_CREATE_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:create|add|make|write)\s+(?:a\s+)?(?:new\s+)?file\s+(?:named\s+|called\s+)?"
+    r"(?P<path>[`'\"]?[\w./\\-]+[`'\"]?)\s+with\s+(?:the\s+)?(?:contents?|text)\s*:?\s*(?P<contents>.+)$",
+    re.IGNORECASE | re.DOTALL,
+)
+# Words that turn a "run ..." prompt into something the model should interpret.
+_COMPOUND_WORDS = {"and", "then", "after", "before", "if", "unless", "until", "fix", "so", "while"}
+# Subcommands of allowlisted tools, accepted as arguments of an unquoted "run ..." prompt.
+_SUBCOMMANDS = {
+    "add", "build", "check", "ci", "dev", "format", "freeze", "init", "install", "lint", "list",
+    "lock", "pip", "remove", "run", "show", "start", "sync", "test", "uninstall", "venv",
+}
+# A bare word: English rather than a flag, path, module, test id or version pin.
+_PLAIN_WORD = re.compile(r"^[A-Za-z]+$")
+# Unquoted contents that read like a description rather than literal text.
+_DESCRIPTIVE_WORDS = {"that", "which", "function", "class", "script", "program", "implement", "implements", "returns", "generates"}
+
+
+def _unquote(text: str) -> Tuple[str, bool]:
+    text = text.strip()
+    if text.startswith("```") and text.endswith("```") and len(text) >= 6:
+        body = text[3:-3]
+        first, _, rest = body.partition("\n")
+        # Drop a language tag on the opening fence.
+        return (rest if first.strip().isidentifier() or not first.strip() else body), True
+    for quote in ("`", '"', "'"):
+        if len(text) >= 2 and text[0] == quote and text[-1] == quote:
+            return text[1:-1], True
+    return text, False
+
+
+def _local_run_command(prompt: str, allowlist: Sequence[str]) -> Optional[Tuple[Dict[str, Any], float]]:
+    match = _RUN_PATTERN.match(prompt)
+    if not match:
+        return None
+    raw, quoted = _unquote(match.group("cmd"))
+    try:
+        tokens = shlex.split(raw)
+    except ValueError:
+        return None
+    if not tokens:
+        return None
+    if not quoted and len(tokens[-1]) > 1 and tokens[-1].endswith(".") and not tokens[-1].endswith(".."):
+        tokens[-1] = tokens[-1][:-1]  # sentence full stop, not a "." argument
+    allowed = {Path(name).name for name in allowlist}
+    if Path(tokens[0]).name not in allowed:
+        return None
+    confidence = 0.97 if quoted else 0.93
+    if not quoted:
+        args = tokens[1:]
+        # A bare word right after a flag is taken as the flag's value ("-k resolve").
+        words = [
+            token.lower()
+            for i, token in enumerate(args)
+            if _PLAIN_WORD.match(token) and not (i > 0 and args[i - 1].startswith("-") and "=" not in args[i - 1])
+        ]
+        if _COMPOUND_WORDS.intersection(words):
+            confidence = 0.5
+        elif any(word not in _SUBCOMMANDS for word in words):
+            # "run pytest on the planner tests": prose the model should turn into arguments.
+            confidence = 0.6
+    return {"type": "run_command", "command": tokens[0], "args": tokens[1:]}, confidence
+
+
+def _local_create_file(prompt: str) -> Optional[Tuple[Dict[str, Any], float]]:
+    match = _CREATE_PATTERN.match(prompt.strip())
+    if not match:
+        return None
+    path, _ = _unquote(match.group("path"))
+    contents, quoted = _unquote(match.group("contents"))
+    if not path or not contents:
+        return None
+    confidence = 0.95 if quoted else 0.9
+    if not quoted and _DESCRIPTIVE_WORDS.intersection(re.findall(r"[a-z]+", contents.lower())):
+        confidence = 0.6
+    if not contents.endswith("\n"):
+        contents += "\n"
+    return {"type": "create_file", "path": path, "contents": contents}, confidence
+
+
+def parse_local_intent(
+    prompt: str,
+    allowlist: Optional[Sequence[str]] = None,
+    threshold: float = LOCAL_INTENT_THRESHOLD,
+) -> Optional[Tuple[Intent, float]]:
+    """
+    Recognise high-confidence prompts without the model. Returns (intent, confidence) when a
+    pattern matches with confidence >= threshold, else None. Commands are only recognised
+    when their binary is in `allowlist` (default: executor.DEFAULT_POLICY).
+    """
+    if allowlist is None:
+        from executor import DEFAULT_POLICY
 
+        allowlist = DEFAULT_POLICY["allowlist"]
+    for candidate in (_local_run_command(prompt, allowlist), _local_create_file(prompt)):
+        if candidate is None:
+            continue
+        obj, confidence = candidate
+        if confidence < threshold:
+            continue
+        try:
+            return parse_intent(obj), confidence
+        except ValueError:
+            continue
+    return None
@@ -1,8 +1,475 @@
+import json
 import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, Mapping, NamedTuple, Optional, Set
+
 from dotenv import load_dotenv
-from openai import OpenAI
 
 load_dotenv()
 
-client = OpenAI()
-MODEL = os.getenv("MODEL", "gpt-5-codex")
\ No newline at end of file
+MODEL = os.getenv("MODEL", "gpt-5-codex")
+
+# Sent with every request so the provider routes calls that share a prompt prefix to the same cache.
+PROMPT_CACHE_KEY = os.getenv("AGENT_PROMPT_CACHE_KEY", "cherno")
+
+USAGE_LOG = Path(".agent/usage.jsonl")
+
+_client: Optional[Any] = None
+_client_lock = threading.Lock()
+
+# Rough chars-per-token ratio for English text and code; good enough for budgets and reports.
+CHARS_PER_TOKEN = 4
+
+
+def get_client() -> Any:
+    """Return the shared OpenAI client, building it (and importing openai) on first use."""
+    global _client
+    with _client_lock:  # synthesis threads may race to build it
+        if _client is None:
+            from openai import OpenAI
+
+            # Retries are owned by the RequestScheduler below, not the SDK.
+            _client = OpenAI(max_retries=0)
+    return _client
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+class UsageTracker:
+    """
+    Records token usage per model call, including the prompt-cache `cached_tokens` the
+    Responses API reports, to .agent/usage.jsonl and to in-process totals.
+    """
+
+    def __init__(self, log_path: Optional[Path] = USAGE_LOG) -> None:
+        self.log_path = log_path
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, usage: Any, model: str = MODEL) -> Optional[Dict[str, Any]]:
+        if usage is None:
+            return None
+        input_tokens = int(_field(usage, "input_tokens") or 0)
+        cached_tokens = int(_field(_field(usage, "input_tokens_details"), "cached_tokens") or 0)
+        output_tokens = int(_field(usage, "output_tokens") or 0)
+        entry = {
+            "ts": round(time.time(), 3),
+            "stage": stage,
+            "model": model,
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+        }
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+            if self.log_path is not None:
+                try:
+                    self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                    with self.log_path.open("a", encoding="utf-8") as fh:
+                        fh.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                except OSError:
+                    pass
+        return entry
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "cached_tokens": self.cached_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_hit_rate": (self.cached_tokens / self.input_tokens) if self.input_tokens else 0.0,
+            }
+
+
+usage_tracker = UsageTracker()
+
+
+def record_usage(stage: str, usage: Any) -> Optional[Dict[str, Any]]:
+    return usage_tracker.record(stage, usage)
+
+
+# --- Request scheduling ------------------------------------------------------
+# Every model call goes through one RequestScheduler: it enforces the per-run deadline,
+# retries throttled and failed calls with jittered exponential backoff (honouring
+# Retry-After), paces requests with a token bucket fed by the x-ratelimit-* headers, and
+# lets another thread cancel the run (the daemon does when its client goes away).
+
+RUN_DEADLINE_SEC = float(os.getenv("AGENT_LLM_DEADLINE_SEC", "300"))
+MAX_RETRIES = int(os.getenv("AGENT_LLM_MAX_RETRIES", "5"))
+MAX_CONCURRENCY = int(os.getenv("AGENT_LLM_MAX_CONCURRENCY", "4"))
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_MAX_SEC = 30.0
+# Call records kept for stats(); they are reset per run, this only bounds a runaway run.
+MAX_CALL_RECORDS = 1000
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class RunCancelled(RuntimeError):
+    """Raised for model calls started after the current run was cancelled."""
+
+
+class CallRecord(NamedTuple):
+    stage: str
+    latency: float  # seconds, including retries and waits
+    retries: int
+    status: str     # "ok" or the final error type
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse rate-limit reset values such as "20ms", "1s" or "6m0s" (plain numbers are seconds)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    if not headers:
+        return None
+    millis = headers.get("retry-after-ms")
+    if millis:
+        try:
+            return float(millis) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RateLimiter:
+    """
+    Token bucket plus an in-flight cap. Tokens refill at the provider's request rate; the
+    x-ratelimit-remaining/reset headers of every response resynchronise the bucket, and a
+    nearly exhausted quota lowers how many calls may be in flight at once.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        rate: float = 0.0,  # tokens per second; 0 means unlimited until headers say otherwise
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.rate = rate
+        self.capacity = float(self.max_concurrency)
+        self.tokens = self.capacity
+        self.in_flight = 0
+        self._clock = clock
+        self._updated = clock()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        if self.rate <= 0:
+            self.tokens = self.capacity
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """Block until a call may start; returns the seconds spent waiting."""
+        started = self._clock()
+        with self._cond:
+            while True:
+                now = self._clock()
+                self._refill(now)
+                if self.in_flight < self.concurrency and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return now - started
+                if self.in_flight < self.concurrency and self.rate > 0:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = 0.05  # woken by release()
+                if deadline is not None:
+                    if now >= deadline:
+                        raise DeadlineExceeded("Run deadline reached while waiting for the rate limiter")
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify_all()
+
+    def update(self, headers: Optional[Mapping[str, str]]) -> None:
+        if not headers:
+            return
+        try:
+            limit = int(headers.get("x-ratelimit-limit-requests") or 0)
+            remaining = int(headers.get("x-ratelimit-remaining-requests") or -1)
+        except ValueError:
+            return
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        with self._cond:
+            self._refill(self._clock())
+            if limit > 0:
+                self.rate = limit / 60.0  # request limits are per minute
+            if remaining >= 0:
+                self.tokens = min(self.tokens, float(remaining))
+                self.concurrency = max(1, min(self.max_concurrency, remaining))
+                if remaining == 0 and reset:
+                    # Nothing left until the window resets: pay the whole wait up front.
+                    self.rate = 1.0 / reset
+            self._cond.notify_all()
+
+
+def _status_and_headers(exc: BaseException) -> "tuple[Optional[int], Optional[Mapping[str, str]]]":
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    return status, getattr(response, "headers", None)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    status, _ = _status_and_headers(exc)
+    if status is not None:
+        return int(status) in RETRYABLE_STATUS
+    try:
+        from openai import APIConnectionError  # includes APITimeoutError
+    except ImportError:  # pragma: no cover
+        return isinstance(exc, (TimeoutError, ConnectionError))
+    return isinstance(exc, (APIConnectionError, TimeoutError, ConnectionError))
+
+
+class _HeldStream:
+    """
+    A streamed response that keeps its rate-limiter slot while tokens arrive. The slot is
+    freed once, when the stream is closed or fully consumed.
+    """
+
+    def __init__(self, stream: Any, release: Callable[[], None]) -> None:
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            release, self._release = self._release, None
+        try:
+            self._stream.close()
+        finally:
+            if release is not None:
+                release()
+
+    def __enter__(self) -> "_HeldStream":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = MAX_RETRIES,
+        deadline_sec: float = RUN_DEADLINE_SEC,
+        backoff_base: float = BACKOFF_BASE_SEC,
+        backoff_max: float = BACKOFF_MAX_SEC,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.limiter = limiter or RateLimiter(clock=clock)
+        self.max_retries = max_retries
+        self.deadline_sec = deadline_sec
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self._clock = clock
+        self.deadline: Optional[float] = None
+        self.records: Deque[CallRecord] = deque(maxlen=MAX_CALL_RECORDS)
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._streams: Set[_HeldStream] = set()
+
+    def start_run(self, deadline_sec: Optional[float] = None) -> None:
+        """
+        Start the deadline for one prompt; every call until the next start_run shares it.
+        The call records behind stats() start over too, so they describe this run only,
+        and a cancellation of the previous run is lifted.
+        """
+        budget = self.deadline_sec if deadline_sec is None else deadline_sec
+        self.deadline = self._clock() + budget if budget and budget > 0 else None
+        self._cancelled.clear()
+        with self._lock:
+            self.records.clear()
+
+    def cancel(self) -> None:
+        """
+        Stop the current run from any thread: open streams are closed, which ends generation
+        (and billing) server-side, and calls started afterwards raise RunCancelled.
+        """
+        self._cancelled.set()
+        with self._lock:
+            streams = list(self._streams)
+        for stream in streams:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - self._clock()
+
+    def backoff(self, attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+        hinted = retry_after(headers)
+        if hinted is not None:
+            return hinted + random.uniform(0, self.backoff_base / 2)
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def create(self, stage: str, client: Optional[Any] = None, **kwargs: Any) -> Any:
+        """
+        `client.responses.create(**kwargs)` under the scheduler's deadline, retry and rate
+        policies. Non-streaming usage is recorded with `stage`; streamed usage is recorded
+        by the caller once the stream completes. A stream holds its concurrency slot until
+        the caller closes it (or reads it to the end).
+        """
+        client = client if client is not None else get_client()
+        responses = client.responses
+        raw_create = getattr(getattr(responses, "with_raw_response", None), "create", None)
+        started = self._clock()
+        attempt = 0
+        while True:
+            if self._cancelled.is_set():
+                self._record(stage, started, attempt, "RunCancelled")
+                raise RunCancelled(f"Run cancelled before the {stage} call")
+            remaining = self.remaining()
+            if remaining is not None and remaining <= 0:
+                self._record(stage, started, attempt, "DeadlineExceeded")
+                raise DeadlineExceeded(f"Run deadline of {self.deadline_sec:.0f}s exceeded before the {stage} call")
+            call_kwargs = dict(kwargs)
+            if remaining is not None:
+                call_kwargs["timeout"] = remaining
+            self.limiter.acquire(self.deadline)
+            held = False
+            try:
+                if raw_create is not None:
+                    raw = raw_create(**call_kwargs)
+                    self.limiter.update(raw.headers)
+                    resp = raw.parse()
+                else:
+                    resp = responses.create(**call_kwargs)
+                if kwargs.get("stream"):
+                    resp = self._hold(resp)
+                    held = True
+            except Exception as exc:
+                status, headers = _status_and_headers(exc)
+                self.limiter.update(headers)
+                if attempt >= self.max_retries or not _is_retryable(exc):
+                    self._record(stage, started, attempt, type(exc).__name__)
+                    raise
+                delay = self.backoff(attempt, headers)
+                remaining = self.remaining()
+                if remaining is not None and delay >= remaining:
+                    self._record(stage, started, attempt, "DeadlineExceeded")
+                    raise DeadlineExceeded(
+                        f"Run deadline exceeded while retrying the {stage} call (last error: {status or type(exc).__name__})"
+                    ) from exc
+                attempt += 1
+                self._sleep(delay)
+                continue
+            finally:
+                if not held:
+                    self.limiter.release()
+            if held and self._cancelled.is_set():
+                resp.close()  # cancelled while the request was being made
+                self._record(stage, started, attempt, "RunCancelled")
+                raise RunCancelled(f"Run cancelled during the {stage} call")
+            self._record(stage, started, attempt, "ok")
+            if not kwargs.get("stream"):
+                record_usage(stage, getattr(resp, "usage", None))
+            return resp
+
+    def _hold(self, raw: Any) -> _HeldStream:
+        stream = _HeldStream(raw, lambda: self._drop(stream))
+        with self._lock:
+            self._streams.add(stream)
+        return stream
+
+    def _drop(self, stream: _HeldStream) -> None:
+        with self._lock:
+            self._streams.discard(stream)
+        self.limiter.release()
+
+    def _record(self, stage: str, started: float, retries: int, status: str) -> None:
+        with self._lock:
+            self.records.append(CallRecord(stage, self._clock() - started, retries, status))
+
+    def stats(self) -> Dict[str, Any]:
+        """Call figures since the last start_run."""
+        with self._lock:
+            records = list(self.records)
+        latencies = sorted(r.latency for r in records)
+        return {
+            "calls": len(records),
+            "retries": sum(r.retries for r in records),
+            "failures": sum(1 for r in records if r.status != "ok"),
+            "p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+            "max_latency": latencies[-1] if latencies else 0.0,
+        }
+
+
+scheduler = RequestScheduler()
@@ -1,29 +1,57 @@
 # main.py
+import argparse
 import sys
 import json
+import os
+import time
 from contextlib import contextmanager
-from typing import Any, Dict, List, Optional, Tuple
-from sandbox import make_sandbox
-from llm import client, MODEL
-from intents import TOOL_DEFS, parse_intent
-from memory import load_memory, save_memory
-from planner import plan_from_intent
-from fs_ops import read_file_text, write_file_text, compute_unified_diff
-from patcher import synthesize_new_contents
-from git_ops import ensure_repo, commit_paths, rollback_last
-from rich.console import Console
-from rich.json import JSON as RichJSON
-from command_safety import analyze_command, dry_run_required
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Everything heavier than the stdlib (openai, pydantic, rich) and every pipeline stage is
+# imported where it is first needed, so `--rollback`, `--stop-daemon` and the thin daemon
+# client start without loading the whole dependency tree. `--startup-profile` shows the cost.
+if TYPE_CHECKING:
+    from memory import Turn
+    from sandbox import Sandbox
 
 SYSTEM_PROMPT = (
     "You are a coding agent that ONLY returns a single structured intent "
     "by calling the tool function emit_intent. Do not explain. "
-    "Infer file paths when reasonable. If multiple steps are needed, choose the first, "
-    "most atomic intent to begin progress."
+    "Infer file paths when reasonable. Use multi_edit when one change touches several "
+    "existing files. Use search_code to find code you have not seen yet. "
+    "If multiple steps are needed, choose the first, most atomic intent "
+    "to begin progress."
 )
 
 
-console = Console()
+class _LazyConsole:
+    """Stands in for rich's Console until something is actually printed through it."""
+
+    def __init__(self) -> None:
+        self._console = None
+
+    def resolve(self) -> Any:
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console()
+        return self._console
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
+
+
+console = _LazyConsole()
+
+# How much of the live diff stays on screen while a synthesis streams.
+LIVE_DIFF_LINES = 30
+# Seconds between plain progress lines when streaming without a terminal.
+PLAIN_PROGRESS_SEC = 1.0
+
+# Upper bound on concurrent synthesis requests for a multi_edit intent.
+MULTI_EDIT_WORKERS = int(os.getenv("AGENT_MULTI_EDIT_WORKERS", "4"))
 
 
 def print_rule(title: str) -> None:
@@ -55,11 +83,26 @@ def wrap_text(role: str, text: str) -> Dict[str, Any]:
     return {"role": role, "content": [{"type": content_type, "text": text}]}
 
 
-def build_response_messages(system_prompt: str, turns: List[Dict[str, str]], user_prompt: str) -> List[Dict[str, Any]]:
+def build_response_messages(
+    system_prompt: str,
+    turns: List[Dict[str, str]],
+    user_prompt: str,
+    tail_context: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    """
+    Lay the request out for provider prompt caching: system prompt, then the stored history
+    (append-only between memory trims, so each request starts with the previous one byte for
+    byte), then everything volatile. Per-prompt context goes into the final user message only.
+    """
     msgs: List[Dict[str, Any]] = [wrap_text("system", system_prompt)]
     for turn in turns:
-        msgs.append(wrap_text(turn["role"], turn["content"]))
-    msgs.append(wrap_text("user", user_prompt))
+        # The rolling summary of compacted turns is replayed as context from the user side.
+        role = "user" if turn["role"] == "summary" else turn["role"]
+        msgs.append(wrap_text(role, turn["content"]))
+    final = wrap_text("user", user_prompt)
+    if tail_context:
+        final["content"] = [{"type": "input_text", "text": text} for text in tail_context] + final["content"]
+    msgs.append(final)
     return msgs
 
 
@@ -71,12 +114,17 @@ def truncate_text(text: str, limit: int = 500) -> str:
 
 
 def build_assistant_summary(intent: Any, plan: List[Dict[str, Any]], actions: List[Dict[str, Any]]) -> str:
-    payload = {
+    from memory import compact_payload
+
+    # File contents, patches and command output are stored as digests, not verbatim:
+    # the model can always re-read a file, and memory is re-sent with every prompt.
+    payload = compact_payload({
         "intent": intent.model_dump(),
         "plan": plan,
         "actions": actions,
-    }
-    return json.dumps(payload, indent=2, ensure_ascii=False)
+    })
+    # Compact, key-sorted JSON: identical actions always serialise to identical bytes.
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
 
 
 def extract_tool_result(resp: Any) -> Dict[str, Any]:
@@ -130,275 +178,983 @@ def extract_tool_result(resp: Any) -> Dict[str, Any]:
     raise ValueError("No tool output for emit_intent found in response")
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <your natural language request>")
-        sys.exit(1)
+@dataclass
+class RunState:
+    """Per-prompt scratch state; everything long-lived belongs on the Engine."""
 
-    user_prompt = " ".join(sys.argv[1:])
-    turns = load_memory()
+    confirm_needed: bool = False
+    pending_writes: List[Tuple[str, str]] = field(default_factory=list)  # (path, contents), written together
+    synthesized_cache: Dict[str, Any] = field(default_factory=dict)  # path -> synthesized new contents (for show_diff/write_file)
+    session_actions: List[Dict[str, Any]] = field(default_factory=list)
+    stream: bool = False
+    cache: Optional[Any] = None  # DiskCache, or None when bypassed with --no-cache
+    reads: Optional[Any] = None  # fs_ops.ReadCache: each file is read at most once per prompt
 
-    print_rule("Intent Parsing (Step 1)")
-    print_panel(user_prompt, "Your Prompt")
 
-    # Build messages (system + prior user/assistant turns + new user prompt)
-    response_msgs = build_response_messages(SYSTEM_PROMPT, turns, user_prompt)
+class Engine:
+    """
+    Reusable pipeline object. The REPL keeps one alive so the OpenAI client (and its
+    connection pool), the sandbox and the loaded memory carry over between prompts.
+    """
 
-    with print_status("Asking Codex to produce a structured intent..."):
-        resp = client.responses.create(
-            model=MODEL,
-            input=response_msgs,
-            tools=TOOL_DEFS,
-            tool_choice={"type": "function", "name": "emit_intent"},
-        )
+    def __init__(self, ask: Callable[[str], str] = input, root: str = ".", session: Optional[str] = None) -> None:
+        from cache import DiskCache
+        from llm import MODEL
+        from memory import DEFAULT_SESSION, SessionLog
+
+        self.ask = ask
+        self.root = root
+        self.model = MODEL
+        # Runs without an explicit session use this one, so a shared daemon engine never
+        # leaves one client's session selected for the next.
+        self.default_session = session or DEFAULT_SESSION
+        self.session = SessionLog(self.default_session)
+        self.turns: List["Turn"] = self.session.load()
+        self.cache = DiskCache()
+        self._client: Optional[Any] = None
+        self._sandbox: Optional["Sandbox"] = None
+        self._workspace: Optional[Any] = None
+        self._symbols: Optional[Any] = None
+        self._workspace_fresh = False
+        self._symbols_fresh = False
+        self._repo_ready = False
+
+    @property
+    def client(self) -> Any:
+        # Importing openai and building the client is the single biggest start-up cost.
+        if self._client is None:
+            from llm import get_client
+
+            self._client = get_client()
+        return self._client
+
+    @client.setter
+    def client(self, value: Any) -> None:
+        self._client = value
+
+    @property
+    def sandbox(self) -> "Sandbox":
+        # Created on first use so intent-only and edit-only prompts never pay for it.
+        if self._sandbox is None:
+            from sandbox import make_sandbox
+
+            self._sandbox = make_sandbox(workspace=self.workspace)
+        return self._sandbox
+
+    @property
+    def workspace(self) -> Any:
+        # The index persists under .agent/index/; fresh_workspace() refreshes it at most once per prompt.
+        if self._workspace is None:
+            from workspace import WorkspaceIndex
+
+            self._workspace = WorkspaceIndex(self.root)
+        return self._workspace
+
+    @property
+    def symbols(self) -> Any:
+        if self._symbols is None:
+            from symbols import SymbolIndex
+
+            self._symbols = SymbolIndex(self.workspace)
+        return self._symbols
+
+    def fresh_workspace(self) -> Any:
+        """
+        The workspace index, refreshed the first time a run asks for it. Prompts that never
+        look at the index (local intents, plain commands) skip the whole-tree scan.
+        """
+        if not self._workspace_fresh:
+            self._workspace_fresh = True
+            try:
+                self.workspace.refresh()
+            except OSError as e:
+                console.print(f"[yellow]Workspace index not refreshed: {e}[/yellow]")
+        return self.workspace
+
+    def fresh_symbols(self) -> Any:
+        """The symbol index, brought up to date (with the file index) on first use in a run."""
+        if not self._symbols_fresh:
+            self.fresh_workspace()
+            self._symbols_fresh = True
+            try:
+                self.symbols.refresh()  # parses only files whose content hash is new
+            except OSError as e:
+                console.print(f"[yellow]Symbol index not refreshed: {e}[/yellow]")
+        return self.symbols
+
+    def use_session(self, name: str) -> None:
+        """Switch to another named session log, loading its history."""
+        from memory import SessionLog
+
+        if name != self.session.name:
+            self.flush_commits()  # the session policy squashes per conversation session
+            self.session = SessionLog(name)
+            self.turns = self.session.load()
+
+    def prepare(self) -> None:
+        """Do the one-time setup a prompt needs before the first model call."""
+        if not self._repo_ready:
+            from git_ops import ensure_repo
+
+            ensure_repo(self.root)  # init git if needed
+            self._repo_ready = True
+
+    def close(self) -> None:
+        self.session.wait()
+        self.flush_commits()
+        if self._sandbox is not None:
+            try:
+                self._sandbox.close()
+            except Exception:
+                pass
+            self._sandbox = None
+
+    def cancel(self) -> None:
+        """
+        Abort the run in progress from another thread (the daemon, when its client cancels
+        or disconnects): a streaming synthesis is closed and no further model call starts.
+        """
+        from llm import scheduler
+
+        scheduler.cancel()
+
+    def request_intent(self, response_msgs: List[Dict[str, Any]]) -> Any:
+        from intents import TOOL_DEFS
+        from llm import PROMPT_CACHE_KEY, scheduler
+
+        with print_status("Asking Codex to produce a structured intent..."):
+            return scheduler.create(
+                "intent",
+                client=self.client,
+                model=self.model,
+                input=response_msgs,
+                tools=TOOL_DEFS,
+                tool_choice={"type": "function", "name": "emit_intent"},
+                prompt_cache_key=PROMPT_CACHE_KEY,
+            )
+
+    def resolve_intent(self, user_prompt: str, state: RunState, debug: bool, local_intents: bool = True) -> Optional[Any]:
+        """
+        Turn the prompt into a validated intent: the local fast path for obvious commands,
+        then the result cache, then the model. Returns None if the model's answer is unusable.
+        """
+        from cache import cache_key
+        from intents import TOOL_DEFS, parse_intent, parse_local_intent
+
+        if local_intents:
+            from executor import load_policy
+
+            local = parse_local_intent(user_prompt, load_policy().get("allowlist", []))
+            if local is not None:
+                intent, confidence = local
+                console.print(f"[dim]Intent parsed locally (confidence {confidence:.2f}); model call skipped.[/dim]")
+                if debug:
+                    print_rule("Raw Response")
+                    print(f"local intent (confidence {confidence:.2f})")
+                    print_json(intent.model_dump())
+                return intent
+
+        # Build messages (system + prior user/assistant turns + new user prompt)
+        # Older exchanges relevant to this prompt ride at the tail, after the cached prefix.
+        context = self.session.relevant_context(user_prompt, self.turns)
+        if debug and context:
+            print_panel(context[0], "Retrieved Context")
+        candidates = self.fresh_workspace().candidates_for(user_prompt)
+        if candidates:
+            context = context + ["Workspace files that may be relevant:\n" + "\n".join(candidates)]
+        repo_map = self.fresh_symbols().repo_map(focus=candidates)
+        if repo_map:
+            context = context + ["Repository map (Python symbols, line spans in brackets):\n" + repo_map]
+        response_msgs = build_response_messages(SYSTEM_PROMPT, self.turns, user_prompt, tail_context=context)
+        key = None
+        payload = None
+        resp = None
+        if state.cache is not None:
+            # Keyed on the stable prefix, the prompt and the candidate files, not on history or
+            # retrieval: those change after every turn, so a repeated prompt would never hit.
+            key = cache_key("intent", self.model, SYSTEM_PROMPT, TOOL_DEFS, user_prompt, candidates)
+            payload = state.cache.get(key)
+        if payload is not None:
+            console.print("[dim]Intent served from cache (--no-cache to bypass).[/dim]")
+        else:
+            try:
+                resp = self.request_intent(response_msgs)
+            except Exception as e:
+                print("Intent request failed")
+                print(str(e))
+                return None
+            if debug:
+                print_rule("Raw Response")
+                print_raw_response(resp)
 
-    try:
-        payload = extract_tool_result(resp)
-        intent_obj = payload.get("intent")
-        if intent_obj is None:
-            raise ValueError("emit_intent returned no 'intent' field")
-        intent = parse_intent(intent_obj)
-    except Exception as e:
-        print("Failed to parse intent")
-        print(str(e))
-        # For debugging, print raw response compactly:
         try:
-            raw = resp.to_dict() if hasattr(resp, "to_dict") else resp
-            print(json.dumps(raw, indent=2)[:4000])
-        except Exception:
-            pass
-        sys.exit(2)
+            if payload is None:
+                payload = extract_tool_result(resp)
+            intent_obj = payload.get("intent")
+            if intent_obj is None:
+                raise ValueError("emit_intent returned no 'intent' field")
+            intent = parse_intent(intent_obj)
+        except Exception as e:
+            print("Failed to parse intent")
+            print(str(e))
+            # For debugging, print raw response compactly:
+            if resp is not None and not debug:
+                print_raw_response(resp)
+            return None
+        if key is not None and resp is not None:
+            state.cache.put(key, payload)
+        return intent
+
+    def run(
+        self,
+        user_prompt: str,
+        dry_run: bool = False,
+        debug: bool = False,
+        stream: bool = False,
+        use_cache: bool = True,
+        local_intents: bool = True,
+        session: Optional[str] = None,
+    ) -> int:
+        """Run one prompt through intent parsing, planning and execution. Returns an exit code."""
+        from fs_ops import ReadCache
+        from llm import scheduler
+        from planner import plan_from_intent
+        from rich.json import JSON as RichJSON
 
-    print_rule("Parsed Intent")
-    print_json(intent.model_dump())
+        scheduler.start_run()  # first, so a cancel() during the set-up below is kept
+        self.prepare()
+        self.use_session(session or self.default_session)
+        self.report_commit_failures()
+        self._workspace_fresh = self._symbols_fresh = False  # refreshed on first use this run
+        state = RunState(stream=stream, cache=self.cache if use_cache else None, reads=ReadCache())
 
-    print("\nStep 1 complete: parsed intent printed above (no execution performed).")
+        print_rule("Intent Parsing (Step 1)")
+        print_panel(user_prompt, "Your Prompt")
 
-    # --- Step 3: Plan + Patch Synthesis + Git + Executor ---
-    intent_dict = intent.model_dump()
-    plan = plan_from_intent(intent_dict)
+        intent = self.resolve_intent(user_prompt, state, debug, local_intents)
+        if intent is None:
+            return 2
 
-    console.rule("[bold cyan]Plan[/bold cyan]")
-    console.print(RichJSON(json.dumps(plan, indent=2)))
-    sandbox = make_sandbox()
+        print_rule("Parsed Intent")
+        print_json(intent.model_dump())
 
-    ensure_repo(".")  # init git if needed
+        print("\nStep 1 complete: parsed intent printed above (no execution performed).")
 
-    confirm_needed = False
-    pending_write: Optional[Tuple[str, str]] = None  # (path, contents)
-    synthesized_cache = {}  # path -> synthesized new contents (for show_diff/write_file)
-    session_actions: List[Dict[str, Any]] = []
+        # --- Step 3: Plan + Patch Synthesis + Git + Executor ---
+        intent_dict = intent.model_dump()
+        # The planner only consults the index for a target that does not exist.
+        plan = plan_from_intent(intent_dict, resolve_path=lambda query: self.fresh_workspace().resolve(query))
+        for step in plan:
+            if step.get("resolved_from"):
+                console.print(f"[yellow][plan][/yellow] '{step['resolved_from']}' not found; using {step['path']}")
 
-    for step in plan:
-        kind = step["kind"]
+        console.rule("[bold cyan]Plan[/bold cyan]")
+        console.print(RichJSON(json.dumps(plan, indent=2)))
 
-        if kind == "read_file":
-            ok, text, err = read_file_text(step["path"])
-            if not ok:
-                console.print(f"[red][read_file][/red] {err}")
+        for step in plan:
+            kind = step["kind"]
+            if kind == "read_file":
+                # Missing, huge or binary targets stop here, before any model call.
+                if not self._read_file(step, state):
+                    break
+            elif kind == "synthesize_patch":
+                self._synthesize_patch(step, state)
+            elif kind == "apply_patch":
+                self._apply_patch(step, state)
+            elif kind == "synthesize_files":
+                if not self._synthesize_files(step, state):
+                    break
+            elif kind == "show_diff":
+                self._show_diff(step, state)
+            elif kind == "write_file":
+                # gated below by confirmation
+                pass
+            elif kind == "run_command":
+                self._run_command(step, state, dry_run)
+            elif kind == "search_code":
+                self._search_code(step, state)
+            elif kind == "error":
+                message = step.get("message", "Planning error.")
+                console.print(f"[red][plan][/red] {message}")
+                state.session_actions.append(
+                    {
+                        "type": "plan_error",
+                        "message": message,
+                        "path": step.get("path"),
+                    }
+                )
+                break
             else:
-                console.print(f"[green][read_file][/green] {step['path']} ({len(text)} bytes)")
-                synthesized_cache[step["path"] + "::old"] = text
-
-        elif kind == "synthesize_patch":
-            path = step["path"]
-            instructions = step.get("instructions", "")
-            original = synthesized_cache.get(path + "::old", "")
-            console.print(f"[yellow]Synthesizing patch for {path}...[/yellow]")
-            new_text, validation_issues = synthesize_new_contents(path, original, instructions)
-            if not new_text:
-                console.print(f"[red]Failed to synthesize new contents for {path}[/red]")
-                continue
-            synthesized_cache[path + "::new"] = new_text
-            if validation_issues:
-                synthesized_cache[path + "::issues"] = validation_issues
-                console.print("[yellow]Validation warnings:[/yellow]")
-                for issue in validation_issues:
-                    console.print(f" - {issue}")
-
-        elif kind == "show_diff":
-            path = step["path"]
-            proposed = step.get("contents")
-            if proposed is None:
-                proposed = synthesized_cache.get(path + "::new")
-
-            if proposed is None:
-                console.print(f"[red][show_diff][/red] No proposed contents for {path}")
-                continue
-
-            ok, old, err = read_file_text(path)
-            old = old if ok else ""
-            diff = compute_unified_diff(old, proposed, path)
-            title = f"Unified diff for {path}" if old else f"New file preview: {path}"
-            console.rule(f"[bold magenta]{title}[/bold magenta]")
-            console.print(diff or "(no changes)")
-            issues = synthesized_cache.get(path + "::issues", [])
-            if issues:
-                console.print("[yellow]Validation warnings (write requires explicit override):[/yellow]")
-                for issue in issues:
-                    console.print(f" - {issue}")
-            confirm_needed = True
-            pending_write = (path, proposed)
-
-        elif kind == "write_file":
-            # gated below by confirmation
-            pass
-
-        elif kind == "run_command":
-            cmd = step["command"]
-            args = step.get("args", [])
-            console.rule("[bold cyan]Planned Command[/bold cyan]")
-            console.print(f"{cmd} {' '.join(args)}")
-            analysis = analyze_command(cmd, args)
-            if analysis.reasons:
-                console.print("[yellow]Command safety review:[/yellow]")
-                for reason in analysis.reasons:
-                    console.print(f" - {reason}")
-
-            command_entry: Dict[str, Any] = {
-                "type": "run_command",
-                "command": cmd,
-                "args": args,
-                "risk": analysis.risk,
-                "reasons": analysis.reasons,
-            }
-            if analysis.risk == "block":
-                console.print("[red]Command contains disallowed shell control operators and was blocked.[/red]")
-                command_entry["decision"] = "blocked"
-                session_actions.append(command_entry)
-                continue
-
-            if analysis.risk == "caution" and dry_run_required(analysis):
-                console.print("[yellow]Dry-run enforced by AGENT_HIGH_RISK_DRY_RUN; command execution skipped.[/yellow]")
-                command_entry["decision"] = "dry-run"
-                session_actions.append(command_entry)
-                continue
-
-            if analysis.risk == "caution":
-                choice = input("\nHigh-risk command detected. Type 'run' to execute, 'dry' for a dry-run skip, or anything else to cancel: ").strip().lower()
-                if choice == "dry":
-                    console.print("Dry-run requested; command was not executed.")
-                    command_entry["decision"] = "dry-run"
-                    session_actions.append(command_entry)
-                    continue
-                if choice != "run":
-                    console.print("Skipped.")
-                    command_entry["decision"] = "skipped"
-                    session_actions.append(command_entry)
-                    continue
-                execute = True
+                console.print(f"[yellow]Unknown step kind: {kind}[/yellow]")
+
+        # Confirmation + write + commit
+        if state.confirm_needed and state.pending_writes:
+            write_entry = self._confirm_and_write(state, dry_run)
+            if write_entry:
+                state.session_actions.append(write_entry)
+
+        console.print("\n[dim]Step 3 complete: synthesis if needed, diff preview, git commit, and safe command run.[/dim]")
+        if debug and state.cache is not None:
+            cache_stats = state.cache.stats()
+            console.print(
+                f"[dim]cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                f"{cache_stats['evictions']} evictions[/dim]"
+            )
+        if debug:
+            from llm import usage_tracker
+
+            usage = usage_tracker.summary()
+            console.print(
+                f"[dim]prompt cache: {usage['cached_tokens']}/{usage['input_tokens']} input tokens cached "
+                f"({usage['cache_hit_rate']:.0%}) over {usage['calls']} model calls[/dim]"
+            )
+            calls = scheduler.stats()
+            console.print(
+                f"[dim]requests: {calls['calls']} calls, {calls['retries']} retries, {calls['failures']} failed, "
+                f"p50 {calls['p50_latency']:.2f}s, max {calls['max_latency']:.2f}s[/dim]"
+            )
+
+        exchange: List["Turn"] = [
+            {"role": "user", "content": user_prompt},
+            {"role": "assistant", "content": build_assistant_summary(intent, plan, state.session_actions)},
+        ]
+        self.turns.extend(exchange)
+        self.turns = self.session.record(self.turns, exchange)
+        return 0
+
+    def _read_file(self, step: Dict[str, Any], state: RunState) -> bool:
+        """Read an edit target. Returns False (ending the plan) if it can't be edited as text."""
+        ok, text, err = state.reads.read(step["path"])
+        if not ok:
+            console.print(f"[red][read_file][/red] {err}")
+            state.session_actions.append({"type": "read_file", "path": step["path"], "error": err})
+            return False
+        console.print(f"[green][read_file][/green] {step['path']} ({len(text)} bytes)")
+        state.synthesized_cache[step["path"] + "::old"] = text
+        return True
+
+    def _synthesize_patch(self, step: Dict[str, Any], state: RunState) -> None:
+        from patcher import SynthesisAborted, synthesize_new_contents
+
+        path = step["path"]
+        instructions = step.get("instructions", "")
+        original = state.synthesized_cache.get(path + "::old", "")
+        console.print(f"[yellow]Synthesizing patch for {path}...[/yellow]")
+        stats: Dict[str, Any] = {}
+        try:
+            if state.stream:
+                new_text, validation_issues = self._synthesize_streaming(path, original, instructions, stats, state.cache)
             else:
-                ans = input("\nRun this command now? [y/N]: ").strip().lower()
-                if ans != "y":
-                    console.print("Skipped.")
-                    command_entry["decision"] = "skipped"
-                    session_actions.append(command_entry)
-                    continue
-                execute = True
+                new_text, validation_issues = synthesize_new_contents(
+                    path, original, instructions, stats=stats, cache=state.cache, context=self.related_signatures(path, original)
+                )
+        except SynthesisAborted:
+            console.print(f"[yellow]Synthesis for {path} aborted; nothing will be written.[/yellow]")
+            state.session_actions.append({"type": "synthesize_patch", "path": path, "aborted": True})
+            return
+        except Exception as ex:
+            # Deadlines, stream failures and API errors end this edit, not the whole run.
+            console.print(f"[red]Synthesis failed for {path}: {ex}[/red]")
+            report_synthesis_stats(stats)
+            state.session_actions.append({"type": "synthesize_patch", "path": path, **stats, "error": str(ex)})
+            return
+        report_synthesis_stats(stats)
+        if stats:
+            state.session_actions.append({"type": "synthesize_patch", "path": path, **stats})
+        if not new_text:
+            console.print(f"[red]Failed to synthesize new contents for {path}[/red]")
+            return
+        self._store_proposal(path, new_text, validation_issues, state)
+
+    def _apply_patch(self, step: Dict[str, Any], state: RunState) -> None:
+        from edit_format import apply_patch
+        from patcher import validate_generated_code
+
+        path = step["path"]
+        patch = step.get("patch") or ""
+        original = state.synthesized_cache.get(path + "::old", "")
+        try:
+            new_text, failures = apply_patch(original, patch)
+        except ValueError:
+            # Not a diff or edit blocks: the patch is the complete new contents.
+            new_text, failures = patch, []
+        if new_text is None:
+            console.print(f"[yellow]Patch for {path} did not apply cleanly; synthesizing from the instructions instead.[/yellow]")
+            for failure in failures:
+                console.print(f" - {failure}")
+            instructions = f"{step.get('instructions', '')}\n\nThis patch expresses the intended change but did not apply cleanly:\n{patch}"
+            self._synthesize_patch({"kind": "synthesize_patch", "path": path, "instructions": instructions}, state)
+            return
+        console.print(f"[green][apply_patch][/green] Applied patch to {path} locally")
+        self._store_proposal(path, new_text, validate_generated_code(path, new_text), state)
+
+    def _synthesize_files(self, step: Dict[str, Any], state: RunState) -> bool:
+        """
+        Produce new contents for every file of a multi_edit: patches are applied locally, the
+        rest are synthesized concurrently. Returns False (and stores nothing) if any file fails,
+        so a multi-file change is only ever proposed as a whole.
+        """
+        from concurrent.futures import ThreadPoolExecutor
 
-            if execute:
+        from edit_format import apply_patch
+        from patcher import synthesize_new_contents, validate_generated_code
+
+        edits = step.get("edits") or []
+        results: Dict[str, Tuple[Optional[str], List[str]]] = {}
+        to_synthesize: List[Tuple[str, str, str]] = []  # (path, original, instructions)
+        for edit in edits:
+            path = edit["path"]
+            original = state.synthesized_cache.get(path + "::old", "")
+            instructions = edit.get("instructions", "")
+            patch = edit.get("patch")
+            if patch:
                 try:
-                    code, out, err = sandbox.run(cmd, args)
-                    console.rule("[bold green]stdout[/bold green]"); print(out or "(empty)")
-                    console.rule("[bold red]stderr[/bold red]"); print(err or "(empty)")
-                    console.print(f"\nExit code: {code}")
-                    command_entry.update(
-                        exit_code=code,
-                        stdout=truncate_text(out or "", 500),
-                        stderr=truncate_text(err or "", 500),
-                        decision="executed",
-                    )
-                except Exception as ex:
-                    console.print(f"[red]Command failed: {ex}[/red]")
-                    command_entry["decision"] = "error"
-                    command_entry["error"] = str(ex)
-            else:
-                console.print("Skipped.")
-            session_actions.append(command_entry)
-
-        elif kind == "error":
-            message = step.get("message", "Planning error.")
-            console.print(f"[red][plan][/red] {message}")
-            session_actions.append(
-                {
-                    "type": "plan_error",
-                    "message": message,
-                    "path": step.get("path"),
-                }
+                    new_text, failures = apply_patch(original, patch)
+                except ValueError:
+                    new_text, failures = patch, []
+                if new_text is not None:
+                    console.print(f"[green][apply_patch][/green] Applied patch to {path} locally")
+                    results[path] = (new_text, validate_generated_code(path, new_text))
+                    continue
+                console.print(f"[yellow]Patch for {path} did not apply cleanly; synthesizing it instead.[/yellow]")
+                instructions = f"{instructions}\n\nThis patch expresses the intended change but did not apply cleanly:\n{patch}"
+            to_synthesize.append((path, original, instructions))
+
+        if to_synthesize:
+            workers = max(1, min(MULTI_EDIT_WORKERS, len(to_synthesize)))
+            console.print(f"[yellow]Synthesizing {len(to_synthesize)} file(s) with {workers} worker(s)...[/yellow]")
+            if state.stream:
+                console.print("[dim]Live diff streaming is not available for multi-file edits.[/dim]")
+            started = time.perf_counter()
+            stats = {path: {} for path, _, _ in to_synthesize}
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="synthesize")
+            futures = {
+                path: pool.submit(
+                    synthesize_new_contents,
+                    path,
+                    original,
+                    instructions,
+                    stats=stats[path],
+                    cache=state.cache,
+                    context=self.related_signatures(path, original),
+                )
+                for path, original, instructions in to_synthesize
+            }
+            try:
+                for path, future in futures.items():
+                    try:
+                        results[path] = future.result()
+                    except Exception as ex:
+                        console.print(f"[red]Synthesis failed for {path}: {ex}[/red]")
+                        results[path] = (None, [])
+            except KeyboardInterrupt:
+                pool.shutdown(wait=False, cancel_futures=True)
+                console.print("[yellow]Multi-file synthesis aborted; nothing will be written.[/yellow]")
+                state.session_actions.append({"type": "synthesize_files", "paths": list(futures), "aborted": True})
+                return False
+            pool.shutdown(wait=True)
+            console.print(f"[dim]Synthesized {len(to_synthesize)} file(s) in {time.perf_counter() - started:.1f}s.[/dim]")
+            for path, file_stats in stats.items():
+                report_synthesis_stats(file_stats)
+                if file_stats:
+                    state.session_actions.append({"type": "synthesize_patch", "path": path, **file_stats})
+
+        failed = [edit["path"] for edit in edits if not results.get(edit["path"], (None, []))[0]]
+        if failed:
+            console.print(f"[red]Failed to produce new contents for {', '.join(failed)}; no files will be changed.[/red]")
+            state.session_actions.append({"type": "synthesize_files", "failed": failed})
+            return False
+        for edit in edits:
+            new_text, validation_issues = results[edit["path"]]
+            self._store_proposal(edit["path"], new_text, validation_issues, state)
+        return True
+
+    def related_signatures(self, path: str, original: str) -> str:
+        """Signatures of the workspace modules `path` imports, for the synthesis prompt."""
+        if not path.endswith(".py"):
+            return ""
+        return self.fresh_symbols().import_signatures(path, original)
+
+    def _store_proposal(self, path: str, new_text: str, validation_issues: List[str], state: RunState) -> None:
+        state.synthesized_cache[path + "::new"] = new_text
+        if validation_issues:
+            state.synthesized_cache[path + "::issues"] = validation_issues
+            console.print("[yellow]Validation warnings:[/yellow]")
+            for issue in validation_issues:
+                console.print(f" - {issue}")
+
+    def _synthesize_streaming(
+        self,
+        path: str,
+        original: str,
+        instructions: str,
+        stats: Dict[str, Any],
+        cache: Optional[Any],
+    ) -> Tuple[Optional[str], List[str]]:
+        """
+        Stream the synthesis while a live unified diff of the changes so far is redrawn.
+        Without a terminal (output relayed by the daemon, or piped) a Live view draws
+        nothing, so progress is printed as plain lines instead.
+        """
+        from contextlib import nullcontext
+
+        from rich.live import Live
+        from rich.text import Text
+
+        from fs_ops import compute_unified_diff
+        from patcher import PartialPreview, synthesize_new_contents
+
+        started = time.perf_counter()
+        progress: Dict[str, Any] = {"lines": 0, "drawn_lines": 0, "drawn_at": 0.0, "first_change": None}
+        preview = PartialPreview(original)
+        live = console.is_terminal
+        console.print("[dim]Streaming synthesis; press Ctrl-C to abort it early.[/dim]")
+
+        view = Live(Text(""), console=console.resolve(), refresh_per_second=8, transient=True) if live else nullcontext()
+        with view as live_view:
+
+            def on_delta(text: str) -> None:
+                lines = text.count("\n")
+                now = time.perf_counter()
+                progress["lines"] = lines
+                # Re-diff only when a line completed, and at most every 100 ms (plain lines: every second).
+                interval = 0.1 if live else PLAIN_PROGRESS_SEC
+                if lines == progress["drawn_lines"] or now - progress["drawn_at"] < interval:
+                    return
+                progress.update(drawn_lines=lines, drawn_at=now)
+                diff = compute_unified_diff(original, preview.update(text), path)
+                if diff and progress["first_change"] is None:
+                    progress["first_change"] = now - started
+                if live_view is not None:
+                    tail = "\n".join(diff.splitlines()[-LIVE_DIFF_LINES:])
+                    live_view.update(Text(f"{tail}\n[{lines} lines received, {now - started:.1f}s]"))
+                    return
+                changed = sum(
+                    1 for line in diff.splitlines() if line[:1] in "+-" and not line.startswith(("+++", "---"))
+                )
+                print(f"[{lines} lines received, {changed} changed so far, {now - started:.1f}s]", flush=True)
+
+            result = synthesize_new_contents(
+                path, original, instructions, on_delta=on_delta, stats=stats, cache=cache,
+                context=self.related_signatures(path, original),
+            )
+
+        if stats.get("cached"):
+            return result
+        first = progress["first_change"]
+        first_note = f", first change after {first:.1f}s" if first is not None else ""
+        console.print(f"[dim]Streamed {progress['lines']} lines in {time.perf_counter() - started:.1f}s{first_note}.[/dim]")
+        return result
+
+    def _show_diff(self, step: Dict[str, Any], state: RunState) -> None:
+        from fs_ops import compute_unified_diff
+
+        path = step["path"]
+        proposed = step.get("contents")
+        if proposed is None:
+            proposed = state.synthesized_cache.get(path + "::new")
+
+        if proposed is None:
+            console.print(f"[red][show_diff][/red] No proposed contents for {path}")
+            return
+
+        ok, old, err = state.reads.read(path)
+        old = old if ok else ""
+        diff = compute_unified_diff(old, proposed, path)
+        title = f"Unified diff for {path}" if old else f"New file preview: {path}"
+        console.rule(f"[bold magenta]{title}[/bold magenta]")
+        console.print(diff or "(no changes)")
+        issues = state.synthesized_cache.get(path + "::issues", [])
+        if issues:
+            console.print("[yellow]Validation warnings (write requires explicit override):[/yellow]")
+            for issue in issues:
+                console.print(f" - {issue}")
+        state.confirm_needed = True
+        state.pending_writes = [(p, c) for p, c in state.pending_writes if p != path]
+        state.pending_writes.append((path, proposed))
+
+    def _search_code(self, step: Dict[str, Any], state: RunState) -> None:
+        """Search the indexed workspace, printing matches as they stream in."""
+        from rich.markup import escape
+
+        from search import search_code
+
+        pattern = step["pattern"]
+        globs = step.get("globs") or []
+        console.rule("[bold cyan]Code Search[/bold cyan]")
+        scope = f" in {', '.join(globs)}" if globs else ""
+        console.print(f"{'literal' if step.get('literal') else 'regex'} {pattern!r}{scope}")
+        entry: Dict[str, Any] = {"type": "search_code", "pattern": pattern, "globs": globs}
+        state.session_actions.append(entry)
+        started = time.perf_counter()
+        try:
+            result = search_code(
+                self.fresh_workspace(),
+                pattern,
+                literal=bool(step.get("literal")),
+                globs=globs,
+                max_results=step.get("max_results") or 50,
+                on_match=lambda m: console.print(f"[green]{escape(m.path)}[/green]:{m.line}: {escape(m.text)}", highlight=False),
             )
-            break
+        except ValueError as e:
+            console.print(f"[red][search_code][/red] {e}")
+            entry["error"] = str(e)
+            return
+        matches = result["matches"]
+        more = " (more matches not shown)" if result["truncated"] else ""
+        console.print(
+            f"[dim]{len(matches)} matches in {result['files']} files{more}, "
+            f"{time.perf_counter() - started:.2f}s.[/dim]"
+        )
+        # Snippets, not file contents, go back to the model through the session history.
+        entry.update(matches=[m.snippet() for m in matches], files=result["files"], truncated=result["truncated"])
+
+    def _run_command(self, step: Dict[str, Any], state: RunState, dry_run: bool) -> None:
+        from command_safety import analyze_command, dry_run_required
+
+        cmd = step["command"]
+        args = step.get("args", [])
+        console.rule("[bold cyan]Planned Command[/bold cyan]")
+        console.print(f"{cmd} {' '.join(args)}")
+        analysis = analyze_command(cmd, args)
+        if analysis.reasons:
+            console.print("[yellow]Command safety review:[/yellow]")
+            for reason in analysis.reasons:
+                console.print(f" - {reason}")
+
+        command_entry: Dict[str, Any] = {
+            "type": "run_command",
+            "command": cmd,
+            "args": args,
+            "risk": analysis.risk,
+            "reasons": analysis.reasons,
+        }
+        state.session_actions.append(command_entry)
+        if analysis.risk == "block":
+            console.print("[red]Command contains disallowed shell control operators and was blocked.[/red]")
+            command_entry["decision"] = "blocked"
+            return
+
+        if analysis.risk == "caution" and dry_run_required(analysis):
+            console.print("[yellow]Dry-run enforced by AGENT_HIGH_RISK_DRY_RUN; command execution skipped.[/yellow]")
+            command_entry["decision"] = "dry-run"
+            return
 
+        if dry_run:
+            console.print("[yellow]Dry-run mode; command execution skipped.[/yellow]")
+            command_entry["decision"] = "dry-run"
+            return
+
+        if analysis.risk == "caution":
+            choice = self.ask("\nHigh-risk command detected. Type 'run' to execute, 'dry' for a dry-run skip, or anything else to cancel: ").strip().lower()
+            if choice == "dry":
+                console.print("Dry-run requested; command was not executed.")
+                command_entry["decision"] = "dry-run"
+                return
+            if choice != "run":
+                console.print("Skipped.")
+                command_entry["decision"] = "skipped"
+                return
         else:
-            console.print(f"[yellow]Unknown step kind: {kind}[/yellow]")
+            ans = self.ask("\nRun this command now? [y/N]: ").strip().lower()
+            if ans != "y":
+                console.print("Skipped.")
+                command_entry["decision"] = "skipped"
+                return
+
+        try:
+            if getattr(self.sandbox, "streams_output", False):
+                console.rule("[bold green]output[/bold green]")
+                code, out, err = self.sandbox.run(cmd, args, on_output=print_output_line)
+                if not out and not err:
+                    print("(empty)")
+                log = getattr(self.sandbox, "last_log", None)
+                if log:
+                    console.print(f"[dim]Output truncated in memory; full log: {log}[/dim]")
+                    command_entry["log"] = log
+            else:
+                code, out, err = self.sandbox.run(cmd, args)
+                self._report_sync(command_entry)
+                console.rule("[bold green]stdout[/bold green]"); print(out or "(empty)")
+                console.rule("[bold red]stderr[/bold red]"); print(err or "(empty)")
+            console.print(f"\nExit code: {code}")
+            command_entry.update(
+                exit_code=code,
+                stdout=truncate_text(out or "", 500),
+                stderr=truncate_text(err or "", 500),
+                decision="executed",
+            )
+        except Exception as ex:
+            console.print(f"[red]Command failed: {ex}[/red]")
+            command_entry["decision"] = "error"
+            command_entry["error"] = str(ex)
+
+    def _report_sync(self, command_entry: Dict[str, Any]) -> None:
+        # Remote sandboxes get the workspace pushed before the command and changes pulled after.
+        sync = getattr(self.sandbox, "sync", None)
+        if sync is None or sync.last_push is None:
+            return
+        push = sync.last_push
+        if push.uploaded or push.deleted:
+            console.print(
+                f"[dim]Synced workspace: {push.uploaded} uploaded, {push.deleted} deleted "
+                f"({push.bytes / 1024:.1f} KB in {push.archives} archive(s), {push.seconds:.2f}s).[/dim]"
+            )
+        if sync.last_pulled:
+            console.print(f"[green]Pulled back from the sandbox:[/green] {', '.join(sync.last_pulled)}")
+            command_entry["pulled"] = list(sync.last_pulled)
+        if getattr(self.sandbox, "pull_error", None):
+            console.print(f"[yellow]Could not pull changes back from the sandbox: {self.sandbox.pull_error}[/yellow]")
+
+    def _confirm_and_write(self, state: RunState, dry_run: bool) -> Optional[Dict[str, Any]]:
+        files = state.pending_writes
+        paths = [path for path, _ in files]
+        target = write_target(paths)
+        issues = [
+            issue if len(paths) == 1 else f"{path}: {issue}"
+            for path in paths
+            for issue in state.synthesized_cache.get(path + "::issues", [])
+        ]
+        if dry_run:
+            console.print("[yellow]Dry-run mode; no files changed.[/yellow]")
+            write_entry: Dict[str, Any] = {"type": "write_file", **target, "applied": False, "reason": "dry_run"}
+            if issues:
+                write_entry["validation_issues"] = issues
+            return write_entry
 
-    # Confirmation + write + commit
-    write_entry: Optional[Dict[str, Any]] = None
-    if confirm_needed and pending_write:
-        path, contents = pending_write
-        issues = synthesized_cache.get(path + "::issues", [])
         if issues:
-            console.print("[yellow]Validation warnings detected for this file:[/yellow]")
+            console.print("[yellow]Validation warnings detected for this change:[/yellow]")
             for issue in issues:
                 console.print(f" - {issue}")
-            ans = input("\nType 'force' to write despite validation issues, or anything else to cancel: ").strip().lower()
+            ans = self.ask("\nType 'force' to write despite validation issues, or anything else to cancel: ").strip().lower()
             if ans != "force":
                 console.print("Aborted due to validation issues (no files changed).")
-                write_entry = {"type": "write_file", "path": path, "applied": False, "reason": "validation_failed"}
+                write_entry = {"type": "write_file", **target, "applied": False, "reason": "validation_failed"}
             else:
                 console.print("[yellow]Proceeding despite validation warnings.[/yellow]")
-                ok, err = write_file_text(path, contents)
-                if ok:
-                    console.print(f"[green][write_file][/green] Wrote {path}")
-                    write_entry = {"type": "write_file", "path": path, "applied": True, "override_validation": True}
-                    try:
-                        commit_paths([path], f"feat(agent): update {path}")
-                        console.print("[green]Committed to git[/green]")
-                        write_entry["committed"] = True
-                    except Exception as ex:
-                        console.print(f"[yellow]Write succeeded but commit failed: {ex}[/yellow]")
-                        write_entry["committed"] = False
-                        write_entry["commit_error"] = str(ex)
-                else:
-                    console.print(f"[red][write_file][/red] {err}")
-                    write_entry = {"type": "write_file", "path": path, "applied": False, "error": err}
-            if write_entry:
-                write_entry["validation_issues"] = issues
-        else:
-            ans = input("\nApply the file change(s)? [y/N]: ").strip().lower()
-            if ans == "y":
-                ok, err = write_file_text(path, contents)
-                if ok:
-                    console.print(f"[green][write_file][/green] Wrote {path}")
-                    write_entry = {"type": "write_file", "path": path, "applied": True}
-                    try:
-                        commit_paths([path], f"feat(agent): update {path}")
-                        console.print("[green]Committed to git[/green]")
-                        write_entry["committed"] = True
-                    except Exception as ex:
-                        console.print(f"[yellow]Write succeeded but commit failed: {ex}[/yellow]")
-                        write_entry["committed"] = False
-                        write_entry["commit_error"] = str(ex)
-                else:
-                    console.print(f"[red][write_file][/red] {err}")
-                    write_entry = {"type": "write_file", "path": path, "applied": False, "error": err}
-            else:
-                console.print("Aborted (no files changed).")
-                write_entry = {"type": "write_file", "path": path, "applied": False, "reason": "user_declined"}
+                write_entry = self._write_and_commit(files)
+                if write_entry.get("applied"):
+                    write_entry["override_validation"] = True
+            write_entry["validation_issues"] = issues
+            return write_entry
 
-    if write_entry:
-        session_actions.append(write_entry)
+        ans = self.ask("\nApply the file change(s)? [y/N]: ").strip().lower()
+        if ans == "y":
+            return self._write_and_commit(files)
+        console.print("Aborted (no files changed).")
+        return {"type": "write_file", **target, "applied": False, "reason": "user_declined"}
 
+    def _write_and_commit(self, files: List[Tuple[str, str]]) -> Dict[str, Any]:
+        from fs_ops import write_files_atomic
+        from git_ops import commit_queue, record_checkpoint, snapshot_paths
+
+        paths = [path for path, _ in files]
+        target = write_target(paths)
+        message = f"feat(agent): update {', '.join(paths)}"
+        try:
+            # What the touched paths held before the write, for `:rollback`.
+            before = snapshot_paths(paths, root=self.root)
+        except Exception as ex:
+            console.print(f"[yellow]No checkpoint will be recorded: {ex}[/yellow]")
+            before = None
+        ok, err = write_files_atomic(files)
+        if not ok:
+            console.print(f"[red][write_file][/red] {err}")
+            if len(paths) > 1:
+                console.print("[yellow]All files were restored to their previous contents.[/yellow]")
+            return {"type": "write_file", **target, "applied": False, "error": err}
+        console.print(f"[green][write_file][/green] Wrote {', '.join(paths)}")
+        write_entry: Dict[str, Any] = {"type": "write_file", **target, "applied": True}
+        number = None
+        if before is not None:
+            try:
+                number = record_checkpoint(message, before, snapshot_paths(paths, root=self.root), root=self.root)
+                console.print(f"[dim]Checkpoint {number} recorded (:rollback to undo).[/dim]")
+                write_entry["checkpoint"] = number
+            except Exception as ex:
+                console.print(f"[yellow]Checkpoint not recorded: {ex}[/yellow]")
+        try:
+            # Committed by the queue's worker thread; failures are reported on the next prompt.
+            queue = commit_queue(self.root)
+            queue.submit(paths, message, checkpoint=number)
+            policy = "" if queue.policy == "per-edit" else f" ({queue.policy} policy)"
+            console.print(f"[green]Commit queued{policy}[/green]")
+            write_entry["commit"] = "queued"
+        except Exception as ex:
+            console.print(f"[yellow]Write succeeded but commit failed: {ex}[/yellow]")
+            write_entry["commit"] = "failed"
+            write_entry["commit_error"] = str(ex)
+        return write_entry
+
+    def flush_commits(self) -> None:
+        """Wait for queued commits (at exit, before rollback, on a session switch)."""
+        from git_ops import flush_commits
+
+        flush_commits(self.root)
+        self.report_commit_failures()
+
+    def report_commit_failures(self) -> None:
+        from git_ops import commit_failures
+
+        for failure in commit_failures(self.root):
+            console.print(f"[yellow]Background commit failed: {failure}[/yellow]")
+
+
+def print_output_line(stream: str, line: str) -> None:
+    """Live rendering of one line of command output; stderr in red."""
+    if stream == "stderr":
+        console.print(line, style="red", markup=False, highlight=False, soft_wrap=True)
+    else:
+        print(line, flush=True)
+
+
+def write_target(paths: List[str]) -> Dict[str, Any]:
+    """Session-memory fields naming what a write touched: `path` for one file, `paths` for several."""
+    return {"path": paths[0]} if len(paths) == 1 else {"paths": paths}
+
+
+def format_checkpoints(checkpoints: List[Any]) -> List[str]:
+    """One line per checkpoint, newest first."""
+    if not checkpoints:
+        return ["No agent checkpoints."]
+    return [
+        f"{c.number:>4}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(c.created))}  {', '.join(c.paths)}"
+        for c in checkpoints
+    ]
+
+
+def report_synthesis_stats(stats: Dict[str, Any]) -> None:
+    if stats.get("cached"):
+        console.print("[dim]Synthesis served from cache (--no-cache to bypass).[/dim]")
+        return
+    failures = stats.get("edit_block_failures")
+    if failures:
+        console.print(f"[yellow]Edit blocks did not apply ({'; '.join(failures)}); regenerated the full file.[/yellow]")
+    if stats.get("mode") == "edit_blocks":
+        full = stats["full_file_tokens_estimate"]
+        saved = stats["saved_tokens_estimate"]
+        share = f" ({saved * 100 // full}%)" if full else ""
+        console.print(
+            f"[dim]Edit blocks: {stats['output_tokens']} output tokens vs ~{full} for the full file; "
+            f"saved ~{saved}{share}.[/dim]"
+        )
+    elif stats.get("mode") in ("region_blocks", "region_full"):
+        console.print(
+            f"[dim]Region-scoped: sent {stats['region_lines']} of {stats['file_lines']} lines "
+            f"in {stats['regions']} region(s); {stats['output_tokens']} output tokens vs "
+            f"~{stats['full_file_tokens_estimate']} for the full file.[/dim]"
+        )
+    if stats.get("region_fallback"):
+        console.print("[yellow]Region-scoped response could not be spliced back; sent the whole file instead.[/yellow]")
+
+
+def print_raw_response(resp: Any) -> None:
     try:
-        sandbox.close()
+        raw = resp.to_dict() if hasattr(resp, "to_dict") else resp
+        print(json.dumps(raw, indent=2)[:4000])
     except Exception:
         pass
 
-    console.print("\n[dim]Step 3 complete: synthesis if needed, diff preview, git commit, and safe command run.[/dim]")
 
-    turns.append({"role": "user", "content": user_prompt})
-    assistant_summary = build_assistant_summary(intent, plan, session_actions)
-    turns.append({"role": "assistant", "content": assistant_summary})
-    save_memory(turns)
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="main.py", description="Run one natural language request through the agent.")
+    parser.add_argument("prompt", nargs="*", help="Natural language request")
+    parser.add_argument("--dry-run", action="store_true", help="Synthesize and preview, but skip writes, commits and commands")
+    parser.add_argument("--debug", action="store_true", help="Print the raw model response")
+    parser.add_argument("--stream", action="store_true", help="Stream synthesis with a live diff preview (Ctrl-C aborts)")
+    parser.add_argument("--force-model", action="store_true", help="Always ask the model for the intent (skip the local fast path)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the .agent/cache/ result cache for this run")
+    parser.add_argument(
+        "--rollback", nargs="?", type=int, const=1, default=None, metavar="N",
+        help="Undo the last N agent checkpoints (default 1), restoring only the files they touched, and exit",
+    )
+    parser.add_argument("--checkpoints", action="store_true", help="List agent checkpoints and exit")
+    parser.add_argument("--startup-profile", action="store_true", help="Print a per-module import-time breakdown and exit")
+    parser.add_argument("--serve", action="store_true", help="Run the cherno daemon in the foreground")
+    parser.add_argument("--stop-daemon", action="store_true", help="Ask a running cherno daemon to exit")
+    parser.add_argument("--no-daemon", action="store_true", help="Run in this process instead of attaching to the daemon")
+    parser.add_argument("--socket", default=None, help="Daemon socket path (default: .agent/cherno.sock)")
+    parser.add_argument("--session", default=None, help="Named conversation session (default: $CHERNO_SESSION or 'default')")
+    return parser.parse_args(argv)
+
+
+def run_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """Engine.run keyword arguments selected on the command line."""
+    return {
+        "dry_run": args.dry_run,
+        "debug": args.debug,
+        "stream": args.stream,
+        "use_cache": not args.no_cache,
+        "local_intents": not args.force_model,
+        "session": args.session,
+    }
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+
+    if args.startup_profile:
+        from startup_profile import print_startup_profile
+
+        print_startup_profile()
+        return
+
+    if args.rollback is not None:
+        import daemon
+        from git_ops import rollback_checkpoints
+
+        try:
+            # A running daemon may still hold queued commits for the edits being undone.
+            daemon.flush_daemon(Path(args.socket) if args.socket else daemon.SOCKET_PATH)
+            undone = rollback_checkpoints(args.rollback, ".")
+        except Exception as ex:
+            print(f"Rollback failed: {ex}")
+            sys.exit(1)
+        for checkpoint in undone:
+            print(f"Rolled back checkpoint {checkpoint.number}: {', '.join(checkpoint.paths)}")
+        return
+
+    if args.checkpoints:
+        from git_ops import list_checkpoints
+
+        for line in format_checkpoints(list_checkpoints(".")):
+            print(line)
+        return
+
+    import daemon
+
+    socket_path = Path(args.socket) if args.socket else daemon.SOCKET_PATH
+    if args.serve:
+        daemon.serve(socket_path)
+        return
+    if args.stop_daemon:
+        if not daemon.stop_daemon(socket_path):
+            print("No cherno daemon is running.")
+        return
+
+    if not args.prompt:
+        print("Usage: python main.py <your natural language request>")
+        sys.exit(1)
+
+    user_prompt = " ".join(args.prompt)
+    if not args.no_daemon and daemon.daemon_supported():
+        # Thin client: the daemon already has the client, sandbox and memory warm.
+        try:
+            code = daemon.run_remote(user_prompt, socket_path=socket_path, **run_options(args))
+        finally:
+            # The commit queue lives in the daemon; this prompt's commits land before we exit.
+            daemon.flush_daemon(socket_path)
+        if code:
+            sys.exit(code)
+        return
+
+    engine = Engine()
+    try:
+        code = engine.run(user_prompt, **run_options(args))
+    finally:
+        engine.close()
+    if code:
+        sys.exit(code)
 
 
 if __name__ == "__main__":
@@ -1,45 +1,451 @@
 # memory.py
+import hashlib
 import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Literal, List, TypedDict
+from typing import Any, Dict, Iterator, Literal, List, Optional, Tuple, TypedDict
 
-MAX_TURNS = 40
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialised across processes
+    fcntl = None  # type: ignore[assignment]
+
+from llm import estimate_tokens
+from retrieval import BM25Index, select_within_budget
+
+# History is bounded by estimated tokens, not turns. Once it outgrows the budget the oldest
+# turns are folded into one rolling summary turn until it is back under COMPACT_TARGET of the
+# budget; the slack lets many prompts append (keeping the cached prompt prefix byte-identical)
+# before the next compaction.
+MEMORY_TOKEN_BUDGET = int(os.getenv("AGENT_MEMORY_TOKENS", "8000"))
+COMPACT_TARGET = 0.6
+SUMMARY_MAX_LINES = 40
+
+# Strings longer than this are stored as a digest (length, hash, short preview).
+DIGEST_THRESHOLD = 240
+DIGEST_PREVIEW = 60
 
 AGENT_DIR = Path(".agent")
-SESSION_FILE = AGENT_DIR / "session.json"
+LEGACY_SESSION_FILE = AGENT_DIR / "session.json"
+
+SUMMARY_HEADER = "Summary of earlier requests in this session (oldest first):"
 
 
 class Turn(TypedDict):
-    role: Literal["user", "assistant"]
+    role: Literal["user", "assistant", "summary"]
     content: str
 
 
-def load_memory() -> List[Turn]:
-    AGENT_DIR.mkdir(exist_ok=True)
-    if not SESSION_FILE.exists():
-        return []
+def digest_text(text: str) -> str:
+    sha = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+    preview = " ".join(text[:DIGEST_PREVIEW].split())
+    return f"<{len(text)} chars sha256:{sha} starting {preview!r}>"
+
+
+def compact_payload(value: Any) -> Any:
+    """Copy of a JSON-like value with every long string replaced by its digest."""
+    if isinstance(value, str):
+        return digest_text(value) if len(value) > DIGEST_THRESHOLD else value
+    if isinstance(value, dict):
+        return {key: compact_payload(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [compact_payload(item) for item in value]
+    return value
+
+
+def turn_tokens(turn: Turn) -> int:
+    return estimate_tokens(turn["content"]) + 4  # + role/framing overhead
+
+
+def history_tokens(turns: List[Turn]) -> int:
+    return sum(turn_tokens(turn) for turn in turns)
+
+
+def _outcome(actions: List[Dict[str, Any]]) -> str:
+    for action in reversed(actions):
+        kind = action.get("type")
+        if kind == "write_file":
+            return "written" if action.get("applied") else f"not written ({action.get('reason') or action.get('error', 'failed')})"
+        if kind == "run_command":
+            if action.get("decision") == "executed":
+                return f"exit {action.get('exit_code')}"
+            return str(action.get("decision", "not run"))
+        if kind == "search_code":
+            if action.get("error"):
+                return "search failed"
+            return f"{len(action.get('matches') or [])} matches in {action.get('files', 0)} files"
+        if kind == "plan_error":
+            return "plan error"
+    return "no action"
+
+
+def summarize_exchange(prompt: Optional[str], answer: Optional[str]) -> str:
+    """One summary line for a user prompt and the assistant summary that answered it."""
+    asked = " ".join((prompt or "").split())
+    if len(asked) > 100:
+        asked = asked[:97] + "..."
     try:
-        data = json.loads(SESSION_FILE.read_text())
-    except json.JSONDecodeError:
-        return []
-
-    turns: List[Turn] = []
-    for item in data:
-        if not isinstance(item, dict):
-            continue
-        role = item.get("role")
-        content = item.get("content")
-        if role in ("user", "assistant") and isinstance(content, str):
-            turns.append({"role": role, "content": content})
-    return turns[-MAX_TURNS:]
-
-
-def save_memory(turns: List[Turn]) -> None:
-    AGENT_DIR.mkdir(exist_ok=True)
-    sanitized: List[Turn] = []
-    for turn in turns[-MAX_TURNS:]:
-        role = turn.get("role")
-        content = turn.get("content")
-        if role in ("user", "assistant") and isinstance(content, str):
-            sanitized.append({"role": role, "content": content})
-    SESSION_FILE.write_text(json.dumps(sanitized, indent=2))
+        payload = json.loads(answer or "")
+        intent = payload.get("intent") or {}
+        kind = intent.get("type", "?")
+        if kind == "multi_edit":
+            target = ", ".join(e.get("path", "?") for e in intent.get("edits", []))
+        elif kind == "run_command":
+            target = " ".join([intent.get("command", "")] + list(intent.get("args") or []))
+        elif kind == "search_code":
+            target = repr(intent.get("pattern", ""))
+        else:
+            target = intent.get("path", "")
+        result = f"{kind} {target}".strip() + f" ({_outcome(payload.get('actions') or [])})"
+    except (ValueError, AttributeError):
+        result = " ".join((answer or "").split())[:80] if answer else "no answer"
+    return f"- {asked!r} -> {result}"
+
+
+def _summary_lines(turn: Turn) -> List[str]:
+    return [line for line in turn["content"].splitlines()[1:] if line.strip()]
+
+
+def _summary_turn(lines: List[str]) -> Turn:
+    if len(lines) > SUMMARY_MAX_LINES:
+        dropped = len(lines) - SUMMARY_MAX_LINES + 1
+        lines = [f"- ({dropped} older requests omitted)"] + lines[-(SUMMARY_MAX_LINES - 1):]
+    return {"role": "summary", "content": "\n".join([SUMMARY_HEADER] + lines)}
+
+
+def trim_turns(turns: List[Turn], budget: int = MEMORY_TOKEN_BUDGET) -> List[Turn]:
+    """
+    Keep the history within `budget` estimated tokens. Oldest exchanges are folded into the
+    rolling summary turn at the front; the most recent exchange is always kept verbatim.
+    """
+    if history_tokens(turns) <= budget:
+        return turns
+    lines: List[str] = []
+    body = list(turns)
+    if body and body[0]["role"] == "summary":
+        lines = _summary_lines(body.pop(0))
+    target = budget * COMPACT_TARGET
+    rest = history_tokens(body)
+    summary = _summary_turn(lines)
+    while len(body) > 2 and rest + turn_tokens(summary) > target:
+        first = body.pop(0)
+        rest -= turn_tokens(first)
+        if first["role"] == "user" and body and body[0]["role"] == "assistant":
+            answer = body.pop(0)
+            rest -= turn_tokens(answer)
+            lines.append(summarize_exchange(first["content"], answer["content"]))
+        elif first["role"] == "user":
+            lines.append(summarize_exchange(first["content"], None))
+        elif first["role"] == "summary":
+            lines.extend(_summary_lines(first))
+        else:
+            lines.append(summarize_exchange(None, first["content"]))
+        summary = _summary_turn(lines)
+    return [summary] + body if lines else body
+
+
+# --- Session log -------------------------------------------------------------
+# Each named session is an append-only JSONL file under .agent/sessions/. Compacting the
+# history (trim_turns) appends a checkpoint record followed by the live turns, and the
+# small .idx file remembers the checkpoint's byte offset, so loading only reads the tail
+# after it: load cost depends on the token budget, not on how long the session has run.
+# Writers serialise on a .lock file; dead records before the checkpoint are dropped by a
+# background compaction once they outweigh the live tail.
+
+SESSIONS_DIR = AGENT_DIR / "sessions"
+DEFAULT_SESSION = os.getenv("CHERNO_SESSION", "default")
+COMPACT_MIN_BYTES = 256 * 1024
+
+_SESSION_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# Every exchange is also archived to <name>.history.jsonl, which compaction never touches,
+# and BM25-ranked exchanges that have left the live history are offered to the model as
+# extra context at the tail of the prompt (the cached prefix is left alone).
+RETRIEVAL_TOP_K = int(os.getenv("AGENT_RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("AGENT_RETRIEVAL_TOKENS", "1500"))
+RETRIEVED_ANSWER_CHARS = 600
+RETRIEVAL_HEADER = "Possibly relevant earlier exchanges from this session (retrieved by keyword match):"
+
+
+def _valid_turn(item: Any) -> bool:
+    return (
+        isinstance(item, dict)
+        and item.get("role") in ("user", "assistant", "summary")
+        and isinstance(item.get("content"), str)
+    )
+
+
+def _exchange_key(prompt: str, answer: str) -> str:
+    return hashlib.sha256(f"{prompt}\0{answer}".encode("utf-8")).hexdigest()[:16]
+
+
+def _render_exchange(doc: Dict[str, str]) -> str:
+    answer = doc["answer"]
+    if len(answer) > RETRIEVED_ANSWER_CHARS:
+        answer = answer[:RETRIEVED_ANSWER_CHARS] + "..."
+    return f"User: {doc['prompt']}\nAssistant: {answer}"
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+class SessionLog:
+    def __init__(self, name: str = DEFAULT_SESSION, root: Path = SESSIONS_DIR) -> None:
+        if not _SESSION_NAME.match(name):
+            raise ValueError(f"Invalid session name {name!r}: use letters, digits, '.', '_' or '-'")
+        self.name = name
+        self.root = Path(root)
+        self.path = self.root / f"{name}.jsonl"
+        self.index_path = self.root / f"{name}.idx"
+        self.lock_path = self.root / f"{name}.lock"
+        self.history_path = self.root / f"{name}.history.jsonl"
+        self._compactor: Optional[threading.Thread] = None
+        self._index = BM25Index()
+        self._docs: Dict[int, Dict[str, str]] = {}  # archive offset -> {"prompt", "answer", "key"}
+        self._history_offset = 0
+
+    # --- reading ---
+
+    def _read_index(self) -> Optional[Dict[str, int]]:
+        try:
+            index = json.loads(self.index_path.read_text())
+            return {"live": int(index["live"]), "size": int(index["size"])}
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_index(self, live: int, size: int) -> None:
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        tmp.write_text(json.dumps({"live": live, "size": size}))
+        os.replace(tmp, self.index_path)
+
+    def _scan_live_offset(self) -> int:
+        """Offset of the last checkpoint record, found by reading the whole log (index repair)."""
+        live = 0
+        offset = 0
+        with open(self.path, "rb") as fh:
+            for line in fh:
+                if line.startswith(b'{"checkpoint"'):
+                    live = offset
+                offset += len(line)
+        return live
+
+    def _live_offset(self, size: int) -> int:
+        index = self._read_index()
+        if index is not None and index["live"] <= index["size"] <= size:
+            return index["live"]
+        return self._scan_live_offset()
+
+    def load(self) -> List[Turn]:
+        self._migrate_legacy()
+        with _file_lock(self.lock_path):
+            return trim_turns(self._read_live())
+
+    def _read_live(self) -> List[Turn]:
+        """Turns after the last checkpoint, as on disk now. Call with the lock held."""
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            return []
+        live = self._live_offset(size)
+        with open(self.path, "rb") as fh:
+            fh.seek(live)
+            tail = fh.read()
+        turns: List[Turn] = []
+        for line in tail.splitlines():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue  # torn write from a crashed process
+            if isinstance(item, dict) and item.get("checkpoint"):
+                turns = []
+            elif _valid_turn(item):
+                turns.append({"role": item["role"], "content": item["content"]})
+        return turns
+
+    # --- writing ---
+
+    def _append_lines(self, records: List[Dict[str, Any]], checkpoint: bool) -> Tuple[int, int]:
+        with _file_lock(self.lock_path):
+            return self._append_locked(records, checkpoint)
+
+    def _append_locked(self, records: List[Dict[str, Any]], checkpoint: bool) -> Tuple[int, int]:
+        data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records).encode("utf-8")
+        with open(self.path, "ab") as fh:
+            start = fh.tell()
+            fh.write(data)
+            end = fh.tell()
+        index = self._read_index()
+        live = start if checkpoint or index is None else index["live"]
+        self._write_index(live, end)
+        return live, end
+
+    def append(self, turns: List[Turn]) -> None:
+        """Append turns to the log; O(size of the turns), whatever the session length."""
+        records = [{"role": t["role"], "content": t["content"]} for t in turns if _valid_turn(t)]
+        if records:
+            live, end = self._append_lines(records, checkpoint=False)
+            self._maybe_compact(live, end)
+
+    @staticmethod
+    def _checkpoint_records(turns: List[Turn]) -> List[Dict[str, Any]]:
+        records: List[Dict[str, Any]] = [{"checkpoint": True, "ts": round(time.time(), 3)}]
+        return records + [{"role": t["role"], "content": t["content"]} for t in turns if _valid_turn(t)]
+
+    def checkpoint(self, turns: List[Turn]) -> None:
+        """Record that the live history is now exactly `turns` (after trim_turns compacted it)."""
+        live, end = self._append_lines(self._checkpoint_records(turns), checkpoint=True)
+        self._maybe_compact(live, end)
+
+    def record(self, turns: List[Turn], new_turns: List[Turn]) -> List[Turn]:
+        """
+        Add `new_turns` (already appended to `turns` in memory) and return the trimmed history:
+        a plain append normally, a checkpoint when trimming compacted older turns.
+
+        The checkpoint is built from the log re-read under the lock, not from `turns`, so
+        turns another process appended since this one loaded are merged in, not dropped.
+        """
+        trimmed = trim_turns(turns)
+        if trimmed is turns:
+            self.append(new_turns)
+        else:
+            new_records = [{"role": t["role"], "content": t["content"]} for t in new_turns if _valid_turn(t)]
+            with _file_lock(self.lock_path):
+                trimmed = trim_turns(self._read_live() + new_records)
+                live, end = self._append_locked(self._checkpoint_records(trimmed), checkpoint=True)
+            self._maybe_compact(live, end)
+        self._archive(new_turns)
+        return trimmed
+
+    def clear(self) -> None:
+        with _file_lock(self.lock_path):
+            for path in (self.path, self.index_path, self.history_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    # --- compaction ---
+
+    def _maybe_compact(self, live: int, size: int) -> None:
+        if live < COMPACT_MIN_BYTES or live < size - live:
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name=f"compact-{self.name}", daemon=True)
+        self._compactor.start()
+
+    def compact(self) -> None:
+        """Rewrite the log without the records before the last checkpoint."""
+        with _file_lock(self.lock_path):
+            try:
+                size = self.path.stat().st_size
+            except OSError:
+                return
+            live = self._live_offset(size)
+            if live == 0:
+                return
+            with open(self.path, "rb") as fh:
+                fh.seek(live)
+                tail = fh.read()
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_bytes(tail)
+            os.replace(tmp, self.path)
+            self._write_index(0, len(tail))
+
+    def wait(self) -> None:
+        """Block until a running background compaction has finished."""
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def _migrate_legacy(self) -> None:
+        """Import the pre-JSONL .agent/session.json into the default session once."""
+        if self.name != "default" or self.path.exists() or not LEGACY_SESSION_FILE.exists():
+            return
+        try:
+            data = json.loads(LEGACY_SESSION_FILE.read_text())
+        except (OSError, ValueError):
+            return
+        if isinstance(data, list):
+            turns = [item for item in data if _valid_turn(item)]
+            self.checkpoint(turns)
+            self._archive(turns)
+
+    # --- retrieval ---
+
+    def _archive(self, turns: List[Turn]) -> None:
+        records = [
+            {"prompt": user["content"], "answer": answer["content"], "key": _exchange_key(user["content"], answer["content"])}
+            for user, answer in zip(turns, turns[1:])
+            if user["role"] == "user" and answer["role"] == "assistant"
+        ]
+        if not records:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+        with _file_lock(self.lock_path):
+            with open(self.history_path, "ab") as fh:
+                fh.write(data.encode("utf-8"))
+
+    def _refresh_index(self) -> None:
+        """Index archive lines written since the last refresh (by this or any other process)."""
+        try:
+            with open(self.history_path, "rb") as fh:
+                fh.seek(self._history_offset)
+                chunk = fh.read()
+        except OSError:
+            return
+        offset = self._history_offset
+        for line in chunk.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # still being written
+            doc_id = offset
+            offset += len(line)
+            try:
+                record = json.loads(line)
+                prompt, answer = record["prompt"], record["answer"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            self._docs[doc_id] = {"prompt": prompt, "answer": answer, "key": record.get("key", "")}
+            self._index.add(doc_id, f"{prompt}\n{answer}")
+        self._history_offset = offset
+
+    def relevant_context(
+        self,
+        query: str,
+        live_turns: List[Turn],
+        k: int = RETRIEVAL_TOP_K,
+        budget: int = RETRIEVAL_TOKEN_BUDGET,
+    ) -> List[str]:
+        """
+        Up to `k` archived exchanges relevant to `query` that are not in `live_turns`, rendered
+        as one context block of at most `budget` estimated tokens (empty list if none match).
+        """
+        if k <= 0 or budget <= 0:
+            return []
+        self._refresh_index()
+        live = {
+            _exchange_key(user["content"], answer["content"])
+            for user, answer in zip(live_turns, live_turns[1:])
+            if user["role"] == "user" and answer["role"] == "assistant"
+        }
+        exclude = [doc_id for doc_id, doc in self._docs.items() if doc["key"] in live]
+        ranked = self._index.search(query, k, exclude=exclude)
+        rendered = {doc_id: _render_exchange(self._docs[doc_id]) for doc_id, _ in ranked}
+        cost = {doc_id: estimate_tokens(text) for doc_id, text in rendered.items()}
+        chosen = select_within_budget(ranked, cost, budget - estimate_tokens(RETRIEVAL_HEADER))
+        if not chosen:
+            return []
+        return ["\n\n".join([RETRIEVAL_HEADER] + [rendered[doc_id] for doc_id in chosen])]
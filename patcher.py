@@ -1,11 +1,16 @@
 # patcher.py
 import ast
+import difflib
 import json
+import os
 import tomllib
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from llm import client, MODEL
+from cache import DiskCache, cache_key, content_hash
+from edit_format import SEARCH_MARKER, apply_blocks, parse_edit_blocks
+from regions import Excerpt, locate_regions
+from llm import MODEL, PROMPT_CACHE_KEY, RunCancelled, estimate_tokens, get_client, record_usage, scheduler
 
 SYNTH_SYSTEM = (
     "You are a code transformation engine. You will be given the ENTIRE original file and "
@@ -13,6 +18,42 @@ SYNTH_SYSTEM = (
     "Do not add explanations, comments, or code fences."
 )
 
+EDIT_SYSTEM = (
+    "You are a code transformation engine. You will be given the ENTIRE original file and "
+    "a set of instructions. Return ONLY SEARCH/REPLACE blocks that make the change, in file order:\n"
+    "<<<<<<< SEARCH\n"
+    "lines copied exactly from the original\n"
+    "=======\n"
+    "the replacement lines\n"
+    ">>>>>>> REPLACE\n"
+    "Copy just enough surrounding lines into each SEARCH section to make it unique. "
+    "Keep blocks as small and as few as possible. "
+    "Do not add explanations, comments, or code fences."
+)
+
+_REGION_NOTE = (
+    "You will be given EXCERPTS of a large file: lines like "
+    "'⟪cherno: lines 120-480 unchanged and omitted⟫' stand for parts of the file that are not shown. "
+)
+
+REGION_EDIT_SYSTEM = (
+    EDIT_SYSTEM.replace("You will be given the ENTIRE original file and a set of instructions. ", _REGION_NOTE)
+    + " Never include the omitted-lines marker lines in a SEARCH section."
+)
+
+REGION_SYNTH_SYSTEM = (
+    "You are a code transformation engine. " + _REGION_NOTE +
+    "Return the UPDATED EXCERPTS ONLY, keeping every omitted-lines marker line exactly as given "
+    "and in the same order. Do not add explanations, comments, or code fences."
+)
+
+# Edit blocks are requested first for existing files; AGENT_EDIT_BLOCKS=0 always regenerates the whole file.
+EDIT_BLOCKS_ENABLED = os.getenv("AGENT_EDIT_BLOCKS", "1").strip().lower() not in {"0", "false", "no"}
+
+# Model calls one edit may make: the narrowest attempt (region or whole-file edit blocks),
+# then the whole file. Raise it to also try a region rewrite and whole-file edit blocks in between.
+SYNTH_MAX_CALLS = max(1, int(os.getenv("AGENT_SYNTH_MAX_CALLS", "2")))
+
 def validate_generated_code(path: str, contents: str) -> List[str]:
     suffix = Path(path).suffix.lower()
     issues: List[str] = []
@@ -35,29 +76,30 @@ def validate_generated_code(path: str, contents: str) -> List[str]:
     return issues
 
 
-def synthesize_new_contents(path: str, original: str, instructions: str) -> Tuple[Optional[str], List[str]]:
-    """
-    Ask the model to apply 'instructions' to 'original' and return full new file content (string).
-    Returns a tuple of (new_contents, validation_issues).
-    """
+class SynthesisAborted(Exception):
+    """Raised when the user stops a synthesis (Ctrl-C, or a cancelled run) before the model finished."""
+
+
+def _build_input(
+    system: str, path: str, original: str, instructions: str, context: str = "", label: str = "FILE"
+) -> List[dict]:
     def part(role: str, text: str):
         # Responses API uses content parts, not Chat 'messages'
         return {"role": role, "content": [{"type": "input_text", "text": text}]}
 
-    input_msgs = [
-        part("system", SYNTH_SYSTEM),
+    related = f"SIGNATURES OF IMPORTED MODULES:\n{context}\n\n" if context else ""
+    return [
+        part("system", system),
+        # Instructions go last so requests for the same file share the longest possible prefix.
         part(
             "user",
-            f"File path: {path}\n\n--- ORIGINAL FILE START ---\n{original}\n--- ORIGINAL FILE END ---\n\nINSTRUCTIONS:\n{instructions}",
+            f"File path: {path}\n\n--- ORIGINAL {label} START ---\n{original}\n--- ORIGINAL {label} END ---\n\n"
+            f"{related}INSTRUCTIONS:\n{instructions}",
         ),
     ]
 
-    resp = client.responses.create(
-        model=MODEL,
-        input=input_msgs,   # <-- IMPORTANT: use 'input', not 'messages'
-        # no temperature here per your note
-    )
 
+def _response_text(resp) -> str:
     # Prefer .output_text if available
     text = getattr(resp, "output_text", "") or ""
 
@@ -68,12 +110,11 @@ def synthesize_new_contents(path: str, original: str, instructions: str) -> Tupl
                 if isinstance(frag, dict) and frag.get("type") == "output_text":
                     parts.append(frag.get("text", ""))
         text = "".join(parts)
+    return text
 
-    text = (text or "").strip()
-    if not text:
-        return None, []
 
-    # Strip accidental code fences
+def strip_code_fences(text: str) -> str:
+    text = (text or "").strip()
     if text.startswith("```"):
         lines = text.splitlines()
         if lines and lines[0].startswith("```"):
@@ -81,9 +122,276 @@ def synthesize_new_contents(path: str, original: str, instructions: str) -> Tupl
         if lines and lines[-1].startswith("```"):
             lines = lines[:-1]
         text = "\n".join(lines).strip()
+    return text
+
+
+def _output_tokens(usage: Any) -> Optional[int]:
+    if usage is None:
+        return None
+    value = usage.get("output_tokens") if isinstance(usage, dict) else getattr(usage, "output_tokens", None)
+    return int(value) if value is not None else None
+
+
+def _stream_text(input_msgs: List[dict], on_delta: Callable[[str], None]) -> Tuple[str, Any]:
+    """
+    Stream output text deltas, calling on_delta with the text received so far.
+    Ctrl-C, or scheduler.cancel() from another thread, closes the HTTP stream, which
+    stops generation (and billing) server-side.
+    Returns (text, usage).
+    """
+    try:
+        stream = scheduler.create(
+            "synthesize", client=get_client(), model=MODEL, input=input_msgs, stream=True, prompt_cache_key=PROMPT_CACHE_KEY
+        )
+    except RunCancelled as exc:
+        raise SynthesisAborted("Synthesis aborted by user.") from exc
+    chunks: List[str] = []
+    usage = None
+    try:
+        for event in stream:
+            if scheduler.cancelled:
+                break
+            event_type = getattr(event, "type", "")
+            if event_type == "response.output_text.delta":
+                chunks.append(getattr(event, "delta", "") or "")
+                on_delta("".join(chunks))
+            elif event_type == "response.completed":
+                usage = getattr(getattr(event, "response", None), "usage", None)
+                record_usage("synthesize", usage)
+            elif event_type in ("response.failed", "error"):
+                raise RuntimeError(f"Streaming synthesis failed: {event_type}")
+    except KeyboardInterrupt as exc:
+        raise SynthesisAborted("Synthesis aborted by user.") from exc
+    except Exception as exc:
+        if scheduler.cancelled:  # the stream was closed under us
+            raise SynthesisAborted("Synthesis aborted by user.") from exc
+        raise
+    finally:
+        stream.close()
+    if scheduler.cancelled:
+        raise SynthesisAborted("Synthesis aborted by user.")
+    return "".join(chunks), usage
+
+
+def _request_text(input_msgs: List[dict], on_delta: Optional[Callable[[str], None]]) -> Tuple[str, Any]:
+    if on_delta is not None:
+        return _stream_text(input_msgs, on_delta)
+    try:
+        resp = scheduler.create(
+            "synthesize",
+            client=get_client(),
+            model=MODEL,
+            input=input_msgs,   # <-- IMPORTANT: use 'input', not 'messages'
+            prompt_cache_key=PROMPT_CACHE_KEY,
+            # no temperature here per your note
+        )
+    except RunCancelled as exc:
+        raise SynthesisAborted("Synthesis aborted by user.") from exc
+    return _response_text(resp), getattr(resp, "usage", None)
 
+
+def apply_edit_response(original: str, text: str) -> Tuple[Optional[str], List[str]]:
+    """Apply a SEARCH/REPLACE response to original. Returns (new_text, failures)."""
+    try:
+        blocks = parse_edit_blocks(text)
+    except ValueError as exc:
+        return None, [str(exc)]
+    if not blocks:
+        return None, ["Response contained no SEARCH/REPLACE blocks"]
+    return apply_blocks(original, blocks)
+
+
+def synthesize_new_contents(
+    path: str,
+    original: str,
+    instructions: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    cache: Optional[DiskCache] = None,
+    context: str = "",
+) -> Tuple[Optional[str], List[str]]:
+    """
+    Ask the model to apply 'instructions' to 'original' and return full new file content (string).
+    Existing files are edited through SEARCH/REPLACE blocks applied locally; the whole file is
+    regenerated only when the blocks do not apply.
+    With on_delta, the response is streamed and on_delta receives the raw text so far
+    (for a region-scoped synthesis, with the omitted-lines markers expanded back into the
+    original lines, so it can be previewed against the whole file).
+    If a stats dict is given it is filled with the mode used and output-token figures.
+    With a cache, an identical earlier request (same model, prompts, instructions and
+    original contents) is answered from disk without calling the model.
+    context (signatures of the modules the file imports) is shown to the model alongside the file.
+    Returns a tuple of (new_contents, validation_issues).
+    """
+    stats = stats if stats is not None else {}
+    key = None
+    if cache is not None:
+        systems = [EDIT_SYSTEM, SYNTH_SYSTEM] if EDIT_BLOCKS_ENABLED else [SYNTH_SYSTEM]
+        key = cache_key("synthesize", MODEL, systems, path, instructions, content_hash(original), *([context] if context else []))
+        hit = cache.get(key)
+        if hit is not None:
+            stats.update(hit.get("stats", {}), cached=True)
+            return hit["text"], hit["issues"]
+
+    new_text, issues = _synthesize(path, original, instructions, on_delta, stats, context)
+    if key is not None and new_text:
+        cache.put(key, {"text": new_text, "issues": issues, "stats": stats})
+    return new_text, issues
+
+
+def _synthesize(
+    path: str,
+    original: str,
+    instructions: str,
+    on_delta: Optional[Callable[[str], None]],
+    stats: Dict[str, Any],
+    context: str = "",
+) -> Tuple[Optional[str], List[str]]:
+    regions = locate_regions(path, original, instructions)
+    attempts: List[str] = []
+    if regions:
+        attempts += ["region_blocks", "region_full"] if EDIT_BLOCKS_ENABLED else ["region_full"]
+    if EDIT_BLOCKS_ENABLED and original.strip():
+        attempts.append("edit_blocks")
+    excerpt = Excerpt(original, regions) if regions else None
+    # The full-file request always stays last; only the narrower attempts before it are capped.
+    for attempt in attempts[: SYNTH_MAX_CALLS - 1]:
+        if excerpt is not None and not attempt.startswith("region"):
+            stats["region_fallback"] = True
+        if attempt == "edit_blocks":
+            result = _synthesize_edit_blocks(path, original, instructions, on_delta, stats, context)
+        else:
+            blocks = attempt == "region_blocks"
+            result = _synthesize_region(path, original, excerpt, instructions, blocks, on_delta, stats, context)
+        if result is not None:
+            return result
+    if excerpt is not None:
+        stats["region_fallback"] = True
+
+    text, usage = _request_text(_build_input(SYNTH_SYSTEM, path, original, instructions, context), on_delta)
+
+    # Strip accidental code fences
+    text = strip_code_fences(text)
     if not text:
         return None, []
 
+    stats.update(mode="full_file", output_tokens=_output_tokens(usage) or estimate_tokens(text))
     issues = validate_generated_code(path, text)
     return text, issues
+
+
+def _synthesize_edit_blocks(
+    path: str,
+    original: str,
+    instructions: str,
+    on_delta: Optional[Callable[[str], None]],
+    stats: Dict[str, Any],
+    context: str,
+) -> Optional[Tuple[Optional[str], List[str]]]:
+    """Edit the whole file through SEARCH/REPLACE blocks. Returns None if they do not apply."""
+    text, usage = _request_text(_build_input(EDIT_SYSTEM, path, original, instructions, context), on_delta)
+    new_text, failures = apply_edit_response(original, text)
+    edit_tokens = _output_tokens(usage) or estimate_tokens(text)
+    if new_text is None:
+        stats.update(edit_block_failures=failures, edit_block_tokens=edit_tokens)
+        return None
+    full_tokens = estimate_tokens(new_text)
+    stats.update(
+        mode="edit_blocks",
+        output_tokens=edit_tokens,
+        full_file_tokens_estimate=full_tokens,
+        saved_tokens_estimate=max(0, full_tokens - edit_tokens),
+    )
+    return new_text, validate_generated_code(path, new_text)
+
+
+def _synthesize_region(
+    path: str,
+    original: str,
+    excerpt: Excerpt,
+    instructions: str,
+    blocks: bool,
+    on_delta: Optional[Callable[[str], None]],
+    stats: Dict[str, Any],
+    context: str,
+) -> Optional[Tuple[Optional[str], List[str]]]:
+    """
+    Synthesize only the located regions of a large file, as edit blocks or as rewritten
+    excerpts, and splice them back. Returns None if the response can't be spliced.
+    """
+    if on_delta is not None:
+        # Live previews diff against the whole file, so omitted stretches are filled back in.
+        report = on_delta
+        on_delta = lambda partial: report(excerpt.expand(partial))
+    system = REGION_EDIT_SYSTEM if blocks else REGION_SYNTH_SYSTEM
+    text, usage = _request_text(_build_input(system, path, excerpt.text, instructions, context, label="EXCERPTS"), on_delta)
+    if blocks:
+        new_excerpt, _ = apply_edit_response(excerpt.text, text)
+    else:
+        text = strip_code_fences(text)
+        new_excerpt = text or None
+    new_text = excerpt.splice(new_excerpt) if new_excerpt is not None else None
+    if new_text is None:
+        return None
+    full_tokens = estimate_tokens(original)
+    region_tokens = _output_tokens(usage) or estimate_tokens(text)
+    stats.update(
+        mode="region_blocks" if blocks else "region_full",
+        output_tokens=region_tokens,
+        full_file_tokens_estimate=full_tokens,
+        saved_tokens_estimate=max(0, full_tokens - region_tokens),
+        region_lines=excerpt.line_count,
+        file_lines=len(excerpt.lines),
+        regions=len(excerpt.regions),
+    )
+    # Validation always covers the reassembled file, never just the excerpt.
+    return new_text, validate_generated_code(path, new_text)
+
+
+class PartialPreview:
+    """
+    preview_partial_contents for one stream that is redrawn many times. Each update aligns
+    only the lines completed since the previous one, against the part of the original not
+    reached yet, so a redraw costs one pass over the file instead of a whole-file
+    SequenceMatcher run. A response that does not extend the previous one (a fallback
+    request started a new stream) starts the alignment over.
+    """
+
+    def __init__(self, original: str) -> None:
+        self.original = original
+        self._old = original.splitlines(keepends=True)
+        self._done: List[str] = []
+        self._done_text = ""
+        self._resume_at = 0
+
+    def update(self, partial: str) -> str:
+        if SEARCH_MARKER in partial:
+            new_text, _ = apply_blocks(self.original, parse_edit_blocks(partial, complete_only=True))
+            return new_text if new_text is not None else self.original
+        if partial.startswith("```"):
+            partial = partial.split("\n", 1)[1] if "\n" in partial else ""
+        done_text = partial[: partial.rfind("\n") + 1]
+        if not done_text.startswith(self._done_text):
+            self._done, self._done_text, self._resume_at = [], "", 0
+        added = done_text[len(self._done_text):].splitlines(keepends=True)
+        if added:
+            rest = self._old[self._resume_at:]
+            matcher = difflib.SequenceMatcher(None, rest, added, autojunk=False)
+            ends = [block.a + block.size for block in matcher.get_matching_blocks() if block.size]
+            if ends:
+                self._resume_at += ends[-1]
+            self._done += added
+            self._done_text = done_text
+        if not self._done:
+            return self.original
+        return "".join(self._done + self._old[self._resume_at:])
+
+
+def preview_partial_contents(original: str, partial: str) -> str:
+    """
+    Best guess at the final file while a synthesis is still streaming: the complete lines
+    received so far, followed by whatever of the original has not been "reached" yet.
+    For an edit-block response, the blocks completed so far applied to the original.
+    Diffing this against the original shows only the changes made so far.
+    """
+    return PartialPreview(original).update(partial)
@@ -1,17 +1,35 @@
 # planner.py
 from pathlib import Path
-from typing import Dict, Any, List, TypedDict, Literal, Optional
+from typing import Callable, Dict, Any, List, TypedDict, Literal, Optional, Tuple
 
 class Step(TypedDict, total=False):
-    kind: Literal["read_file", "synthesize_patch", "show_diff", "write_file", "run_command", "error"]
+    kind: Literal["read_file", "synthesize_patch", "apply_patch", "synthesize_files", "show_diff", "write_file", "run_command", "search_code", "error"]
     path: Optional[str]
     contents: Optional[str]
     instructions: Optional[str]
+    patch: Optional[str]
     command: Optional[str]
     args: Optional[List[str]]
     message: Optional[str]
+    edits: Optional[List[Dict[str, Any]]]
+    resolved_from: Optional[str]
+    pattern: Optional[str]
+    literal: Optional[bool]
+    globs: Optional[List[str]]
+    max_results: Optional[int]
 
-def plan_from_intent(intent: Dict[str, Any]) -> List[Step]:
+PathResolver = Callable[[str], Optional[str]]
+
+def _existing_path(path: str, resolve_path: Optional[PathResolver]) -> Tuple[Optional[str], Optional[str]]:
+    """(path to use, path the model gave if it had to be corrected); (None, None) if nothing fits."""
+    if Path(path).exists():
+        return path, None
+    resolved = resolve_path(path) if resolve_path else None
+    if resolved and Path(resolved).exists():
+        return resolved, path
+    return None, None
+
+def plan_from_intent(intent: Dict[str, Any], resolve_path: Optional[PathResolver] = None) -> List[Step]:
     t = intent.get("type")
     if t == "create_file":
         return [
@@ -19,16 +37,20 @@ def plan_from_intent(intent: Dict[str, Any]) -> List[Step]:
             {"kind": "write_file", "path": intent["path"], "contents": intent["contents"]},
         ]
     if t == "edit_file":
-        path = intent["path"]
-        if not Path(path).exists():
+        path, typed = _existing_path(intent["path"], resolve_path)
+        if path is None:
             return [
-                {"kind": "error", "path": path, "message": f"Target file '{path}' does not exist."}
+                {"kind": "error", "path": intent["path"], "message": f"Target file '{intent['path']}' does not exist."}
             ]
         steps: List[Step] = [{"kind": "read_file", "path": path}]
+        if typed:
+            steps[0]["resolved_from"] = typed
         if intent.get("patch"):
+            # The patch is applied to the file read above (unified diff or SEARCH/REPLACE blocks).
             steps += [
-                {"kind": "show_diff", "path": path, "contents": intent["patch"]},
-                {"kind": "write_file", "path": path, "contents": intent["patch"]},
+                {"kind": "apply_patch", "path": path, "patch": intent["patch"], "instructions": intent["instructions"]},
+                {"kind": "show_diff", "path": path},   # contents will be filled at runtime
+                {"kind": "write_file", "path": path},   # contents will be filled at runtime
             ]
         else:
             steps += [
@@ -37,6 +59,42 @@ def plan_from_intent(intent: Dict[str, Any]) -> List[Step]:
                 {"kind": "write_file", "path": path},   # contents will be filled at runtime
             ]
         return steps
+    if t == "multi_edit":
+        edits, missing, renamed = [], [], {}
+        for edit in intent["edits"]:
+            path, typed = _existing_path(edit["path"], resolve_path)
+            if path is None:
+                missing.append(edit["path"])
+                continue
+            if typed:
+                renamed[path] = typed
+            edits.append({**edit, "path": path})
+        if missing:
+            return [
+                {"kind": "error", "path": missing[0], "message": f"Target file(s) do not exist: {', '.join(missing)}."}
+            ]
+        paths = list(dict.fromkeys(e["path"] for e in edits))
+        if len(paths) != len(edits):
+            return [{"kind": "error", "message": "multi_edit lists the same file more than once."}]
+        # All files are synthesized together, previewed as one diff and written in one commit.
+        multi: List[Step] = [{"kind": "read_file", "path": path} for path in paths]
+        for step in multi:
+            if step["path"] in renamed:
+                step["resolved_from"] = renamed[step["path"]]
+        multi.append({"kind": "synthesize_files", "edits": edits})
+        multi += [{"kind": "show_diff", "path": path} for path in paths]
+        multi += [{"kind": "write_file", "path": path} for path in paths]
+        return multi
     if t == "run_command":
         return [{"kind": "run_command", "command": intent["command"], "args": intent.get("args", [])}]
+    if t == "search_code":
+        return [
+            {
+                "kind": "search_code",
+                "pattern": intent["pattern"],
+                "literal": intent.get("literal", False),
+                "globs": intent.get("globs") or [],
+                "max_results": intent.get("max_results", 50),
+            }
+        ]
     raise ValueError(f"Unsupported intent type in planner: {t}")
@@ -2,9 +2,10 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from command_safety import analyze_command, dry_run_required
+from providers.output_buffer import truncate_output
 
 
 class E2BSandbox:
@@ -12,17 +13,28 @@ class E2BSandbox:
     E2B sandbox provider with basic resource limits and safety checks.
     """
 
-    def __init__(self, template: Optional[str] = None, cwd: Optional[str] = None, envs: Optional[dict] = None) -> None:
-        try:
-            from e2b import Sandbox  # type: ignore
-            self._pkg = "e2b"
-        except Exception:
-            from e2b_code_interpreter import Sandbox  # type: ignore
-            self._pkg = "e2b_code_interpreter"
-
-        api_key = os.getenv("E2B_API_KEY")
-        if not api_key:
-            raise RuntimeError("E2B_API_KEY not set. Export it in your environment or .env.")
+    def __init__(
+        self,
+        template: Optional[str] = None,
+        cwd: Optional[str] = None,
+        envs: Optional[dict] = None,
+        sdk: Optional[Callable[..., Any]] = None,
+    ) -> None:
+        # `sdk` replaces the SDK's Sandbox class (e.g. providers.fake_e2b.FakeSandbox offline).
+        if sdk is not None:
+            Sandbox = sdk
+            self._pkg = getattr(sdk, "__module__", "custom")
+        else:
+            try:
+                from e2b import Sandbox  # type: ignore
+                self._pkg = "e2b"
+            except Exception:
+                from e2b_code_interpreter import Sandbox  # type: ignore
+                self._pkg = "e2b_code_interpreter"
+
+            api_key = os.getenv("E2B_API_KEY")
+            if not api_key:
+                raise RuntimeError("E2B_API_KEY not set. Export it in your environment or .env.")
 
         self._cpu_limit = int(os.getenv("E2B_CPU_LIMIT", "2"))
         self._memory_limit_mb = int(os.getenv("E2B_MEMORY_LIMIT_MB", "2048"))
@@ -37,7 +49,7 @@ class E2BSandbox:
         self._apply_resource_limits()
         self._cwd = cwd
 
-    def run(self, command: str, args: List[str]) -> Tuple[int, str, str]:
+    def run(self, command: str, args: List[str], cwd: Optional[str] = None) -> Tuple[int, str, str]:
         analysis = analyze_command(command, args)
         if analysis.risk == "block":
             reasons = "; ".join(analysis.reasons) or "Command blocked by sandbox safety policy."
@@ -47,7 +59,7 @@ class E2BSandbox:
 
         cmd = " ".join([command, *[self._shell_quote(a) for a in args]]).strip()
 
-        run_kwargs: Dict[str, Any] = {"cmd": cmd, "cwd": self._cwd}
+        run_kwargs: Dict[str, Any] = {"cmd": cmd, "cwd": cwd or self._cwd}
         if self._timeout_sec:
             run_kwargs["timeout"] = self._timeout_sec
         try:
@@ -78,6 +90,45 @@ class E2BSandbox:
 
         return int(code), out, err
 
+    # --- file transfer (used by providers.workspace_sync) ---
+
+    def shell(self, cmd: str, cwd: Optional[str] = None) -> Tuple[int, str, str]:
+        """Run an internal shell command, bypassing the command policy. Never for model input."""
+        try:
+            result = self._sbx.commands.run(cmd=cmd, cwd=cwd)
+        except Exception as ex:
+            if getattr(ex, "exit_code", None) is None:
+                raise
+            result = ex  # newer SDKs raise on a non-zero exit, carrying the same fields
+        out = getattr(result, "stdout", "") or ""
+        err = getattr(result, "stderr", "") or ""
+        if isinstance(out, (bytes, bytearray)):
+            out = out.decode("utf-8", errors="replace")
+        if isinstance(err, (bytes, bytearray)):
+            err = err.decode("utf-8", errors="replace")
+        return int(getattr(result, "exit_code", 0) or 0), out, err
+
+    def write_bytes(self, path: str, data: bytes) -> None:
+        self._sbx.files.write(path, data)
+
+    @property
+    def can_read_files(self) -> bool:
+        return callable(getattr(getattr(self._sbx, "files", None), "read", None))
+
+    def read_bytes(self, path: str) -> bytes:
+        data = self._sbx.files.read(path, format="bytes")
+        return bytes(data) if not isinstance(data, str) else data.encode("utf-8", "surrogateescape")
+
+    def healthy(self) -> bool:
+        """Whether the remote sandbox is still up (the service reclaims it after its timeout)."""
+        is_running = getattr(self._sbx, "is_running", None)
+        if not callable(is_running):
+            return True
+        try:
+            return bool(is_running())
+        except Exception:
+            return False
+
     def close(self) -> None:
         try:
             if getattr(self, "_sbx", None):
@@ -128,11 +179,5 @@ class E2BSandbox:
                         continue
 
     def _truncate_output(self, data: str) -> str:
-        if self._max_output_bytes <= 0:
-            return data
-        encoded = data.encode("utf-8")
-        if len(encoded) <= self._max_output_bytes:
-            return data
-        truncated = encoded[: self._max_output_bytes].decode("utf-8", errors="ignore")
-        omitted = len(encoded) - self._max_output_bytes
-        return f"{truncated}\n...[truncated {omitted} bytes]"
+        # Same head+tail cap as LocalSandbox applies while streaming.
+        return truncate_output(data, self._max_output_bytes)
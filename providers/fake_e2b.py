@@ -0,0 +1,131 @@
+# providers/fake_e2b.py
+"""
+Offline stand-in for the E2B SDK's `Sandbox`, for tests and benchmarks of the sandbox
+pool and workspace sync. It implements the slice of the SDK that E2BSandbox uses
+(`commands.run`, `files.write`/`files.read`, `is_running`, `set_timeout`, `kill`).
+Boot latency and upload bandwidth are simulated with `boot_sec` and
+`upload_bytes_per_sec`. Commands run locally through the shell, and
+files live in a private temporary directory that stands in for the remote filesystem
+(sandbox paths are mapped under it).
+
+It is NOT a sandbox: commands run on the host, unconfined and without the allowlist. Tests
+and benchmarks inject it (`E2BSandbox(sdk=FakeSandbox)`, or `sandbox.E2B_SDK` for pools
+built by make_sandbox); .agent/sandbox.json cannot select it.
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+HOME = "/home/user"
+
+
+class CommandResult(NamedTuple):
+    stdout: str
+    stderr: str
+    exit_code: int
+
+
+class _Commands:
+    def __init__(self, sandbox: "FakeSandbox") -> None:
+        self._sandbox = sandbox
+
+    def run(self, cmd: str, cwd: Optional[str] = None, envs: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> CommandResult:
+        sandbox = self._sandbox
+        if not sandbox.is_running():
+            raise RuntimeError(f"sandbox {sandbox.sandbox_id} is not running")
+        sandbox.commands_run += 1
+        env = dict(os.environ, HOME=sandbox.local_path(HOME), **(sandbox.envs or {}), **(envs or {}))
+        proc = subprocess.run(
+            cmd,
+            shell=True,
+            cwd=sandbox.local_path(cwd or HOME),
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout or None,
+        )
+        return CommandResult(proc.stdout, proc.stderr, proc.returncode)
+
+
+class _Files:
+    def __init__(self, sandbox: "FakeSandbox") -> None:
+        self._sandbox = sandbox
+
+    def write(self, path: str, data) -> None:
+        if not self._sandbox.is_running():
+            raise RuntimeError(f"sandbox {self._sandbox.sandbox_id} is not running")
+        if self._sandbox.upload_bytes_per_sec:
+            time.sleep(len(data) / self._sandbox.upload_bytes_per_sec)  # one upload stream's bandwidth
+        local = self._sandbox.local_path(path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with open(local, "wb") as fh:
+            fh.write(data.encode("utf-8") if isinstance(data, str) else data)
+        self._sandbox.bytes_written += len(data)
+
+    def read(self, path: str, format: str = "text"):
+        if not self._sandbox.is_running():
+            raise RuntimeError(f"sandbox {self._sandbox.sandbox_id} is not running")
+        with open(self._sandbox.local_path(path), "rb") as fh:
+            data = fh.read()
+        return data if format == "bytes" else data.decode("utf-8")
+
+
+class FakeSandbox:
+    # Seconds each boot sleeps, like the round trip that creates a real sandbox.
+    boot_sec = float(os.getenv("FAKE_E2B_BOOT_SEC", "0"))
+    # Bytes per second of each files.write call (0: unlimited), like one HTTP upload.
+    upload_bytes_per_sec = float(os.getenv("FAKE_E2B_UPLOAD_BPS", "0"))
+
+    _ids = itertools.count(1)
+    _lock = threading.Lock()
+    created = 0
+    killed = 0
+
+    def __init__(self, template: Optional[str] = None, envs: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> None:
+        if self.boot_sec:
+            time.sleep(self.boot_sec)
+        with FakeSandbox._lock:
+            FakeSandbox.created += 1
+            self.sandbox_id = f"fake-{next(FakeSandbox._ids)}"
+        self.template = template
+        self.envs = envs
+        self.timeout = timeout
+        self.commands_run = 0
+        self.bytes_written = 0
+        self.commands = _Commands(self)
+        self.files = _Files(self)
+        self._root = tempfile.mkdtemp(prefix="cherno-fake-e2b-")
+        os.makedirs(self.local_path(HOME), exist_ok=True)
+        self._running = True
+
+    def local_path(self, path: str) -> str:
+        """Where sandbox path `path` lives on the local disk."""
+        return os.path.join(self._root, os.path.normpath("/" + path).lstrip("/"))
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def set_timeout(self, timeout: float) -> None:
+        self.timeout = timeout
+
+    def expire(self) -> None:
+        """Simulate the service reclaiming the sandbox (its timeout ran out)."""
+        self._running = False
+
+    def kill(self) -> None:
+        if self._running or os.path.isdir(self._root):
+            with FakeSandbox._lock:
+                FakeSandbox.killed += 1
+        self._running = False
+        shutil.rmtree(self._root, ignore_errors=True)
+
+
+# The SDK's class name, so `from providers.fake_e2b import Sandbox` reads like the real import.
+Sandbox = FakeSandbox
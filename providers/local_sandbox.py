@@ -1,23 +1,129 @@
 # providers/local_sandbox.py
 from __future__ import annotations
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from executor import load_policy, is_allowed
+from providers.output_buffer import MAX_OUTPUT_BYTES, LineSplitter, OutputBuffer, universal_newlines
+import os
+import queue
+import selectors
 import subprocess
-import shlex
+import tempfile
+import threading
+import time
+
+READ_CHUNK = 65536
+
+# (stream name, line) -> None; stream name is "stdout" or "stderr".
+OutputCallback = Callable[[str, str], None]
+
+
+def _pump_selectors(proc: subprocess.Popen, deadline: float, sink: Callable[[str, bytes], None]) -> bool:
+    """Read stdout and stderr as data arrives. Returns False if the deadline passed first."""
+    with selectors.DefaultSelector() as sel:
+        sel.register(proc.stdout, selectors.EVENT_READ, "stdout")
+        sel.register(proc.stderr, selectors.EVENT_READ, "stderr")
+        while sel.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            for key, _ in sel.select(remaining):
+                chunk = os.read(key.fd, READ_CHUNK)
+                if chunk:
+                    sink(key.data, chunk)
+                else:
+                    sel.unregister(key.fileobj)
+    return True
+
+
+def _pump_threads(proc: subprocess.Popen, deadline: float, sink: Callable[[str, bytes], None]) -> bool:
+    # Windows cannot select() on pipes: one reader thread per stream, chunks handed over a queue.
+    chunks: "queue.Queue[Tuple[str, bytes]]" = queue.Queue()
+
+    def reader(name: str, pipe) -> None:
+        for chunk in iter(lambda: pipe.read1(READ_CHUNK), b""):
+            chunks.put((name, chunk))
+        chunks.put((name, b""))
+
+    for name, pipe in (("stdout", proc.stdout), ("stderr", proc.stderr)):
+        threading.Thread(target=reader, args=(name, pipe), daemon=True).start()
+    open_streams = 2
+    while open_streams:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            name, chunk = chunks.get(timeout=remaining)
+        except queue.Empty:
+            return False
+        if chunk:
+            sink(name, chunk)
+        else:
+            open_streams -= 1
+    return True
+
 
 class LocalSandbox:
+    # main.py renders lines live when a sandbox accepts `on_output`.
+    streams_output = True
+
     def __init__(self) -> None:
         self.policy = load_policy()
+        self.max_output_bytes = int(self.policy.get("max_output_bytes", MAX_OUTPUT_BYTES))
+        # Full output of the last command whose output was truncated, else None.
+        self.last_log: Optional[str] = None
 
-    def run(self, command: str, args: List[str]) -> Tuple[int, str, str]:
+    def run(self, command: str, args: List[str], on_output: Optional[OutputCallback] = None) -> Tuple[int, str, str]:
+        """
+        Run the command with stdout and stderr read concurrently as they are produced.
+        Each stream keeps a bounded head and tail in memory (see providers.output_buffer),
+        the whole interleaved output is spooled to a temporary file, and `on_output`
+        receives every line as it completes. The returned text has universal newlines,
+        as text-mode pipes gave it before; the byte cap applies to the raw output.
+        """
         allow = self.policy.get("allowlist", [])
         timeout = int(self.policy.get("timeout_sec", 30))
 
         if not is_allowed(command, allow):
             raise PermissionError(f"Command '{command}' not in allowlist: {allow}")
 
-        proc = subprocess.run([command, *args], capture_output=True, text=True, timeout=timeout)
-        return proc.returncode, proc.stdout, proc.stderr
+        buffers: Dict[str, OutputBuffer] = {"stdout": OutputBuffer(self.max_output_bytes), "stderr": OutputBuffer(self.max_output_bytes)}
+        splitters: Dict[str, LineSplitter] = {}
+        if on_output is not None:
+            splitters = {name: LineSplitter(lambda line, name=name: on_output(name, line)) for name in buffers}
+        spool = tempfile.NamedTemporaryFile(prefix="cherno-cmd-", suffix=".log", delete=False)
+        self.last_log = None
+
+        def sink(name: str, chunk: bytes) -> None:
+            buffers[name].write(chunk)
+            spool.write(chunk)
+            if name in splitters:
+                splitters[name].feed(chunk)
+
+        pump = _pump_threads if os.name == "nt" else _pump_selectors
+        try:
+            proc = subprocess.Popen([command, *args], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            with proc:
+                finished = pump(proc, time.monotonic() + timeout, sink)
+                if not finished:
+                    proc.kill()
+                for splitter in splitters.values():
+                    splitter.close()
+                if not finished:
+                    raise subprocess.TimeoutExpired(
+                        [command, *args], timeout, output=self._text(buffers["stdout"]), stderr=self._text(buffers["stderr"])
+                    )
+                code = proc.wait()
+        finally:
+            spool.close()
+            if any(buffer.truncated for buffer in buffers.values()):
+                self.last_log = spool.name
+            else:
+                os.unlink(spool.name)
+        return code, self._text(buffers["stdout"]), self._text(buffers["stderr"])
+
+    @staticmethod
+    def _text(buffer: OutputBuffer) -> str:
+        return universal_newlines(buffer.text())
 
     def close(self) -> None:
         pass
@@ -0,0 +1,99 @@
+# providers/output_buffer.py
+"""
+Bounded capture of command output, shared by the sandbox providers.
+
+At most `max_bytes` of a stream are kept: the first half and the most recent half. If
+the stream was longer, the two halves are joined by a "...[truncated N bytes]" line,
+where N is how many bytes went beyond the cap. A cap of 0 or less keeps everything. Cuts
+fall on UTF-8 character boundaries (a split character is dropped), so a truncated text
+may come out a few bytes shorter than the cap.
+"""
+from __future__ import annotations
+
+import codecs
+import os
+from typing import Callable, List
+
+MAX_OUTPUT_BYTES = int(os.getenv("AGENT_MAX_OUTPUT_BYTES", str(1_048_576)))
+# Longest partial line held back for live rendering before it is emitted anyway.
+MAX_PENDING_LINE_CHARS = 4096
+
+
+class OutputBuffer:
+    """Head and tail of a byte stream, in memory bounded by about twice `max_bytes`."""
+
+    def __init__(self, max_bytes: int = MAX_OUTPUT_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._tail_cap = max_bytes // 2 if max_bytes > 0 else 0
+        self._head_cap = max_bytes - self._tail_cap if max_bytes > 0 else -1
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    def write(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        if self._head_cap < 0:
+            self._head += chunk
+            return
+        room = self._head_cap - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self._tail += chunk
+            if len(self._tail) > 2 * self._tail_cap:
+                del self._tail[: len(self._tail) - self._tail_cap]  # amortised ring buffer
+
+    @property
+    def truncated(self) -> bool:
+        return self.max_bytes > 0 and self.total > self.max_bytes
+
+    def text(self) -> str:
+        if not self.truncated:
+            return (bytes(self._head) + bytes(self._tail)).decode("utf-8", errors="replace")
+        head = bytes(self._head).decode("utf-8", errors="ignore")
+        tail = bytes(self._tail[len(self._tail) - self._tail_cap:]).decode("utf-8", errors="ignore") if self._tail_cap else ""
+        omitted = self.total - self.max_bytes
+        return f"{head}\n...[truncated {omitted} bytes]\n{tail}" if tail else f"{head}\n...[truncated {omitted} bytes]"
+
+
+def truncate_output(data: str, max_bytes: int = MAX_OUTPUT_BYTES) -> str:
+    """`data` capped as an OutputBuffer would cap it when streamed."""
+    if max_bytes <= 0:
+        return data
+    encoded = data.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return data
+    buffer = OutputBuffer(max_bytes)
+    buffer.write(encoded)
+    return buffer.text()
+
+
+def universal_newlines(text: str) -> str:
+    """"\r\n" and lone "\r" as "\n", like text-mode pipes (`subprocess.run(..., text=True)`)."""
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class LineSplitter:
+    """Turns byte chunks into complete lines (without the newline) for live rendering."""
+
+    def __init__(self, emit: Callable[[str], None]) -> None:
+        self._emit = emit
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+
+    def feed(self, chunk: bytes) -> None:
+        self._pending += self._decoder.decode(chunk)
+        lines: List[str] = self._pending.split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._emit(line.rstrip("\r"))
+        if len(self._pending) > MAX_PENDING_LINE_CHARS:
+            self._emit(self._pending)  # a progress bar that never ends its line
+            self._pending = ""
+
+    def close(self) -> None:
+        self._pending += self._decoder.decode(b"", final=True)
+        if self._pending:
+            self._emit(self._pending.rstrip("\r"))
+        self._pending = ""
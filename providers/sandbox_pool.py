@@ -0,0 +1,233 @@
+# providers/sandbox_pool.py
+"""
+Pool of warm remote sandboxes shared by every Engine in the process.
+
+Nothing boots until the first command. The first `acquire` creates a sandbox (or waits
+for one that is already booting). After that a maintenance thread keeps `prewarm` spare
+sandboxes booted while the pool is in use. Released sandboxes go back to the idle list
+and are reused by later commands and prompts. Sandboxes idle for longer than
+`idle_ttl` are killed, and once the pool itself has gone unused that long it stops
+pre-warming.
+
+Before an idle sandbox is reused it gets a health check if it has idled past
+HEALTH_CHECK_AFTER_SEC or its last command failed. The remote service reclaims
+sandboxes on its own schedule, and a dead one is replaced rather than handed out.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from providers.workspace_sync import WorkspaceSync
+
+PREWARM = int(os.getenv("E2B_POOL_PREWARM", "1"))
+IDLE_TTL_SEC = float(os.getenv("E2B_POOL_IDLE_TTL_SEC", "300"))
+MAX_SANDBOXES = int(os.getenv("E2B_POOL_MAX", "4"))
+# A sandbox released more recently than this is assumed alive without asking the service.
+HEALTH_CHECK_AFTER_SEC = 10.0
+
+
+def _healthy(sandbox: Any) -> bool:
+    check = getattr(sandbox, "healthy", None)
+    return bool(check()) if callable(check) else True
+
+
+def _close(sandbox: Any) -> None:
+    try:
+        sandbox.close()
+    except Exception:
+        pass
+
+
+class SandboxPool:
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        prewarm: int = PREWARM,
+        idle_ttl: float = IDLE_TTL_SEC,
+        max_size: int = MAX_SANDBOXES,
+    ) -> None:
+        self.factory = factory
+        self.prewarm = max(0, prewarm)
+        self.idle_ttl = idle_ttl
+        self.max_size = max(1, max_size)
+        self.stats: Dict[str, int] = {"created": 0, "reused": 0, "evicted": 0, "unhealthy": 0, "failed": 0}
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[float, bool, Any]] = []  # (released at, suspect, sandbox), oldest first
+        self._leased: Set[int] = set()
+        self._booting = 0  # created by acquire for its caller
+        self._warming = 0  # created by the maintenance thread as spares
+        self._last_used: Optional[float] = None
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    # --- leasing ---
+
+    def _total(self) -> int:
+        return len(self._idle) + len(self._leased) + self._booting + self._warming
+
+    def _boot(self, warm: bool) -> Any:
+        """Create one sandbox; the caller has already counted it in _booting or _warming."""
+        try:
+            sandbox = self.factory()
+            created = True
+        except Exception:
+            created = False
+            raise
+        finally:
+            with self._cond:
+                if warm:
+                    self._warming -= 1
+                else:
+                    self._booting -= 1
+                self.stats["created" if created else "failed"] += 1
+                self._cond.notify_all()
+        return sandbox
+
+    def acquire(self) -> Any:
+        """A healthy sandbox for one command, creating one if none is idle or warming up."""
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("sandbox pool is closed")
+                self._last_used = time.monotonic()
+                self._start_maintenance()
+                if self._idle:
+                    released, suspect, sandbox = self._idle.pop()  # most recently used first
+                    self._leased.add(id(sandbox))
+                elif self._warming or self._total() >= self.max_size:
+                    # A spare is already booting (cheaper to wait for than a second boot),
+                    # or the pool is full until someone releases a sandbox.
+                    self._cond.wait(1.0)
+                    continue
+                else:
+                    sandbox = None
+                    self._booting += 1
+            if sandbox is None:
+                sandbox = self._boot(warm=False)
+                with self._cond:
+                    self._leased.add(id(sandbox))
+                    self._cond.notify_all()  # the pre-warmer may want a spare now
+                return sandbox
+            if (suspect or time.monotonic() - released > HEALTH_CHECK_AFTER_SEC) and not _healthy(sandbox):
+                with self._cond:
+                    self._leased.discard(id(sandbox))
+                    self.stats["unhealthy"] += 1
+                _close(sandbox)
+                continue
+            with self._cond:
+                self.stats["reused"] += 1
+            return sandbox
+
+    def release(self, sandbox: Any, suspect: bool = False) -> None:
+        """Return a sandbox after a command; `suspect` forces a health check before reuse."""
+        with self._cond:
+            self._leased.discard(id(sandbox))
+            if not self._closed:
+                self._idle.append((time.monotonic(), suspect, sandbox))
+                self._last_used = time.monotonic()
+                self._cond.notify_all()
+                return
+        _close(sandbox)
+
+    @property
+    def idle(self) -> int:
+        with self._cond:
+            return len(self._idle)
+
+    # --- pre-warming and eviction ---
+
+    def _start_maintenance(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain, name="sandbox-pool", daemon=True)
+            self._thread.start()
+
+    def _maintain(self) -> None:
+        while True:
+            expired: List[Any] = []
+            boot = False
+            with self._cond:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                while self._idle and now - self._idle[0][0] > self.idle_ttl:
+                    expired.append(self._idle.pop(0)[2])
+                    self.stats["evicted"] += 1
+                active = self._last_used is not None and now - self._last_used <= self.idle_ttl
+                spares = len(self._idle) + self._warming
+                if active and spares < self.prewarm and self._total() < self.max_size:
+                    self._warming += 1
+                    boot = True
+                elif not expired:
+                    # Sleep until the oldest idle sandbox expires or the pool goes quiet.
+                    deadlines = [self._idle[0][0] + self.idle_ttl] if self._idle else []
+                    if active:
+                        deadlines.append(self._last_used + self.idle_ttl)
+                    self._cond.wait(max(0.01, min(deadlines) - now + 0.01) if deadlines else None)
+            for sandbox in expired:
+                _close(sandbox)
+            if boot:
+                try:
+                    sandbox = self._boot(warm=True)
+                except Exception:
+                    time.sleep(1.0)  # don't spin on a failing service; acquire reports the error
+                    continue
+                with self._cond:
+                    # Parked without touching _last_used: a spare is not a sign of use.
+                    if not self._closed:
+                        self._idle.append((time.monotonic(), False, sandbox))
+                        self._cond.notify_all()
+                        continue
+                _close(sandbox)
+
+    def close(self) -> None:
+        """Kill idle sandboxes now and leased ones when they are released."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for _, _, sandbox in idle:
+            _close(sandbox)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+
+class PooledSandbox:
+    """
+    The Sandbox an Engine sees: each command runs on a sandbox leased from the pool. With
+    a WorkspaceSync, the workspace is pushed before the command (which then runs in the
+    synced directory) and the files it changed are pulled back afterwards.
+    """
+
+    def __init__(self, pool: SandboxPool, sync: Optional["WorkspaceSync"] = None) -> None:
+        self.pool = pool
+        self.sync = sync
+        self.pull_error: Optional[str] = None
+
+    def run(self, command: str, args: List[str]) -> Tuple[int, str, str]:
+        sandbox = self.pool.acquire()
+        suspect = False
+        try:
+            if self.sync is None:
+                return sandbox.run(command, args)
+            self.sync.push(sandbox)
+            result = sandbox.run(command, args, cwd=self.sync.remote_dir)
+            self.pull_error = None
+            try:
+                self.sync.pull(sandbox)
+            except Exception as ex:
+                self.pull_error = str(ex)  # the command itself ran; report, don't fail it
+            return result
+        except PermissionError:
+            raise  # refused by the safety policy; the sandbox is fine
+        except Exception:
+            suspect = True
+            raise
+        finally:
+            self.pool.release(sandbox, suspect=suspect)
+
+    def close(self) -> None:
+        pass  # the sandboxes belong to the pool and outlive this Engine
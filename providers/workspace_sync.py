@@ -0,0 +1,264 @@
+# providers/workspace_sync.py
+"""
+Incremental sync of the local workspace into a remote sandbox before each command.
+
+The workspace index (workspace.py) already lists every non-ignored file with its SHA-256.
+For each sandbox we remember which hash of each path it holds, so a push uploads only
+the paths whose hash differs, as gzip'd tar archives written through the SDK's file API
+and unpacked by one shell command, and removes the paths deleted locally. A big push
+(typically the first) is split into several archives that are built and uploaded on a
+thread pool.
+
+After the command, the files it created or modified in the remote workspace (`find
+-newer` a marker touched by the push) are pulled back when the SDK can read files,
+unless the local copy changed meanwhile or .gitignore excludes a new file. Remote
+changes that are not pulled are forgotten from the manifest, so the next push restores
+the local version.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import io
+import os
+import posixpath
+import shlex
+import tarfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from workspace import ALWAYS_SKIPPED, WorkspaceIndex
+
+REMOTE_DIR = os.getenv("E2B_SYNC_DIR", "/home/user/workspace")
+SYNC_WORKERS = int(os.getenv("E2B_SYNC_WORKERS", "4"))
+# Pushes at least this large are split into one archive per worker.
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+MAX_PULL_FILES = 200
+# Archives, file lists and the marker live in this sibling of the remote workspace.
+STAGING = ".cherno-sync"
+
+
+class SyncResult(NamedTuple):
+    uploaded: int
+    deleted: int
+    bytes: int
+    archives: int
+    seconds: float
+
+
+# sandbox -> remote dir -> (local root, {path: sha} the sandbox holds). Weak keys, so a
+# killed sandbox's manifest goes with it; shared so every Engine reusing a pooled
+# sandbox sees what is already there.
+_manifests: "weakref.WeakKeyDictionary[Any, Dict[str, Tuple[str, Dict[str, str]]]]" = weakref.WeakKeyDictionary()
+_manifests_lock = threading.Lock()
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _balanced(paths: List[Tuple[str, int]], parts: int) -> List[List[str]]:
+    """Split (path, size) pairs into `parts` groups of similar total size."""
+    groups: List[List[str]] = [[] for _ in range(parts)]
+    totals = [0] * parts
+    for path, size in sorted(paths, key=lambda item: -item[1]):
+        i = totals.index(min(totals))
+        groups[i].append(path)
+        totals[i] += size
+    return [sorted(group) for group in groups if group]
+
+
+class WorkspaceSync:
+    def __init__(
+        self,
+        workspace: WorkspaceIndex,
+        remote_dir: str = REMOTE_DIR,
+        workers: Optional[int] = None,
+        pull: bool = True,
+        parallel_min_bytes: int = PARALLEL_MIN_BYTES,
+    ) -> None:
+        self.workspace = workspace
+        self.remote_dir = posixpath.normpath(remote_dir)
+        self.base = posixpath.dirname(self.remote_dir)
+        self.name = posixpath.basename(self.remote_dir)
+        self.workers = max(1, workers or SYNC_WORKERS)
+        self.pull_enabled = pull
+        self.parallel_min_bytes = parallel_min_bytes
+        self.last_push: Optional[SyncResult] = None
+        self.last_pulled: List[str] = []
+
+    @property
+    def _root(self) -> str:
+        return os.path.realpath(str(self.workspace.root))
+
+    def _staged(self, name: str) -> str:
+        return posixpath.join(self.base, STAGING, name)
+
+    def manifest(self, sandbox: Any) -> Optional[Dict[str, str]]:
+        """What `sandbox` holds of this workspace, or None if it has never been pushed to."""
+        with _manifests_lock:
+            owner, manifest = _manifests.get(sandbox, {}).get(self.remote_dir, (None, None))
+        return manifest if owner == self._root else None
+
+    def _remember(self, sandbox: Any, manifest: Optional[Dict[str, str]]) -> None:
+        with _manifests_lock:
+            per_dir = _manifests.setdefault(sandbox, {})
+            if manifest is None:
+                per_dir.pop(self.remote_dir, None)
+            else:
+                per_dir[self.remote_dir] = (self._root, manifest)
+
+    # --- push ---
+
+    def _archive(self, paths: List[str]) -> Tuple[bytes, List[str]]:
+        """A tar.gz of `paths` and the paths that could not be read."""
+        buf = io.BytesIO()
+        missing: List[str] = []
+        # GNU format skips the per-file pax headers, and compressing the finished tar in
+        # one call releases the GIL, so archives built on several threads really overlap.
+        with tarfile.open(fileobj=buf, mode="w", format=tarfile.GNU_FORMAT) as tar:
+            for path in paths:
+                try:
+                    tar.add(os.path.join(self._root, path), arcname=path, recursive=False)
+                except OSError:
+                    missing.append(path)
+        return gzip.compress(buf.getvalue(), compresslevel=6), missing
+
+    def push(self, sandbox: Any) -> SyncResult:
+        """Bring the remote workspace up to date with the local one."""
+        start = time.perf_counter()
+        self.workspace.refresh()
+        synced = self.manifest(sandbox)
+        current = {path: entry.sha for path, entry in self.workspace.entries.items()}
+        changed = [path for path, sha in sorted(current.items()) if (synced or {}).get(path) != sha]
+        deleted = [path for path in sorted(synced or {}) if path not in current]
+
+        sizes = [(path, self.workspace.entries[path].size) for path in changed]
+        total = sum(size for _, size in sizes)
+        parts = self.workers if total >= self.parallel_min_bytes else 1
+        groups = _balanced(sizes, min(parts, len(sizes))) if sizes else []
+
+        def upload(job: Tuple[int, List[str]]) -> Tuple[str, int, List[str]]:
+            index, paths = job
+            data, missing = self._archive(paths)
+            name = f"push-{index}.tgz"
+            sandbox.write_bytes(self._staged(name), data)
+            return name, len(data), missing
+
+        if len(groups) > 1:
+            with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="sync") as pool:
+                uploads = list(pool.map(upload, enumerate(groups)))
+        else:
+            uploads = [upload(job) for job in enumerate(groups)]
+
+        name = shlex.quote(self.name)
+        script = ["set -e"]
+        if synced is None:
+            script.append(f"rm -rf {name}")  # first push: drop whatever was there
+        script.append(f"mkdir -p {name} {STAGING}")
+        if deleted:
+            sandbox.write_bytes(self._staged("deleted"), "\0".join(deleted).encode("utf-8", "surrogateescape"))
+            script.append(f"(cd {name} && xargs -0 rm -f -- < ../{STAGING}/deleted)")
+        if len(uploads) > 1:
+            # Unpack the archives concurrently too, with the directories made up front (two
+            # tars creating the same directory race); `wait` fails the script if a tar did.
+            dirs = sorted({posixpath.dirname(path) for path in changed} - {""})
+            if dirs:
+                sandbox.write_bytes(self._staged("dirs"), "\0".join(dirs).encode("utf-8", "surrogateescape"))
+                script.append(f"(cd {name} && xargs -0 mkdir -p -- < ../{STAGING}/dirs)")
+            script += [f'tar -xzf {STAGING}/{archive} -C {name} & pids="$pids $!"' for archive, _, _ in uploads]
+            script.append('for pid in $pids; do wait "$pid"; done')
+        else:
+            script += [f"tar -xzf {STAGING}/{archive} -C {name}" for archive, _, _ in uploads]
+        script.append(f"rm -f {STAGING}/push-*.tgz {STAGING}/deleted {STAGING}/dirs {STAGING}/pull.tgz {STAGING}/pull-list")
+        script.append(f"touch {STAGING}/marker")
+        code, out, err = sandbox.shell("\n".join(script), cwd=self.base)
+        if code != 0:
+            self._remember(sandbox, None)  # unknown state: the next push starts over
+            raise RuntimeError(f"Workspace sync failed: {(err or out).strip()}")
+
+        for _, _, missing in uploads:
+            for path in missing:
+                current.pop(path, None)  # vanished since the index refresh
+        self._remember(sandbox, current)
+        self.last_push = SyncResult(
+            uploaded=len(changed),
+            deleted=len(deleted),
+            bytes=sum(size for _, size, _ in uploads),
+            archives=len(uploads),
+            seconds=time.perf_counter() - start,
+        )
+        return self.last_push
+
+    # --- pull ---
+
+    def _pullable(self, found: List[str], manifest: Dict[str, str]) -> List[str]:
+        found = [path for path in found if not set(path.split("/")) & ALWAYS_SKIPPED]
+        new = [path for path in found if path not in manifest]
+        ignored = set(new)
+        if new:
+            from git_ops import ignored_paths
+
+            try:
+                ignored = set(ignored_paths(new, self._root))
+            except RuntimeError:
+                pass  # not a git repository: new files stay remote
+        return [path for path in found if path in manifest or path not in ignored][:MAX_PULL_FILES]
+
+    def _write_local(self, path: str, data: bytes, mode: int) -> None:
+        full = Path(self._root) / path
+        full.parent.mkdir(parents=True, exist_ok=True)
+        tmp = full.with_name(f".{full.name}.cherno-pull")
+        tmp.write_bytes(data)
+        os.chmod(tmp, 0o755 if mode & 0o111 else 0o644)
+        os.replace(tmp, full)
+
+    def pull(self, sandbox: Any) -> List[str]:
+        """Copy files the last command changed remotely back into the workspace."""
+        self.last_pulled = []
+        manifest = self.manifest(sandbox)
+        if manifest is None:
+            return []
+        name = shlex.quote(self.name)
+        code, out, _ = sandbox.shell(f"cd {name} && find . -type f -newer ../{STAGING}/marker -print0", cwd=self.base)
+        if code != 0:
+            return []
+        found = sorted({p[2:] if p.startswith("./") else p for p in out.split("\0") if p})
+        if not found:
+            return []
+        wanted = self._pullable(found, manifest) if self.pull_enabled and sandbox.can_read_files else []
+        pulled: List[str] = []
+        same: List[str] = []
+        if wanted:
+            sandbox.write_bytes(self._staged("pull-list"), "\0".join(wanted).encode("utf-8", "surrogateescape"))
+            code, out, err = sandbox.shell(
+                f"cd {name} && tar -czf ../{STAGING}/pull.tgz --null -T ../{STAGING}/pull-list", cwd=self.base
+            )
+            if code == 0:
+                data = sandbox.read_bytes(self._staged("pull.tgz"))
+                with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+                    for member in tar.getmembers():
+                        path = posixpath.normpath(member.name)
+                        if not member.isfile() or path.startswith(("/", "..")) or path not in wanted:
+                            continue
+                        content = tar.extractfile(member).read()
+                        sha = _sha(content)
+                        if manifest.get(path) == sha:
+                            same.append(path)  # touched, not changed
+                            continue
+                        local = Path(self._root) / path
+                        local_sha = _sha(local.read_bytes()) if local.is_file() else None
+                        if local_sha != manifest.get(path):
+                            continue  # changed locally as well: the local copy wins
+                        self._write_local(path, content, member.mode)
+                        manifest[path] = sha
+                        pulled.append(path)
+        for path in found:
+            if path in manifest and path not in pulled and path not in same:
+                del manifest[path]  # remote copy differs from ours; the next push resends it
+        self.last_pulled = pulled
+        return pulled
@@ -0,0 +1,259 @@
+# regions.py
+"""
+Region scoping for synthesis of large files.
+
+`locate_regions` finds the smallest spans of a file that an instruction is about: the
+Python functions/classes it names (via ast), definitions found by indentation in other
+languages, and explicit line hints ("line 120", "lines 40-60"). An `Excerpt` renders those
+spans, with context, as one text in which every omitted stretch is replaced by a marker
+line; `Excerpt.splice` puts an edited version of that text back into the original.
+"""
+import ast
+import os
+import re
+from typing import List, Optional, Sequence, Set, Tuple
+
+# Files shorter than this are always sent whole.
+REGION_MIN_LINES = int(os.getenv("AGENT_REGION_MIN_LINES", "300"))
+# Lines of unchanged context kept around each located span.
+REGION_CONTEXT_LINES = int(os.getenv("AGENT_REGION_CONTEXT_LINES", "20"))
+# Scoping is skipped when the excerpt would still be this large a share of the file.
+REGION_MAX_FRACTION = 0.5
+
+MARKER_PREFIX = "⟪cherno: lines "
+_MARKER_LINE = "⟪cherno: lines {start}-{end} unchanged and omitted⟫\n"
+
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+_LINE_HINT = re.compile(r"\b(?:lines?|L)\s*(\d+)(?:\s*(?:-|–|to)\s*(\d+))?", re.IGNORECASE)
+_DEF_KEYWORDS = r"(?:def|function|fn|func|class|struct|enum|impl|interface|trait|type|module|sub|const|let|var)"
+
+Span = Tuple[int, int]  # 1-based, inclusive
+
+
+def instruction_names(instructions: str) -> Set[str]:
+    """
+    Identifiers the instructions clearly refer to as code: written `like_this`, CamelCase,
+    dotted, called(), quoted in backticks, or introduced by "function"/"method"/"class".
+    Plain words ("run", "value") are ignored so prose does not select random functions.
+    """
+    names: Set[str] = set()
+    for match in _IDENT.finditer(instructions):
+        name = match.group(0)
+        before = instructions[: match.start()]
+        after = instructions[match.end(): match.end() + 1]
+        codeish = (
+            "_" in name.strip("_")
+            or "." in name
+            or any(c.isupper() for c in name[1:])
+            or after == "("
+            or before.endswith("`")
+            or re.search(r"\b(?:function|method|class|def|fn)\s+$", before, re.IGNORECASE) is not None
+        )
+        if codeish and len(name) > 1:
+            names.add(name)
+    return names
+
+
+def _python_spans(source: str, names: Set[str], hinted: Sequence[Span]) -> Optional[List[Span]]:
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    spans: List[Span] = []
+    nodes: List[Tuple[str, Span]] = []
+
+    def visit(node: ast.AST, prefix: str) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                qualname = f"{prefix}{child.name}"
+                nodes.append((qualname, (start, child.end_lineno or child.lineno)))
+                visit(child, qualname + ".")
+            else:
+                visit(child, prefix)
+
+    visit(tree, "")
+    for qualname, span in nodes:
+        short = qualname.rsplit(".", 1)[-1]
+        if qualname in names or short in names:
+            spans.append(span)
+    for start, end in hinted:
+        # A line hint selects the innermost definition around it, or just those lines.
+        enclosing = [span for _, span in nodes if span[0] <= start and end <= span[1]]
+        spans.append(min(enclosing, key=lambda s: s[1] - s[0]) if enclosing else (start, end))
+    return spans
+
+
+def _indented_block(lines: Sequence[str], index: int) -> Span:
+    """Span of the definition starting at lines[index]: until the next line indented no deeper."""
+    indent = len(lines[index]) - len(lines[index].lstrip())
+    end = index
+    for j in range(index + 1, len(lines)):
+        text = lines[j]
+        if not text.strip():
+            continue
+        if len(text) - len(text.lstrip()) <= indent:
+            if text.lstrip()[:1] in ("}", ")", "]") or text.strip() == "end":
+                end = j  # closing line of a brace/`end` block belongs to it
+            break
+        end = j
+    return index + 1, end + 1
+
+
+def _text_spans(lines: Sequence[str], names: Set[str], hinted: Sequence[Span]) -> List[Span]:
+    spans: List[Span] = []
+    short_names = {name.rsplit(".", 1)[-1] for name in names}
+    if short_names:
+        pattern = re.compile(
+            rf"^\s*(?:export\s+|pub\s+|public\s+|private\s+|static\s+|async\s+)*"
+            rf"(?:{_DEF_KEYWORDS}\s+)?\*?\s*({'|'.join(map(re.escape, sorted(short_names)))})\b\s*[(<:={{]"
+        )
+        keyword = re.compile(rf"^\s*(?:[\w]+\s+)*{_DEF_KEYWORDS}\b")
+        for i, line in enumerate(lines):
+            if pattern.match(line) and (keyword.match(line) or line.rstrip().endswith(("{", ":"))):
+                spans.append(_indented_block(lines, i))
+    spans.extend(hinted)
+    return spans
+
+
+def _merge(spans: Sequence[Span], context: int, total: int) -> List[Span]:
+    merged: List[Span] = []
+    for start, end in sorted((max(1, s - context), min(total, e + context)) for s, e in spans):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def locate_regions(
+    path: str,
+    original: str,
+    instructions: str,
+    min_lines: Optional[int] = None,
+    context: Optional[int] = None,
+) -> Optional[List[Span]]:
+    """
+    Line spans (with context, merged) worth sending instead of the whole file, or None when
+    the file is small, nothing matches, or the spans would cover too much of it.
+    """
+    lines = original.splitlines(keepends=True)
+    total = len(lines)
+    if total < (REGION_MIN_LINES if min_lines is None else min_lines):
+        return None
+    names = instruction_names(instructions)
+    hinted = []
+    for match in _LINE_HINT.finditer(instructions):
+        start = int(match.group(1))
+        end = int(match.group(2) or start)
+        if 1 <= start <= end <= total:
+            hinted.append((start, end))
+    if not names and not hinted:
+        return None
+    spans = _python_spans(original, names, hinted) if path.endswith(".py") else None
+    if spans is None:
+        spans = _text_spans(lines, names, hinted)
+    if not spans:
+        return None
+    merged = _merge(spans, REGION_CONTEXT_LINES if context is None else context, total)
+    if sum(end - start + 1 for start, end in merged) > total * REGION_MAX_FRACTION:
+        return None
+    return merged
+
+
+class Excerpt:
+    """The located regions of a file, with marker lines standing in for everything else."""
+
+    def __init__(self, original: str, regions: Sequence[Span]) -> None:
+        self.lines = original.splitlines(keepends=True)
+        if self.lines and not self.lines[-1].endswith("\n"):
+            self.lines[-1] += "\n"
+            self.missing_final_newline = True
+        else:
+            self.missing_final_newline = False
+        self.regions = list(regions)
+        self.markers: List[Tuple[int, str]] = []  # (index of region that follows, marker line)
+        parts: List[str] = []
+        previous_end = 0
+        for i, (start, end) in enumerate(self.regions):
+            if start > previous_end + 1:
+                marker = _MARKER_LINE.format(start=previous_end + 1, end=start - 1)
+                self.markers.append((i, marker))
+                parts.append(marker)
+            parts.extend(self.lines[start - 1: end])
+            previous_end = end
+        if previous_end < len(self.lines):
+            marker = _MARKER_LINE.format(start=previous_end + 1, end=len(self.lines))
+            self.markers.append((len(self.regions), marker))
+            parts.append(marker)
+        self.text = "".join(parts)
+
+    @property
+    def line_count(self) -> int:
+        return sum(end - start + 1 for start, end in self.regions)
+
+    def _omitted(self, region_index: int) -> Span:
+        """1-based line span a marker stands for, given the index of the region after it."""
+        start = self.regions[region_index - 1][1] + 1 if region_index > 0 else 1
+        end = self.regions[region_index][0] - 1 if region_index < len(self.regions) else len(self.lines)
+        return start, end
+
+    def expand(self, partial: str) -> str:
+        """
+        `partial`, the start of an edited excerpt as it streams in, in whole-file terms:
+        each complete marker line is replaced by the original lines it stands for.
+        """
+        out: List[str] = []
+        pos = 0
+        for region_index, marker in self.markers:
+            found = partial.find(marker, pos)
+            if found < 0:
+                break
+            start, end = self._omitted(region_index)
+            out.append(partial[pos:found])
+            out.extend(self.lines[start - 1: end])
+            pos = found + len(marker)
+        out.append(partial[pos:])
+        return "".join(out)
+
+    def splice(self, edited: str) -> Optional[str]:
+        """The full file with `edited` (this excerpt, changed) spliced in; None if markers were lost."""
+        if not edited.endswith("\n"):
+            edited += "\n"
+        pieces: List[str] = []
+        pos = 0
+        for _, marker in self.markers:
+            found = edited.find(marker, pos)
+            if found < 0:
+                return None
+            pieces.append(edited[pos:found])
+            pos = found + len(marker)
+        pieces.append(edited[pos:])
+        if MARKER_PREFIX in "".join(pieces):
+            return None  # a marker was duplicated or mangled
+        # pieces[k] is what stands between marker k-1 and marker k; map them back to regions.
+        leading = bool(self.markers) and self.markers[0][0] == 0
+        trailing = bool(self.markers) and self.markers[-1][0] == len(self.regions)
+        if leading:
+            if pieces[0].strip():
+                return None
+            pieces = pieces[1:]
+        if trailing:
+            if pieces[-1].strip():
+                return None
+            pieces = pieces[:-1]
+        if len(pieces) != len(self.regions):
+            return None
+        out: List[str] = []
+        previous_end = 0
+        for (start, end), piece in zip(self.regions, pieces):
+            out.extend(self.lines[previous_end: start - 1])
+            if piece and not piece.endswith("\n"):
+                piece += "\n"
+            out.append(piece)
+            previous_end = end
+        out.extend(self.lines[previous_end:])
+        result = "".join(out)
+        if self.missing_final_newline and result.endswith("\n"):
+            result = result[:-1]
+        return result
@@ -0,0 +1,97 @@
+# retrieval.py
+"""
+Offline lexical retrieval (Okapi BM25) over past exchanges of a session.
+
+Documents are tokenised into lowercase words, the parts of snake_case identifiers, and
+whole file paths (`src/app.py`) so prompts naming a file or command find the exchanges
+that touched it. The index is purely in memory and grows one document at a time.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+_PATH_CHUNK = re.compile(r"[\w./-]+")
+
+# Too common in prompts and assistant summaries to carry any signal.
+STOPWORDS = {
+    "a", "an", "and", "the", "to", "of", "in", "on", "for", "with", "is", "it", "that", "this",
+    "be", "as", "at", "by", "or", "from", "so", "do", "please", "can", "you", "i", "me", "my",
+    "type", "path", "true", "false", "null", "none", "intent", "plan", "actions", "kind",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for chunk in _PATH_CHUNK.findall(text):
+        chunk = chunk.strip(".-/")
+        if "/" in chunk or "." in chunk:
+            tokens.append(chunk.lower())
+    for word in _WORD.findall(text):
+        lowered = word.lower()
+        if lowered in STOPWORDS or len(lowered) < 2:
+            continue
+        tokens.append(lowered)
+        if "_" in lowered.strip("_"):
+            tokens.extend(part for part in lowered.split("_") if len(part) > 1 and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_len: Dict[int, int] = {}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def add(self, doc_id: int, text: str) -> None:
+        if doc_id in self.doc_len:
+            return
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self.doc_len[doc_id] = length
+        self.total_len += length
+
+    def search(self, query: str, k: int, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Top-k (doc_id, score) pairs with a positive score, best first."""
+        if not self.doc_len:
+            return []
+        skip: Set[int] = set(exclude)
+        n = len(self.doc_len)
+        avg_len = self.total_len / n or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if doc_id in skip:
+                    continue
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [(doc_id, score) for doc_id, score in ranked[:k] if score > 0]
+
+
+def select_within_budget(
+    ranked: Sequence[Tuple[int, float]],
+    cost: Dict[int, int],
+    budget: int,
+) -> List[int]:
+    """Greedily keep the best-ranked documents that fit in `budget` tokens; chronological order."""
+    chosen: List[int] = []
+    used = 0
+    for doc_id, _ in ranked:
+        if used + cost[doc_id] > budget:
+            continue
+        chosen.append(doc_id)
+        used += cost[doc_id]
+    return sorted(chosen)
@@ -1,8 +1,14 @@
 # sandbox.py
 from __future__ import annotations
+import atexit
 import json
+import threading
 from pathlib import Path
-from typing import List, Tuple, Protocol
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Protocol
+
+if TYPE_CHECKING:
+    from providers.sandbox_pool import SandboxPool
+    from workspace import WorkspaceIndex
 
 SANDBOX_CONF = Path(".agent/sandbox.json")
 
@@ -25,15 +31,61 @@ def _read_conf() -> dict:
     SANDBOX_CONF.write_text(json.dumps(conf, indent=2))
     return conf
 
-def make_sandbox() -> Sandbox:
+_pools: Dict[str, "SandboxPool"] = {}
+_pools_lock = threading.Lock()
+
+# Replaces the E2B SDK's Sandbox class for pools built by make_sandbox. Only tests set it
+# (to providers.fake_e2b.FakeSandbox); it is deliberately not reachable from sandbox.json,
+# because the fake runs commands on the host with no sandbox and no allowlist.
+E2B_SDK: Optional[Callable[..., Any]] = None
+
+def _e2b_pool(conf: dict) -> "SandboxPool":
+    """
+    The process-wide pool for this E2B configuration, so sandboxes outlive each Engine.
+    Optional sandbox.json keys: "template", "cwd" and "pool": {"prewarm", "idle_ttl_sec",
+    "max_size"}.
+    """
+    from providers.e2b_sandbox import E2BSandbox
+    from providers.sandbox_pool import IDLE_TTL_SEC, MAX_SANDBOXES, PREWARM, SandboxPool
+
+    key = json.dumps(conf, sort_keys=True)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            sdk = E2B_SDK
+            options = conf.get("pool", {})
+            pool = _pools[key] = SandboxPool(
+                lambda: E2BSandbox(template=conf.get("template"), cwd=conf.get("cwd"), sdk=sdk),
+                prewarm=int(options.get("prewarm", PREWARM)),
+                idle_ttl=float(options.get("idle_ttl_sec", IDLE_TTL_SEC)),
+                max_size=int(options.get("max_size", MAX_SANDBOXES)),
+            )
+        return pool
+
+@atexit.register
+def _close_pools() -> None:
+    for pool in list(_pools.values()):
+        pool.close()
+
+def make_sandbox(workspace: Optional["WorkspaceIndex"] = None) -> Sandbox:
+    """`workspace` is synced into remote sandboxes before each command ("sync": false turns it off)."""
     conf = _read_conf()
     provider = conf.get("provider", "local").lower()
     if provider == "local":
         from providers.local_sandbox import LocalSandbox
         return LocalSandbox()
     elif provider == "e2b":
-        from providers.e2b_sandbox import E2BSandbox
-        return E2BSandbox()
+        from providers.sandbox_pool import PooledSandbox
+        if "sdk" in conf:
+            raise ValueError(
+                f'"sdk" is not a {SANDBOX_CONF} setting: the offline fake SDK runs commands on the host '
+                "and is for tests and benchmarks only"
+            )
+        sync = None
+        if workspace is not None and conf.get("sync", True):
+            from providers.workspace_sync import REMOTE_DIR, WorkspaceSync
+            sync = WorkspaceSync(workspace, conf.get("sync_dir", REMOTE_DIR), pull=conf.get("pull", True))
+        return PooledSandbox(_e2b_pool(conf), sync)
     else:
         # fallback to local
         from providers.local_sandbox import LocalSandbox
@@ -0,0 +1,137 @@
+# search.py
+"""
+Local code search over the workspace index (so .gitignore'd files are never scanned).
+
+Files are read and matched on a thread pool but results are yielded in path order as soon
+as each file is done, so callers can print matches while the scan continues and stop it
+early once they have enough. Binary, non-UTF-8 and oversized files are skipped.
+"""
+import fnmatch
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Pattern, Sequence
+
+from fs_ops import MAX_FILE_BYTES, SNIFF_BYTES, sniff_text
+from workspace import WorkspaceIndex
+
+SEARCH_WORKERS = int(os.getenv("AGENT_SEARCH_WORKERS", "8"))
+DEFAULT_MAX_RESULTS = 50
+MAX_MATCHES_PER_FILE = 20
+SNIPPET_CHARS = 160
+
+
+class SearchMatch(NamedTuple):
+    path: str
+    line: int
+    text: str
+
+    def snippet(self) -> str:
+        return f"{self.path}:{self.line}: {self.text}"
+
+
+def compile_pattern(pattern: str, literal: bool = False, ignore_case: bool = False) -> Pattern[str]:
+    """Raises ValueError for an invalid regular expression."""
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    try:
+        return re.compile(re.escape(pattern) if literal else pattern, flags)
+    except re.error as e:
+        raise ValueError(f"Invalid search pattern {pattern!r}: {e}") from e
+
+
+def matches_globs(path: str, globs: Sequence[str]) -> bool:
+    if not globs:
+        return True
+    name = path.rsplit("/", 1)[-1]
+    for glob in globs:
+        glob = glob[2:] if glob.startswith("./") else glob
+        if fnmatch.fnmatchcase(path, glob) or fnmatch.fnmatchcase(name, glob):
+            return True
+        if glob.startswith("**/") and fnmatch.fnmatchcase(path, glob[3:]):
+            return True
+        if glob.endswith("/") and path.startswith(glob):
+            return True
+    return False
+
+
+def _search_file(root: Path, path: str, regex: Pattern[str]) -> List[SearchMatch]:
+    try:
+        data = (root / path).read_bytes()
+    except OSError:
+        return []
+    if sniff_text(data[:SNIFF_BYTES]) is not None:
+        return []
+    text = data.decode("utf-8", errors="replace")
+    found: List[SearchMatch] = []
+    line = 1
+    counted_to = 0
+    last_line = 0
+    for match in regex.finditer(text):
+        line += text.count("\n", counted_to, match.start())
+        counted_to = match.start()
+        if line == last_line:
+            continue  # one result per line
+        last_line = line
+        start = text.rfind("\n", 0, match.start()) + 1
+        end = text.find("\n", match.start())
+        snippet = text[start: end if end >= 0 else len(text)].strip()
+        if len(snippet) > SNIPPET_CHARS:
+            snippet = snippet[: SNIPPET_CHARS - 3] + "..."
+        found.append(SearchMatch(path, line, snippet))
+        if len(found) >= MAX_MATCHES_PER_FILE:
+            break
+    return found
+
+
+def iter_matches(
+    workspace: WorkspaceIndex,
+    regex: Pattern[str],
+    globs: Sequence[str] = (),
+    workers: Optional[int] = None,
+) -> Iterator[SearchMatch]:
+    """Matches in path order, streamed while later files are still being searched."""
+    paths = [
+        path
+        for path, entry in sorted(workspace.entries.items())
+        if entry.size <= MAX_FILE_BYTES and matches_globs(path, globs)
+    ]
+    if not paths:
+        return
+    pool = ThreadPoolExecutor(max_workers=max(1, workers or SEARCH_WORKERS), thread_name_prefix="search")
+    try:
+        for found in pool.map(lambda path: _search_file(workspace.root, path, regex), paths):
+            yield from found
+    finally:
+        # Reached on exhaustion and when the caller stops early: drop the queued files.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def search_code(
+    workspace: WorkspaceIndex,
+    pattern: str,
+    literal: bool = False,
+    globs: Sequence[str] = (),
+    max_results: int = DEFAULT_MAX_RESULTS,
+    ignore_case: bool = False,
+    on_match: Optional[Callable[[SearchMatch], None]] = None,
+) -> Dict[str, object]:
+    """
+    Collect up to max_results matches, calling on_match for each as it arrives.
+    Returns {"matches": [...], "files": n, "truncated": bool}.
+    """
+    regex = compile_pattern(pattern, literal, ignore_case)
+    matches: List[SearchMatch] = []
+    truncated = False
+    stream = iter_matches(workspace, regex, globs)
+    try:
+        for match in stream:
+            if len(matches) >= max_results:
+                truncated = True
+                break
+            matches.append(match)
+            if on_match is not None:
+                on_match(match)
+    finally:
+        stream.close()  # stops the pool now rather than when the generator is collected
+    return {"matches": matches, "files": len({m.path for m in matches}), "truncated": truncated}
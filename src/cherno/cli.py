@@ -1,11 +1,11 @@
+import argparse
+import importlib
 import os
-import shlex
-import subprocess
 import sys
 from rich.align import Align
 from rich.text import Text
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import WordCompleter
@@ -40,7 +40,12 @@ Commands:
   :help              Show this help
   :dry on|off        Toggle dry-run (preview only)
   :debug on|off      Toggle debug raw response printing
-  :rollback          Git rollback last commit (no prompt)
+  :stream on|off     Toggle streaming synthesis with a live diff (Ctrl-C aborts)
+  :cache on|off      Toggle the .agent/cache/ result cache
+  :local on|off      Toggle the local intent fast path (off = always ask the model)
+  :session [NAME]    Show or switch the conversation session
+  :rollback [N]      Undo the last N agent checkpoints (default 1); add 'force' to overwrite later edits
+  :checkpoints       List agent checkpoints
   :clear             Clear the screen
   :exit / :quit      Exit REPL
 """
@@ -51,20 +56,88 @@ def _bool_toggle(val: str, current: bool) -> bool:
     if v in ("off", "false", "0", "no", "n"): return False
     return current
 
-def run_engine(prompt: str, dry: bool, debug: bool) -> int:
-    argv = [sys.executable, "main.py"]
-    if dry:
-        argv.append("--dry-run")
-    if debug:
-        argv.append("--debug")
-    argv.append(prompt)
-    # Inherit the console so main.py can show prompts and read your input
-    return subprocess.call(argv)
+def load_project_module(name: str):
+    # main.py and daemon.py live in the project root (the working directory), not in this package.
+    cwd = os.getcwd()
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+    return importlib.import_module(name)
 
 
-def run_rollback() -> int:
-    argv = [sys.executable, "main.py", "--rollback"]
-    return subprocess.call(argv)
+class RemoteEngine:
+    """Engine stand-in that forwards prompts to the `cherno serve` daemon."""
+
+    def __init__(self, daemon) -> None:
+        self._daemon = daemon
+
+    def run(self, prompt: str, **options) -> int:
+        return self._daemon.run_remote(prompt, **options)
+
+    def flush_commits(self) -> None:
+        self._daemon.flush_daemon()
+
+    def close(self) -> None:
+        # The daemon outlives the REPL, but its queued commits should not.
+        self._daemon.flush_daemon()
+
+
+def make_engine(no_daemon: bool):
+    daemon = load_project_module("daemon")
+    if not no_daemon and daemon.daemon_supported():
+        return RemoteEngine(daemon)
+    return load_project_module("main").Engine()
+
+
+def run_engine(
+    engine,
+    prompt: str,
+    dry: bool,
+    debug: bool,
+    stream: bool = False,
+    use_cache: bool = True,
+    local_intents: bool = True,
+    session: Optional[str] = None,
+) -> int:
+    # The daemon (or an in-process Engine) keeps the client, sandbox and memory warm between prompts.
+    try:
+        return engine.run(
+            prompt,
+            dry_run=dry,
+            debug=debug,
+            stream=stream,
+            use_cache=use_cache,
+            local_intents=local_intents,
+            session=session,
+        )
+    except KeyboardInterrupt:
+        console.print("[yellow]Interrupted.[/yellow]")
+        return 130
+    except Exception as ex:
+        console.print(f"[red]{ex}[/red]")
+        return 1
+
+
+def run_rollback(count: int = 1, force: bool = False, engine=None) -> int:
+    try:
+        if engine is not None:
+            engine.flush_commits()  # queued commits land before the revert commit
+        undone = load_project_module("git_ops").rollback_checkpoints(count, ".", force=force)
+    except Exception as ex:
+        console.print(f"[red]{ex}[/red]")
+        return 1
+    for checkpoint in undone:
+        console.print(f"[green]Rolled back checkpoint {checkpoint.number}:[/green] {', '.join(checkpoint.paths)}")
+    return 0
+
+
+def show_checkpoints() -> None:
+    try:
+        checkpoints = load_project_module("git_ops").list_checkpoints(".")
+    except Exception as ex:
+        console.print(f"[red]{ex}[/red]")
+        return
+    for line in load_project_module("main").format_checkpoints(checkpoints):
+        console.print(line, highlight=False)
 
 def banner(dry: bool, debug: bool):
     art = Text(CHERNO_ASCII, style="bold cyan")
@@ -78,22 +151,49 @@ def banner(dry: bool, debug: bool):
     console.print(Panel(info, border_style="cyan"))
 
 
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="cherno", description="Cherno coding agent REPL.")
+    parser.add_argument("command", nargs="?", choices=["serve", "stop"], help="serve: run the daemon in the foreground; stop: stop it")
+    parser.add_argument("--no-daemon", action="store_true", help="Run prompts in the REPL process instead of the daemon")
+    parser.add_argument("--session", default=None, help="Named conversation session to resume or start")
+    return parser.parse_args(argv)
+
+
 def main():
     os.environ.setdefault("PYTHONUTF8", "1")  # avoid encoding hiccups on Windows
+    args = parse_args(sys.argv[1:])
+    if args.command == "serve":
+        load_project_module("daemon").serve()
+        return
+    if args.command == "stop":
+        if not load_project_module("daemon").stop_daemon():
+            console.print("[dim]No cherno daemon is running.[/dim]")
+        return
+
     dry = False
     debug = False
 
     session = PromptSession(
         message=[("class:prompt", "cherno> ")],
         history=FileHistory(str(HISTORY)),
-        completer=WordCompleter([":help", ":dry on", ":dry off", ":debug on", ":debug off", ":rollback", ":clear", ":exit", ":quit"]),
+        completer=WordCompleter([":help", ":dry on", ":dry off", ":debug on", ":debug off", ":stream on", ":stream off", ":cache on", ":cache off", ":local on", ":local off", ":session", ":rollback", ":checkpoints", ":clear", ":exit", ":quit"]),
         style=Style.from_dict({
             "prompt": "bold cyan",
         }),
     )
     console.clear()
     banner(dry, debug)
+    engine = make_engine(args.no_daemon)
+    try:
+        repl_loop(session, engine, dry, debug, args.session)
+    finally:
+        engine.close()
+
 
+def repl_loop(session: PromptSession, engine, dry: bool, debug: bool, chat_session: Optional[str] = None) -> None:
+    stream = False
+    use_cache = True
+    local_intents = True
     while True:
         try:
             inp = session.prompt()
@@ -119,12 +219,27 @@ def main():
             elif cmd == "debug":
                 debug = _bool_toggle(arg, debug)
                 console.print(f"[dim]debug ->[/dim] {'[yellow]on[/yellow]' if debug else '[green]off[/green]'}")
+            elif cmd == "stream":
+                stream = _bool_toggle(arg, stream)
+                console.print(f"[dim]stream ->[/dim] {'[yellow]on[/yellow]' if stream else '[green]off[/green]'}")
+            elif cmd == "cache":
+                use_cache = _bool_toggle(arg, use_cache)
+                console.print(f"[dim]cache ->[/dim] {'[green]on[/green]' if use_cache else '[yellow]off[/yellow]'}")
+            elif cmd == "local":
+                local_intents = _bool_toggle(arg, local_intents)
+                console.print(f"[dim]local intents ->[/dim] {'[green]on[/green]' if local_intents else '[yellow]off[/yellow]'}")
+            elif cmd == "session":
+                if arg.strip():
+                    chat_session = arg.strip()
+                console.print(f"[dim]session ->[/dim] {chat_session or os.getenv('CHERNO_SESSION', 'default')}")
             elif cmd == "rollback":
-                code = run_rollback()
-                if code == 0:
-                    console.print("[green]Rolled back last commit.[/green]")
-                else:
+                words = arg.split()
+                count = next((int(w) for w in words if w.isdigit()), 1)
+                code = run_rollback(count, force="force" in words, engine=engine)
+                if code != 0:
                     console.print(f"[red]Rollback failed (exit {code}).[/red]")
+            elif cmd == "checkpoints":
+                show_checkpoints()
             elif cmd == "clear":
                 console.clear()
                 banner(dry, debug)
@@ -133,7 +248,9 @@ def main():
             continue
 
         # normal prompt → run engine
-        code = run_engine(inp, dry=dry, debug=debug)
+        code = run_engine(
+            engine, inp, dry=dry, debug=debug, stream=stream, use_cache=use_cache, local_intents=local_intents, session=chat_session
+        )
         if code != 0:
             console.print(f"[red]engine exited with code {code}[/red]")
 
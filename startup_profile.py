@@ -0,0 +1,83 @@
+# startup_profile.py
+"""
+`python main.py --startup-profile`: import-time breakdown of the CLI and each pipeline stage.
+
+A child interpreter runs with `-X importtime` and imports the stages in the order a
+prompt needs them, so every module is charged to the first stage that pulls it in.
+"""
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+ROOT = Path(__file__).resolve().parent
+
+STAGES: List[Tuple[str, List[str]]] = [
+    ("entry", ["main"]),
+    ("daemon client", ["daemon"]),
+    ("memory + intent", ["llm", "memory", "intents"]),
+    ("planning", ["planner"]),
+    ("synthesis + diff", ["fs_ops", "patcher"]),
+    ("execution", ["sandbox", "command_safety", "executor", "git_ops"]),
+    ("rendering", ["rich.console", "rich.json"]),
+    ("model client", ["openai"]),
+]
+
+
+class ImportRecord(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    records: List[ImportRecord] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            continue  # header row
+        raw_name = fields[2]
+        stripped = raw_name.lstrip(" ")
+        depth = max(0, (len(raw_name) - len(stripped) - 1) // 2)
+        records.append(ImportRecord(stripped, self_us, cumulative_us, depth))
+    return records
+
+
+def profile_imports() -> List[ImportRecord]:
+    statements = "; ".join(f"import {name}" for _, names in STAGES for name in names)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statements],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup profile failed: {proc.stderr.strip().splitlines()[-1:]}")
+    return parse_importtime(proc.stderr)
+
+
+def print_startup_profile(top: int = 15) -> None:
+    records = profile_imports()
+    top_level = {r.name: r for r in records if r.depth == 0}
+
+    print(f"{'stage':<18} {'module':<16} {'cumulative ms':>14}")
+    total_us = 0
+    for stage, names in STAGES:
+        for name in names:
+            rec = top_level.get(name)
+            cost = rec.cumulative_us if rec else 0  # 0: already loaded by an earlier stage
+            total_us += cost
+            print(f"{stage:<18} {name:<16} {cost / 1000:>14.1f}")
+    print(f"{'total':<35} {total_us / 1000:>14.1f}")
+
+    print(f"\nHeaviest {top} modules by self time:")
+    for rec in sorted(records, key=lambda r: r.self_us, reverse=True)[:top]:
+        print(f"  {rec.self_us / 1000:8.1f} ms  {rec.name}")
@@ -0,0 +1,220 @@
+# symbols.py
+"""
+AST symbol map of the workspace's Python files: classes, functions and methods with their
+signatures and line spans.
+
+Symbols are cached in .agent/index/symbols.json by file content hash (the SHA-256 the
+workspace index already keeps), so only new or changed files are parsed; large batches
+are parsed in a process pool. The map is rendered two ways: a token-budgeted "repo map"
+for the intent request, and the signatures of the modules a file imports for synthesis.
+"""
+import ast
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Set, Tuple
+
+from llm import estimate_tokens
+from workspace import WorkspaceIndex
+
+SYMBOL_CACHE_FILE = "symbols.json"
+
+REPO_MAP_TOKENS = int(os.getenv("AGENT_REPO_MAP_TOKENS", "1024"))
+IMPORT_SIGNATURE_TOKENS = int(os.getenv("AGENT_IMPORT_SIGNATURE_TOKENS", "800"))
+
+# Below this many files to parse, a process pool costs more to start than it saves.
+PARALLEL_MIN_FILES = 64
+SYMBOL_WORKERS = int(os.getenv("AGENT_SYMBOL_WORKERS", str(os.cpu_count() or 1)))
+
+MAX_SIGNATURE_CHARS = 120
+
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    """
+    Start method for the parse pool. Never fork: the daemon refreshes the index while
+    other threads hold locks (scheduler, git pipes, console), and a forked child would
+    inherit them mid-operation. forkserver forks from a clean single-threaded server.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class Symbol(NamedTuple):
+    kind: str  # "class", "def" or "method"
+    name: str
+    signature: str
+    start: int
+    end: int
+
+
+def _signature(node: ast.AST) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(b) for b in node.bases)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    args = ast.unparse(node.args)
+    if len(args) > MAX_SIGNATURE_CHARS:
+        args = args[: MAX_SIGNATURE_CHARS - 3] + "..."
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns is not None else ""
+    return f"{prefix} {node.name}({args}){returns}"
+
+
+def extract_symbols(source: str) -> List[Symbol]:
+    """Top-level classes and functions plus the methods of those classes ([] if unparsable)."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    found: List[Symbol] = []
+    functions = (ast.FunctionDef, ast.AsyncFunctionDef)
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            found.append(Symbol("class", node.name, _signature(node), node.lineno, node.end_lineno or node.lineno))
+            for child in node.body:
+                if isinstance(child, functions):
+                    found.append(Symbol("method", child.name, _signature(child), child.lineno, child.end_lineno or child.lineno))
+        elif isinstance(node, functions):
+            found.append(Symbol("def", node.name, _signature(node), node.lineno, node.end_lineno or node.lineno))
+    return found
+
+
+def _extract_file(job: Tuple[str, str]) -> Tuple[str, List[list]]:
+    # Runs in worker processes, so it takes and returns plain data.
+    sha, full_path = job
+    try:
+        source = Path(full_path).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return sha, []
+    return sha, [list(symbol) for symbol in extract_symbols(source)]
+
+
+def render_symbols(path: str, symbols: Sequence[Symbol]) -> str:
+    lines = [path]
+    for symbol in symbols:
+        indent = "    " if symbol.kind == "method" else "  "
+        lines.append(f"{indent}{symbol.signature}  [{symbol.start}-{symbol.end}]")
+    return "\n".join(lines)
+
+
+class SymbolIndex:
+    def __init__(self, workspace: WorkspaceIndex) -> None:
+        self.workspace = workspace
+        self.cache_path = workspace.index_path.parent / SYMBOL_CACHE_FILE
+        self._by_hash: Dict[str, List[Symbol]] = {}
+        self._loaded = False
+
+    def load(self) -> None:
+        self._loaded = True
+        try:
+            data = json.loads(self.cache_path.read_text())
+            self._by_hash = {sha: [Symbol(*row) for row in rows] for sha, rows in data.get("symbols", {}).items()}
+        except (OSError, ValueError, TypeError):
+            self._by_hash = {}
+
+    def save(self) -> None:
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": 1, "symbols": {sha: [list(s) for s in rows] for sha, rows in self._by_hash.items()}}
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        tmp.write_text(json.dumps(payload, separators=(",", ":")))
+        os.replace(tmp, self.cache_path)
+
+    def _python_entries(self) -> Dict[str, str]:
+        return {path: entry.sha for path, entry in self.workspace.entries.items() if path.endswith(".py")}
+
+    def refresh(self) -> int:
+        """Parse Python files whose content hash has no cached symbols. Returns how many were parsed."""
+        if not self._loaded:
+            self.load()
+        python = self._python_entries()
+        jobs: Dict[str, str] = {}
+        for path, sha in python.items():
+            if sha not in self._by_hash and sha not in jobs:
+                jobs[sha] = str(self.workspace.root / path)
+        results: Iterable[Tuple[str, List[list]]]
+        if len(jobs) >= PARALLEL_MIN_FILES and SYMBOL_WORKERS > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=SYMBOL_WORKERS, mp_context=_pool_context()) as pool:
+                    results = list(pool.map(_extract_file, jobs.items(), chunksize=32))
+            except (OSError, RuntimeError):
+                results = [_extract_file(job) for job in jobs.items()]  # no usable process pool
+        else:
+            results = [_extract_file(job) for job in jobs.items()]
+        for sha, rows in results:
+            self._by_hash[sha] = [Symbol(*row) for row in rows]
+        live = set(python.values())
+        stale = [sha for sha in self._by_hash if sha not in live]
+        for sha in stale:
+            del self._by_hash[sha]
+        if jobs or stale:
+            self.save()
+        return len(jobs)
+
+    def symbols_for(self, path: str) -> List[Symbol]:
+        entry = self.workspace.entries.get(path)
+        if entry is None:
+            return []
+        return self._by_hash.get(entry.sha, [])
+
+    def _render_within(self, paths: Iterable[str], budget: int) -> str:
+        blocks: List[str] = []
+        used = 0
+        seen: Set[str] = set()
+        for path in paths:
+            if budget - used < 16:
+                break  # not even a one-function file fits any more
+            if path in seen:
+                continue
+            seen.add(path)
+            symbols = self.symbols_for(path)
+            if not symbols:
+                continue
+            block = render_symbols(path, symbols)
+            cost = estimate_tokens(block) + 1
+            if used + cost > budget:
+                continue  # a smaller file further down may still fit
+            blocks.append(block)
+            used += cost
+        return "\n".join(blocks)
+
+    def repo_map(self, budget: int = REPO_MAP_TOKENS, focus: Sequence[str] = ()) -> str:
+        """Rendered symbols of as many files as fit in `budget` tokens, `focus` files first."""
+        return self._render_within([p for p in focus if p.endswith(".py")] + sorted(self._python_entries()), budget)
+
+    def _module_paths(self, path: str, node: ast.AST) -> List[str]:
+        """Workspace paths an import statement in `path` may refer to."""
+        names: List[str] = []
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                package = Path(path).parent
+                for _ in range(node.level - 1):
+                    package = package.parent
+                prefix = ".".join(p for p in package.as_posix().split("/") if p not in ("", "."))
+                base = ".".join(p for p in (prefix, base) if p)
+            names = [base] if base else []
+            # `from pkg import module` imports a module, not a symbol.
+            names += [".".join(p for p in (base, alias.name) if p) for alias in node.names]
+        found: List[str] = []
+        for name in names:
+            rel = name.replace(".", "/")
+            for candidate in (f"{rel}.py", f"{rel}/__init__.py", f"src/{rel}.py", f"src/{rel}/__init__.py"):
+                if candidate in self.workspace.entries and candidate != path:
+                    found.append(candidate)
+                    break
+        return found
+
+    def import_signatures(self, path: str, source: str, budget: int = IMPORT_SIGNATURE_TOKENS) -> str:
+        """Signatures of the workspace modules `source` (the contents of `path`) imports."""
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return ""
+        modules: List[str] = []
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                modules += [m for m in self._module_paths(path, node) if m not in modules]
+        return self._render_within(modules, budget)
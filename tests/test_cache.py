@@ -0,0 +1,61 @@
+import os
+import time
+
+from cache import DiskCache, cache_key
+
+
+def test_cache_key_ignores_dict_ordering():
+    assert cache_key("m", {"a": 1, "b": 2}) == cache_key("m", {"b": 2, "a": 1})
+    assert cache_key("m", {"a": 1}) != cache_key("m", {"a": 2})
+
+
+def test_roundtrip_and_counters(tmp_path):
+    cache = DiskCache(root=tmp_path, compress=True)
+    key = cache_key("synthesize", "model", "file contents")
+
+    assert cache.get(key) is None
+    cache.put(key, {"text": "new contents", "issues": []})
+    assert cache.get(key) == {"text": "new contents", "issues": []}
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_uncompressed_entries_are_readable(tmp_path):
+    DiskCache(root=tmp_path, compress=False).put("ab" * 32, [1, 2, 3])
+    assert DiskCache(root=tmp_path, compress=True).get("ab" * 32) == [1, 2, 3]
+
+
+def test_disabled_cache_never_stores(tmp_path):
+    cache = DiskCache(root=tmp_path, enabled=False)
+    cache.put("k" * 64, "value")
+    assert cache.get("k" * 64) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    cache = DiskCache(root=tmp_path, max_bytes=3000, compress=False)
+    payload = "x" * 900
+    keys = [cache_key(n) for n in range(3)]
+    for n, key in enumerate(keys):
+        cache.put(key, payload)
+        path = next(tmp_path.glob(f"*/{key}*"))
+        stamp = time.time() - 100 + n
+        os.utime(path, (stamp, stamp))
+
+    assert cache.get(keys[0]) == payload  # touch the oldest entry
+    cache.put(cache_key(3), payload)  # pushes the cache over budget
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == payload
+    assert cache.get(cache_key(3)) == payload
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = DiskCache(root=tmp_path)
+    key = cache_key("x")
+    cache.put(key, "value")
+    next(tmp_path.glob(f"*/{key}*")).write_bytes(b"not zlib")
+    assert cache.get(key) is None
@@ -0,0 +1,187 @@
+import io
+import json
+import socket
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import daemon
+
+pytestmark = pytest.mark.skipif(not hasattr(daemon.socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+class EchoEngine:
+    def __init__(self):
+        self.ask = None
+        self.closed = False
+        self.prompts = []
+        self.flushes = 0
+
+    def run(self, prompt, dry_run=False, debug=False, stream=False):
+        self.prompts.append((prompt, dry_run, debug))
+        print(f"working on {prompt}")
+        answer = self.ask("Apply? [y/N]: ")
+        print(f"answer={answer}")
+        return 0 if answer == "y" else 3
+
+    def flush_commits(self):
+        self.flushes += 1
+        print("commits flushed")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def running_daemon(tmp_path, monkeypatch):
+    # Relative socket path keeps us under the AF_UNIX path length limit.
+    monkeypatch.chdir(tmp_path)
+    socket_path = Path("test.sock")
+    engine = EchoEngine()
+    thread = threading.Thread(
+        target=daemon.serve,
+        kwargs={"socket_path": socket_path, "idle_timeout": 10, "engine_factory": lambda: engine},
+        daemon=True,
+    )
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not socket_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield socket_path, engine
+    daemon.stop_daemon(socket_path)
+    thread.join(timeout=5)
+
+
+def test_run_remote_relays_output_and_confirmations(running_daemon):
+    socket_path, engine = running_daemon
+    out = io.StringIO()
+    asked = []
+
+    def ask(prompt):
+        asked.append(prompt)
+        return "y"
+
+    code = daemon.run_remote("fix it", dry_run=True, ask=ask, out=out, socket_path=socket_path)
+
+    assert code == 0
+    assert asked == ["Apply? [y/N]: "]
+    assert "working on fix it" in out.getvalue()
+    assert "answer=y" in out.getvalue()
+    assert engine.prompts == [("fix it", True, False)]
+
+
+def test_engine_state_survives_between_clients(running_daemon):
+    socket_path, engine = running_daemon
+    assert daemon.run_remote("one", ask=lambda p: "n", out=io.StringIO(), socket_path=socket_path) == 3
+    assert daemon.run_remote("two", ask=lambda p: "y", out=io.StringIO(), socket_path=socket_path) == 0
+    assert [p[0] for p in engine.prompts] == ["one", "two"]
+
+
+def test_flush_daemon_waits_for_queued_commits(running_daemon, tmp_path):
+    socket_path, engine = running_daemon
+    out = io.StringIO()
+
+    assert daemon.flush_daemon(socket_path, out=out) is True
+
+    assert engine.flushes == 1
+    assert "commits flushed" in out.getvalue()
+    assert daemon.flush_daemon(tmp_path / "none.sock") is False
+
+
+def test_stop_daemon_closes_engine_and_socket(running_daemon):
+    socket_path, engine = running_daemon
+    assert daemon.stop_daemon(socket_path) is True
+    deadline = time.monotonic() + 5
+    while socket_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not socket_path.exists()
+    assert engine.closed is True
+
+
+class SlowStream:
+    """A streamed response that yields one line every `delay` seconds until closed."""
+
+    def __init__(self, lines, delay):
+        self.lines = lines
+        self.delay = delay
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        for line in self.lines:
+            if self.closed:
+                return  # like an HTTP stream whose connection was closed
+            time.sleep(self.delay)
+            self.sent += 1
+            yield SimpleNamespace(type="response.output_text.delta", delta=line)
+        yield SimpleNamespace(type="response.completed")
+
+    def close(self):
+        self.closed = True
+
+
+def test_cancel_frame_stops_a_streaming_synthesis(tmp_path, monkeypatch):
+    import git_ops
+    import llm
+    import main
+    import patcher
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(git_ops, "ensure_repo", lambda root=".": None)
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+    monkeypatch.setattr(main, "PLAIN_PROGRESS_SEC", 0.0)
+    scheduler = llm.RequestScheduler()
+    monkeypatch.setattr(llm, "scheduler", scheduler)
+    monkeypatch.setattr(patcher, "scheduler", scheduler)
+    (tmp_path / "notes.txt").write_text("".join(f"line {i}\n" for i in range(50)))
+    stream = SlowStream([f"LINE {i}\n" for i in range(50)], delay=0.05)
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=lambda **kw: stream)))
+    intent = {"type": "edit_file", "path": "notes.txt", "instructions": "shout"}
+    call = {"type": "function_call", "name": "emit_intent", "arguments": json.dumps({"intent": intent})}
+    engine = main.Engine()
+    engine.client = SimpleNamespace(responses=SimpleNamespace(create=lambda **kw: SimpleNamespace(output=[call])))
+
+    server_sock, client_sock = socket.socketpair()
+    server = daemon.Connection(server_sock)
+    thread = threading.Thread(target=daemon._handle, args=(engine, server), daemon=True)
+    thread.start()
+    client = daemon.Connection(client_sock)
+    client.send("run", prompt="shout the notes", options={"stream": True, "use_cache": False})
+    output = ""
+    while True:
+        frame = client.recv()
+        assert frame is not None and frame["op"] in ("output", "done"), frame
+        if frame["op"] == "done":
+            break
+        output += frame["data"]
+        if "lines received" in output and "cancel" not in output:
+            output += "\n<cancel>\n"
+            client.send("cancel")
+    thread.join(timeout=5)
+    server.close()
+    client.close()
+
+    # Progress went out as plain output frames while the stream ran.
+    assert "[1 lines received, 1 changed so far" in output
+    assert "aborted; nothing will be written" in output.split("<cancel>")[1]
+    assert frame["code"] == 0
+    assert stream.closed and stream.sent < 10
+    assert scheduler.limiter.in_flight == 0
+    assert (tmp_path / "notes.txt").read_text().startswith("line 0\n")
+
+
+def test_main_waits_for_the_daemons_commits_before_exiting(monkeypatch):
+    import main
+
+    calls = []
+    monkeypatch.setattr(daemon, "daemon_supported", lambda: True)
+    monkeypatch.setattr(daemon, "run_remote", lambda prompt, **kwargs: calls.append(("run", prompt)) or 0)
+    monkeypatch.setattr(daemon, "flush_daemon", lambda socket_path=None, out=None: calls.append(("flush", socket_path)) or True)
+    monkeypatch.setattr(main.sys, "argv", ["main.py", "--socket", "x.sock", "edit", "it"])
+
+    main.main()
+
+    assert calls == [("run", "edit it"), ("flush", Path("x.sock"))]
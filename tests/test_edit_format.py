@@ -0,0 +1,134 @@
+import pytest
+
+from edit_format import apply_blocks, apply_patch, parse_edit_blocks, parse_unified_diff
+
+ORIGINAL = (
+    "class Greeter:\n"
+    "    def greet(self, name):\n"
+    "        return f'hi {name}'\n"
+    "\n"
+    "    def leave(self):\n"
+    "        return 'bye'\n"
+)
+
+
+def test_search_replace_blocks_apply_in_order():
+    patch = (
+        "<<<<<<< SEARCH\n"
+        "        return f'hi {name}'\n"
+        "=======\n"
+        "        return f'hello {name}'\n"
+        ">>>>>>> REPLACE\n"
+        "<<<<<<< SEARCH\n"
+        "        return 'bye'\n"
+        "=======\n"
+        "        return 'goodbye'\n"
+        ">>>>>>> REPLACE\n"
+    )
+    new, failures = apply_patch(ORIGINAL, patch)
+    assert failures == []
+    assert new == ORIGINAL.replace("hi {name}", "hello {name}").replace("'bye'", "'goodbye'")
+
+
+def test_whitespace_tolerant_match_reindents_replacement():
+    # The model dropped the class-level indentation in both halves of the block.
+    patch = (
+        "<<<<<<< SEARCH\n"
+        "def leave(self):\n"
+        "    return 'bye'\n"
+        "=======\n"
+        "def leave(self):\n"
+        "    return 'see you'\n"
+        ">>>>>>> REPLACE\n"
+    )
+    new, failures = apply_patch(ORIGINAL, patch)
+    assert failures == []
+    assert "    def leave(self):\n        return 'see you'\n" in new
+
+
+def test_fuzzy_match_tolerates_small_differences():
+    blocks = parse_edit_blocks(
+        "<<<<<<< SEARCH\n"
+        "    def greet(self, name):\n"
+        "        return f'hi {name}!'\n"
+        "=======\n"
+        "    def greet(self, name):\n"
+        "        return f'hey {name}'\n"
+        ">>>>>>> REPLACE\n"
+    )
+    new, failures = apply_blocks(ORIGINAL, blocks)
+    assert failures == []
+    assert "return f'hey {name}'" in new
+    assert "hi {name}" not in new
+
+
+def test_unified_diff_hunks_apply():
+    diff = (
+        "--- a/greeter.py\n"
+        "+++ b/greeter.py\n"
+        "@@ -5,2 +5,3 @@\n"
+        "     def leave(self):\n"
+        "-        return 'bye'\n"
+        "+        print('leaving')\n"
+        "+        return 'bye'\n"
+    )
+    new, failures = apply_patch(ORIGINAL, diff)
+    assert failures == []
+    assert new.endswith("        print('leaving')\n        return 'bye'\n")
+
+
+def test_unified_diff_pure_insertion_uses_line_hint():
+    blocks = parse_unified_diff("@@ -0,0 +1 @@\n+import os\n")
+    new, failures = apply_blocks("x = 1\n", blocks)
+    assert failures == []
+    assert new == "import os\nx = 1\n"
+
+
+def test_unified_diff_removes_lines_that_look_like_file_headers():
+    original = "SELECT 1;\n-- old comment\n++ counter\nSELECT 2;\n"
+    diff = (
+        "--- a/q.sql\n"
+        "+++ b/q.sql\n"
+        "@@ -1,4 +1,3 @@\n"
+        " SELECT 1;\n"
+        "--- old comment\n"
+        "+++ new counter\n"
+        "-++ counter\n"
+        " SELECT 2;\n"
+        "--- a/other.sql\n"
+        "+++ b/other.sql\n"
+        "@@ -1 +1 @@\n"
+        "-x\n"
+        "+y\n"
+    )
+    blocks = parse_unified_diff(diff)
+
+    assert [(b.search, b.replace) for b in blocks] == [
+        (["SELECT 1;", "-- old comment", "++ counter", "SELECT 2;"], ["SELECT 1;", "++ new counter", "SELECT 2;"]),
+        (["x"], ["y"]),
+    ]
+    new, failures = apply_blocks(original, blocks[:1])
+    assert failures == []
+    assert new == "SELECT 1;\n++ new counter\nSELECT 2;\n"
+
+
+def test_missing_search_text_reports_failure_without_partial_result():
+    patch = (
+        "<<<<<<< SEARCH\n        return 'bye'\n=======\n        return 'ciao'\n>>>>>>> REPLACE\n"
+        "<<<<<<< SEARCH\nnothing like this exists anywhere\n=======\nx\n>>>>>>> REPLACE\n"
+    )
+    new, failures = apply_patch(ORIGINAL, patch)
+    assert new is None
+    assert failures and failures[0].startswith("Block 2")
+
+
+def test_parse_edit_blocks_streaming_ignores_open_block():
+    partial = "<<<<<<< SEARCH\na\n=======\nb\n>>>>>>> REPLACE\n<<<<<<< SEARCH\nc\n"
+    assert len(parse_edit_blocks(partial, complete_only=True)) == 1
+    with pytest.raises(ValueError):
+        parse_edit_blocks(partial)
+
+
+def test_apply_patch_rejects_plain_contents():
+    with pytest.raises(ValueError):
+        apply_patch(ORIGINAL, "just a whole new file\n")
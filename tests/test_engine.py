@@ -0,0 +1,276 @@
+import json
+from types import SimpleNamespace
+
+import git_ops
+import main
+
+
+class FakeResponses:
+    def __init__(self, intent):
+        self.intent = intent
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        call = {"type": "function_call", "name": "emit_intent", "arguments": json.dumps({"intent": self.intent})}
+        return SimpleNamespace(output=[call])
+
+
+def make_engine(monkeypatch, tmp_path, intent, answers):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(git_ops, "ensure_repo", lambda root=".": None)
+    replies = iter(answers)
+    engine = main.Engine(ask=lambda prompt: next(replies))
+    engine.client = SimpleNamespace(responses=FakeResponses(intent))
+    return engine
+
+
+def test_engine_reuses_state_across_prompts(tmp_path, monkeypatch):
+    intent = {"type": "run_command", "command": "pytest", "args": ["-q"]}
+    engine = make_engine(monkeypatch, tmp_path, intent, ["n", "n"])
+
+    assert engine.run("run the tests") == 0
+    assert engine.run("run the tests again") == 0
+
+    assert engine.client.responses.calls == 2
+    assert [t["role"] for t in engine.turns] == ["user", "assistant", "user", "assistant"]
+    # Declined commands never need a sandbox.
+    assert engine._sandbox is None
+    saved = [json.loads(line) for line in (tmp_path / ".agent/sessions/default.jsonl").read_text().splitlines()]
+    assert saved[-2]["content"] == "run the tests again"
+
+
+def test_engine_dry_run_skips_writes(tmp_path, monkeypatch):
+    intent = {"type": "create_file", "path": "hello.txt", "contents": "hi\n"}
+    engine = make_engine(monkeypatch, tmp_path, intent, [])
+
+    assert engine.run("create hello.txt", dry_run=True) == 0
+
+    assert not (tmp_path / "hello.txt").exists()
+    summary = json.loads(engine.turns[-1]["content"])
+    assert summary["actions"][-1]["reason"] == "dry_run"
+
+
+def test_engine_applies_unified_diff_patch_locally(tmp_path, monkeypatch):
+    (tmp_path / "app.py").write_text("x = 1\ny = 2\n")
+    diff = "--- a/app.py\n+++ b/app.py\n@@ -2 +2 @@\n-y = 2\n+y = 3\n"
+    intent = {"type": "edit_file", "path": "app.py", "instructions": "bump y", "patch": diff}
+    engine = make_engine(monkeypatch, tmp_path, intent, ["y"])
+    committed = []
+    monkeypatch.setattr(git_ops, "commit_paths", lambda paths, message, root=".": committed.append(paths))
+
+    assert engine.run("bump y") == 0
+    engine.flush_commits()
+
+    assert (tmp_path / "app.py").read_text() == "x = 1\ny = 3\n"
+    assert committed == [["app.py"]]
+
+
+def test_engine_local_intent_skips_model(tmp_path, monkeypatch):
+    engine = make_engine(monkeypatch, tmp_path, {"type": "run_command", "command": "ls"}, ["n", "n"])
+
+    assert engine.run("run pytest -q") == 0
+    assert engine.client.responses.calls == 0
+    assert engine.run("run pytest -q", local_intents=False) == 0
+    assert engine.client.responses.calls == 1
+
+
+def test_prompt_prefix_is_stable_across_prompts(tmp_path, monkeypatch):
+    intent = {"type": "run_command", "command": "pytest", "args": ["-q"]}
+    engine = make_engine(monkeypatch, tmp_path, intent, ["n", "n", "n"])
+    sent = []
+    original_create = engine.client.responses.create
+
+    def create(**kwargs):
+        sent.append(json.dumps(kwargs["input"]))
+        assert kwargs["prompt_cache_key"]
+        return original_create(**kwargs)
+
+    engine.client.responses.create = create
+    for prompt in ("run the tests", "run them again", "once more"):
+        engine.run(prompt, use_cache=False, local_intents=False)
+
+    # Everything but the final user message of a request is replayed verbatim by the next one.
+    for earlier, later in zip(sent, sent[1:]):
+        prefix = json.loads(earlier)[:-1]
+        assert json.loads(later)[: len(prefix)] == prefix
+        assert later.startswith(json.dumps(prefix)[:-1])
+
+
+def test_repeated_prompt_hits_the_intent_cache_after_a_recorded_turn(tmp_path, monkeypatch):
+    intent = {"type": "run_command", "command": "pytest", "args": ["-q"]}
+    engine = make_engine(monkeypatch, tmp_path, intent, ["n", "n", "n"])
+
+    engine.run("check the test suite", local_intents=False)
+    assert len(engine.turns) == 2  # the declined command is now part of the history
+    engine.run("check the test suite", local_intents=False)
+    assert engine.client.responses.calls == 1
+
+    engine.run("check the test suite quietly", local_intents=False)
+    assert engine.client.responses.calls == 2
+
+
+def test_tail_context_stays_out_of_the_prefix():
+    turns = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    msgs = main.build_response_messages("sys", turns, "c", tail_context=["ctx"])
+    assert msgs[:3] == main.build_response_messages("sys", turns, "c")[:3]
+    assert [part["text"] for part in msgs[-1]["content"]] == ["ctx", "c"]
+
+
+def test_engine_multi_edit_synthesizes_concurrently_and_commits_once(tmp_path, monkeypatch):
+    import patcher
+
+    (tmp_path / "a.py").write_text("A = 1\n")
+    (tmp_path / "b.py").write_text("B = 1\n")
+    (tmp_path / "c.py").write_text("C = 1\n")
+    diff = "--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-A = 1\n+A = 2\n"
+    intent = {
+        "type": "multi_edit",
+        "edits": [
+            {"path": "a.py", "instructions": "bump A", "patch": diff},
+            {"path": "b.py", "instructions": "bump B"},
+            {"path": "c.py", "instructions": "bump C"},
+        ],
+    }
+    engine = make_engine(monkeypatch, tmp_path, intent, ["y"])
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+    synthesized = []
+
+    def create(**kwargs):
+        prompt = kwargs["input"][-1]["content"][0]["text"]
+        name = "B" if "b.py" in prompt else "C"
+        synthesized.append(name)
+        return SimpleNamespace(output_text=f"{name} = 2\n")
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+    committed = []
+    monkeypatch.setattr(git_ops, "commit_paths", lambda paths, message, root=".": committed.append(paths))
+
+    assert engine.run("bump everything", use_cache=False) == 0
+    engine.flush_commits()
+
+    assert sorted(synthesized) == ["B", "C"]
+    assert [(tmp_path / f).read_text().strip() for f in ("a.py", "b.py", "c.py")] == ["A = 2", "B = 2", "C = 2"]
+    assert committed == [["a.py", "b.py", "c.py"]]
+
+
+def test_engine_multi_edit_writes_nothing_if_one_file_fails(tmp_path, monkeypatch):
+    import patcher
+
+    (tmp_path / "a.py").write_text("A = 1\n")
+    (tmp_path / "b.py").write_text("B = 1\n")
+    intent = {"type": "multi_edit", "edits": [{"path": "a.py", "instructions": "x"}, {"path": "b.py", "instructions": "y"}]}
+    engine = make_engine(monkeypatch, tmp_path, intent, ["y"])
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+
+    def create(**kwargs):
+        if "b.py" in kwargs["input"][-1]["content"][0]["text"]:
+            raise RuntimeError("boom")
+        return SimpleNamespace(output_text="A = 2\n")
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+
+    assert engine.run("change both", use_cache=False) == 0
+    assert (tmp_path / "a.py").read_text() == "A = 1\n"
+    summary = json.loads(engine.turns[-1]["content"])
+    assert {"type": "synthesize_files", "failed": ["b.py"]} in summary["actions"]
+
+
+def test_engine_records_a_failed_single_file_synthesis(tmp_path, monkeypatch):
+    import llm
+    import patcher
+
+    (tmp_path / "a.py").write_text("A = 1\n")
+    intent = {"type": "edit_file", "path": "a.py", "instructions": "bump A"}
+    engine = make_engine(monkeypatch, tmp_path, intent, [])
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+
+    def create(**kwargs):
+        raise llm.DeadlineExceeded("Run deadline of 1s exceeded")
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+
+    assert engine.run("bump A", use_cache=False) == 0
+    assert (tmp_path / "a.py").read_text() == "A = 1\n"
+    summary = json.loads(engine.turns[-1]["content"])
+    assert summary["actions"][-1] == {"type": "synthesize_patch", "path": "a.py", "error": "Run deadline of 1s exceeded"}
+
+
+def test_engine_refuses_binary_targets_before_synthesis(tmp_path, monkeypatch):
+    import patcher
+
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00")
+    intent = {"type": "edit_file", "path": "logo.png", "instructions": "make it blue"}
+    engine = make_engine(monkeypatch, tmp_path, intent, [])
+    monkeypatch.setattr(patcher, "get_client", lambda: (_ for _ in ()).throw(AssertionError("no model call expected")))
+
+    assert engine.run("make the logo blue", use_cache=False) == 0
+
+    summary = json.loads(engine.turns[-1]["content"])
+    assert summary["actions"] == [{"type": "read_file", "path": "logo.png", "error": "Refusing logo.png: binary content (NUL bytes)"}]
+
+
+def test_engine_resolves_mistyped_path_and_lists_candidates(tmp_path, monkeypatch):
+    (tmp_path / "planner.py").write_text("x = 1\ny = 2\n")
+    diff = "--- a/planner.py\n+++ b/planner.py\n@@ -2 +2 @@\n-y = 2\n+y = 3\n"
+    intent = {"type": "edit_file", "path": "planer.py", "instructions": "bump y", "patch": diff}
+    engine = make_engine(monkeypatch, tmp_path, intent, ["y"])
+    monkeypatch.setattr(git_ops, "commit_paths", lambda paths, message, root=".": None)
+    sent = []
+    original_create = engine.client.responses.create
+    engine.client.responses.create = lambda **kwargs: sent.append(kwargs["input"]) or original_create(**kwargs)
+
+    assert engine.run("bump y in planer.py", local_intents=False) == 0
+
+    assert (tmp_path / "planner.py").read_text() == "x = 1\ny = 3\n"
+    tail = json.dumps(sent[0][-1])
+    assert "Workspace files that may be relevant" in tail and "planner.py" in tail
+    assert (tmp_path / ".agent/index/files.json").exists()
+
+
+def test_engine_refreshes_the_index_only_when_a_run_uses_it(tmp_path, monkeypatch):
+    import workspace
+
+    scans = []
+    original_refresh = workspace.WorkspaceIndex.refresh
+    monkeypatch.setattr(workspace.WorkspaceIndex, "refresh", lambda self: scans.append(1) or original_refresh(self))
+    engine = make_engine(monkeypatch, tmp_path, {"type": "run_command", "command": "pytest", "args": ["-q"]}, ["n", "n"])
+
+    assert engine.run("run pytest -q") == 0
+    assert scans == []  # local intent: no candidates, repo map or path resolution needed
+
+    assert engine.run("run the tests", local_intents=False) == 0
+    assert scans == [1]  # candidates and repo map share one refresh
+
+
+def test_engine_search_code_feeds_snippets_back_into_history(tmp_path, monkeypatch):
+    (tmp_path / "app.py").write_text("def load_config(path):\n    return path\n" + "x = 1\n" * 400)
+    intent = {"type": "search_code", "pattern": "def load_", "globs": ["*.py"]}
+    engine = make_engine(monkeypatch, tmp_path, intent, [])
+
+    assert engine.run("where is the config loaded?", local_intents=False) == 0
+
+    summary = json.loads(engine.turns[-1]["content"])
+    assert summary["actions"] == [
+        {"type": "search_code", "pattern": "def load_", "globs": ["*.py"],
+         "matches": ["app.py:1: def load_config(path):"], "files": 1, "truncated": False}
+    ]
+
+
+def test_engine_write_records_a_checkpoint(tmp_path, monkeypatch):
+    import subprocess
+
+    for var, value in (("NAME", "Cherno Test"), ("EMAIL", "test@example.com")):
+        monkeypatch.setenv(f"GIT_AUTHOR_{var}", value)
+        monkeypatch.setenv(f"GIT_COMMITTER_{var}", value)
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    intent = {"type": "create_file", "path": "hello.txt", "contents": "hi\n"}
+    engine = make_engine(monkeypatch, tmp_path, intent, ["y"])
+
+    assert engine.run("create hello.txt", local_intents=False) == 0
+
+    summary = json.loads(engine.turns[-1]["content"])
+    assert summary["actions"][-1]["checkpoint"] == 1
+    git_ops.rollback_checkpoints(1)
+    assert not (tmp_path / "hello.txt").exists()
+    git_ops._close_sessions()
@@ -1,7 +1,11 @@
+import difflib
+import random
+import re
 from pathlib import Path
 
 import pytest
 
+import fs_ops
 from fs_ops import read_file_text, write_file_text, compute_unified_diff
 
 
@@ -37,3 +41,177 @@ def test_compute_unified_diff_matches_golden():
         "+print('hello world')\n"
     )
     assert diff == expected
+
+
+def test_write_files_atomic_restores_everything_on_failure(tmp_path: Path):
+    from fs_ops import write_files_atomic
+
+    existing = tmp_path / "existing.txt"
+    existing.write_text("old\n")
+    created = tmp_path / "new.txt"
+    blocked = existing / "child.txt"  # parent is a file, so this write fails
+
+    ok, err = write_files_atomic([(str(existing), "new\n"), (str(created), "x\n"), (str(blocked), "y\n")])
+
+    assert ok is False
+    assert "Failed to write" in err
+    assert existing.read_text() == "old\n"
+    assert not created.exists()
+
+
+# --- diff engine ---
+
+HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def strict_apply(old: str, diff: str) -> str:
+    """Apply a unified diff, checking every context/removed line and every hunk length."""
+    old_lines = fs_ops._split_lines(old)
+    lines = fs_ops._split_lines(diff)
+    assert lines[:2] == ["--- a/f\n", "+++ b/f\n"]
+    out, pos, n = [], 0, 2
+    while n < len(lines):
+        m = HUNK.match(lines[n])
+        assert m, lines[n]
+        start, length = int(m.group(1)), int(m.group(2) or 1)
+        new_length = int(m.group(4) or 1)
+        start = start - 1 if length else start
+        out += old_lines[pos:start]
+        pos = start
+        seen_old = seen_new = 0
+        n += 1
+        while n < len(lines) and not lines[n].startswith("@@"):
+            tag, text = lines[n][0], lines[n][1:]
+            if n + 1 < len(lines) and lines[n + 1] == "\\ No newline at end of file\n":
+                text = text[:-1]
+                n += 1
+            if tag in " -":
+                assert old_lines[pos] == text
+                pos += 1
+                seen_old += 1
+            if tag in " +":
+                out.append(text)
+                seen_new += 1
+            n += 1
+        assert (seen_old, seen_new) == (length, new_length)
+    return "".join(out + old_lines[pos:])
+
+
+def test_unified_diff_golden_multiple_hunks():
+    old = "".join(f"line {i}\n" for i in range(1, 21))
+    new = old.replace("line 2\n", "line two\n").replace("line 18\n", "")
+    assert fs_ops.compute_unified_diff(old, new, "f") == (
+        "--- a/f\n+++ b/f\n"
+        "@@ -1,5 +1,5 @@\n line 1\n-line 2\n+line two\n line 3\n line 4\n line 5\n"
+        "@@ -15,6 +15,5 @@\n line 15\n line 16\n line 17\n-line 18\n line 19\n line 20\n"
+    )
+
+
+def test_unified_diff_golden_new_file_and_missing_newline():
+    assert fs_ops.compute_unified_diff("", "a\nb\n", "f") == "--- a/f\n+++ b/f\n@@ -0,0 +1,2 @@\n+a\n+b\n"
+    assert fs_ops.compute_unified_diff("a\nb\n", "a\nc", "f") == (
+        "--- a/f\n+++ b/f\n@@ -1,2 +1,2 @@\n a\n-b\n+c\n\\ No newline at end of file\n"
+    )
+    assert fs_ops.compute_unified_diff("same\n", "same\n", "f") == ""
+
+
+def test_unified_diff_golden_form_feed_is_not_a_line_break():
+    old, new = "a\n\x0c\nb\nc\n", "a\n\x0c\nb\nC\n"
+    diff = fs_ops.compute_unified_diff(old, new, "f")
+    assert diff == "--- a/f\n+++ b/f\n@@ -1,4 +1,4 @@\n a\n \x0c\n b\n-c\n+C\n"
+    reference = difflib.unified_diff(["a\n", "\x0c\n", "b\n", "c\n"], ["a\n", "\x0c\n", "b\n", "C\n"], "a/f", "b/f")
+    assert diff == "".join(reference)
+    assert strict_apply(old, diff) == new
+    mixed = fs_ops.compute_unified_diff("x\u2028y\n", "x\u2028z\n", "f")
+    assert mixed == "--- a/f\n+++ b/f\n@@ -1 +1 @@\n-x\u2028y\n+x\u2028z\n"
+
+
+def test_unified_diff_matches_difflib_and_always_applies():
+    agree = 0
+    for seed in range(300):
+        rnd = random.Random(seed)
+        old = [f"l{rnd.randint(0, 8)}\n" for _ in range(rnd.randint(0, 40))]
+        new = list(old)
+        for _ in range(rnd.randint(1, 6)):
+            op = rnd.random()
+            if op < 0.3 and new:
+                del new[rnd.randrange(len(new))]
+            elif op < 0.6:
+                new.insert(rnd.randint(0, len(new)), f"n{rnd.randint(0, 8)}\n")
+            elif new:
+                new[rnd.randrange(len(new))] = f"c{rnd.randint(0, 3)}\n"
+        before, after = "".join(old), "".join(new)
+        if rnd.random() < 0.2 and after:
+            after = after[:-1]
+        diff = fs_ops.compute_unified_diff(before, after, "f")
+        if before != after:
+            assert strict_apply(before, diff) == after
+        reference = "".join(difflib.unified_diff(old, fs_ops._split_lines(after), "a/f", "b/f"))
+        agree += diff == reference
+    # Different but equally valid alignments are allowed; most should be identical.
+    assert agree > 200
+
+
+def test_unified_diff_caps_expensive_gaps_and_summarises_huge_changes(monkeypatch):
+    old = "".join(f"{i % 7}\n" for i in range(300))
+    new = "".join(f"{i % 5}\n" for i in range(300))
+    monkeypatch.setattr(fs_ops, "DIFF_MAX_COST", 5)
+    assert strict_apply(old, fs_ops.compute_unified_diff(old, new, "f")) == new
+
+    monkeypatch.setattr(fs_ops, "DIFF_MAX_LINES", 100)
+    summary = fs_ops.compute_unified_diff("keep\n" + old, "keep\n" + new, "f")
+    assert summary.splitlines()[2].startswith("@@ -7,295 +7,295 @@ diff summary: 295 lines replaced by 295 lines")
+
+
+# --- guarded reads ---
+
+
+def test_read_file_text_refuses_binary_non_utf8_and_oversized_files(tmp_path: Path):
+    (tmp_path / "blob.bin").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00")
+    (tmp_path / "latin1.txt").write_bytes("caf\xe9\n".encode("latin-1"))
+    (tmp_path / "big.txt").write_text("x" * 2000)
+
+    ok, text, err = fs_ops.read_file_text(str(tmp_path / "blob.bin"))
+    assert (ok, text) == (False, None) and "binary" in err
+    ok, _, err = fs_ops.read_file_text(str(tmp_path / "latin1.txt"))
+    assert not ok and "not valid UTF-8" in err
+    ok, _, err = fs_ops.read_file_text(str(tmp_path / "big.txt"), max_bytes=1000)
+    assert not ok and "2000 bytes exceeds the 1000-byte limit" in err
+    ok, _, err = fs_ops.read_file_text(str(tmp_path))
+    assert not ok and "Not a regular file" in err
+
+
+def test_sniff_text_tolerates_a_split_multibyte_character():
+    assert fs_ops.sniff_text("héllo".encode("utf-8")[:2]) is None
+
+
+def test_read_file_text_memory_maps_large_files(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(fs_ops, "MMAP_THRESHOLD", 16)
+    target = tmp_path / "big.txt"
+    target.write_bytes("ünïcode line\r\n".encode("utf-8") * 100)
+    mapped = []
+    real_mmap = fs_ops.mmap.mmap
+    monkeypatch.setattr(fs_ops.mmap, "mmap", lambda *a, **kw: mapped.append(a) or real_mmap(*a, **kw))
+
+    ok, text, err = fs_ops.read_file_text(str(target))
+
+    assert ok and err is None
+    assert mapped
+    assert text == "ünïcode line\n" * 100
+
+
+def test_read_cache_reads_each_file_once_until_it_changes(tmp_path: Path, monkeypatch):
+    target = tmp_path / "a.txt"
+    target.write_text("one\n")
+    calls = []
+    real_read = fs_ops.read_file_text
+    monkeypatch.setattr(fs_ops, "read_file_text", lambda path, max_bytes=None: calls.append(path) or real_read(path, max_bytes))
+    cache = fs_ops.ReadCache()
+
+    assert cache.read(str(target))[1] == "one\n"
+    assert cache.read(str(target))[1] == "one\n"
+    assert (len(calls), cache.hits, cache.misses) == (1, 1, 1)
+
+    target.write_text("two, longer\n")
+    assert cache.read(str(target))[1] == "two, longer\n"
+    assert len(calls) == 2
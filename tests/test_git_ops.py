@@ -0,0 +1,260 @@
+import json
+import subprocess
+import time
+
+import pytest
+
+import git_ops
+
+
+def git(root, *args):
+    return subprocess.run(["git", *args], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    for var, value in (("NAME", "Cherno Test"), ("EMAIL", "test@example.com")):
+        monkeypatch.setenv(f"GIT_AUTHOR_{var}", value)
+        monkeypatch.setenv(f"GIT_COMMITTER_{var}", value)
+    git(tmp_path, "init", "-q")
+    yield tmp_path
+    git_ops._close_sessions()
+    git_ops._sessions.clear()
+
+
+def test_first_commit_in_empty_repo(repo):
+    (repo / "a.txt").write_text("a\n")
+    (repo / "untracked.txt").write_text("u\n")
+
+    git_ops.commit_paths(["a.txt"], "feat(agent): update a.txt", root=str(repo))
+
+    assert git(repo, "log", "--format=%s") == "feat(agent): update a.txt"
+    assert git(repo, "ls-files") == "a.txt"
+    assert "commit (initial): feat(agent): update a.txt" in git(repo, "reflog", "-1")
+    assert git(repo, "status", "--porcelain") == "?? untracked.txt"
+
+
+def test_commit_touches_only_given_paths(repo):
+    for name in ("a.txt", "b.txt", "gone.txt"):
+        (repo / name).write_text(f"{name}\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "base")
+    (repo / "a.txt").write_text("changed\n")
+    (repo / "b.txt").write_text("also changed, not committed\n")
+    (repo / "gone.txt").unlink()
+    (repo / "new.txt").write_text("new\n")
+
+    git_ops.commit_paths(["a.txt", "gone.txt", "new.txt"], "feat(agent): update", root=str(repo))
+
+    assert git(repo, "show", "--name-status", "--format=%s", "HEAD").splitlines() == [
+        "feat(agent): update", "", "M\ta.txt", "D\tgone.txt", "A\tnew.txt",
+    ]
+    assert git(repo, "status", "--porcelain") == "M b.txt"
+    assert git(repo, "rev-parse", "HEAD~1") == git(repo, "rev-parse", "HEAD^")
+
+
+def test_head_moved_by_another_process_is_followed(repo):
+    (repo / "a.txt").write_text("1\n")
+    git_ops.commit_paths(["a.txt"], "one", root=str(repo))
+    (repo / "b.txt").write_text("2\n")
+    git(repo, "add", "b.txt")
+    git(repo, "commit", "-q", "-m", "external")
+    (repo / "a.txt").write_text("3\n")
+
+    git_ops.commit_paths(["a.txt"], "three", root=str(repo))
+
+    assert git(repo, "log", "--format=%s").splitlines() == ["three", "external", "one"]
+
+
+def test_refuses_ignored_paths_and_empty_commits(repo):
+    (repo / ".gitignore").write_text("*.log\n")
+    git_ops.commit_paths([".gitignore"], "ignore logs", root=str(repo))
+    (repo / "debug.log").write_text("secret\n")
+
+    with pytest.raises(RuntimeError, match="ignored"):
+        git_ops.commit_paths(["debug.log"], "logs", root=str(repo))
+    with pytest.raises(RuntimeError, match="nothing to commit"):
+        git_ops.commit_paths([".gitignore"], "again", root=str(repo))
+    assert git(repo, "log", "--format=%s") == "ignore logs"
+
+
+def test_session_resolves_revisions(repo):
+    (repo / "a.txt").write_text("a\n")
+    git_ops.commit_paths(["a.txt"], "one", root=str(repo))
+    session = git_ops.git_session(str(repo))
+
+    assert session.resolve("HEAD") == git(repo, "rev-parse", "HEAD")
+    assert session.resolve("HEAD:a.txt") == git(repo, "rev-parse", "HEAD:a.txt")
+    assert session.resolve("HEAD:missing.txt") is None
+    assert git_ops.git_session(str(repo)) is session
+
+
+def agent_write(repo, files, message):
+    """What Engine._write_and_commit does: snapshot, write, commit, snapshot, checkpoint."""
+    root = str(repo)
+    paths = list(files)
+    before = git_ops.snapshot_paths(paths, root=root)
+    for path, contents in files.items():
+        (repo / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo / path).write_text(contents)
+    git_ops.commit_paths(paths, message, root=root)
+    return git_ops.record_checkpoint(message, before, git_ops.snapshot_paths(paths, root=root), root=root)
+
+
+def test_checkpoints_stack_and_multi_step_rollback(repo):
+    (repo / "a.txt").write_text("a0\n")
+    git_ops.commit_paths(["a.txt"], "base", root=str(repo))
+    assert agent_write(repo, {"a.txt": "a1\n"}, "one") == 1
+    assert agent_write(repo, {"a.txt": "a2\n", "pkg/new.txt": "n\n"}, "two") == 2
+    (repo / "notes.txt").write_text("unrelated, uncommitted\n")
+
+    listed = git_ops.list_checkpoints(str(repo))
+    assert [(c.number, c.message, c.paths) for c in listed] == [(2, "two", ["a.txt", "pkg/new.txt"]), (1, "one", ["a.txt"])]
+    assert git(repo, "for-each-ref", "--format=%(refname)", "refs/cherno/") == (
+        "refs/cherno/checkpoints/1\nrefs/cherno/checkpoints/2"
+    )
+
+    undone = git_ops.rollback_checkpoints(2, root=str(repo))
+
+    assert [c.number for c in undone] == [2, 1]
+    assert (repo / "a.txt").read_text() == "a0\n"
+    assert not (repo / "pkg/new.txt").exists()
+    assert (repo / "notes.txt").read_text() == "unrelated, uncommitted\n"
+    assert git(repo, "log", "--format=%s").splitlines()[0] == "revert(agent): roll back checkpoint 2, 1"
+    assert git(repo, "status", "--porcelain") == "?? notes.txt"
+    assert git_ops.list_checkpoints(str(repo)) == []
+    with pytest.raises(RuntimeError, match="No agent checkpoints"):
+        git_ops.rollback_checkpoints(1, root=str(repo))
+
+
+def test_rollback_refuses_to_clobber_later_edits(repo):
+    (repo / "a.txt").write_text("a0\n")
+    git_ops.commit_paths(["a.txt"], "base", root=str(repo))
+    agent_write(repo, {"a.txt": "a1\n"}, "one")
+    (repo / "a.txt").write_text("edited by hand\n")
+
+    with pytest.raises(RuntimeError, match="changed since checkpoint: a.txt"):
+        git_ops.rollback_checkpoints(1, root=str(repo))
+    assert (repo / "a.txt").read_text() == "edited by hand\n"
+
+    git_ops.rollback_checkpoints(1, root=str(repo), force=True)
+    assert (repo / "a.txt").read_text() == "a0\n"
+
+
+def test_rollback_restores_uncommitted_before_state_and_mode(repo):
+    script = repo / "run.sh"
+    script.write_text("echo 0\n")
+    script.chmod(0o755)
+    git_ops.commit_paths(["run.sh"], "base", root=str(repo))
+    script.write_text("echo dirty\n")  # not committed when the agent edits it
+    agent_write(repo, {"run.sh": "echo agent\n"}, "one")
+
+    git_ops.rollback_checkpoints(1, root=str(repo))
+
+    assert script.read_text() == "echo dirty\n"
+    assert script.stat().st_mode & 0o111
+
+
+def test_rollback_restores_exact_bytes_and_keeps_other_mode_bits(repo):
+    (repo / ".gitattributes").write_text("*.txt text eol=lf\n")
+    notes, tool = repo / "notes.txt", repo / "tool.sh"
+    notes.write_bytes(b"one\r\ntwo\r\n")  # the clean filter would store LF endings
+    tool.write_text("echo 0\n")
+    tool.chmod(0o640)
+    git_ops.commit_paths([".gitattributes", "notes.txt", "tool.sh"], "base", root=str(repo))
+    tool.chmod(0o750)
+    agent_write(repo, {"notes.txt": "three\n", "tool.sh": "echo 1\n"}, "one")
+    tool.chmod(0o640)
+    git_ops.commit_paths(["tool.sh"], "mode", root=str(repo))
+
+    git_ops.rollback_checkpoints(1, root=str(repo), force=True)
+
+    assert notes.read_bytes() == b"one\r\ntwo\r\n"
+    assert tool.stat().st_mode & 0o777 == 0o750
+
+
+def queue_for(repo, policy, window=None):
+    session = git_ops.git_session(str(repo))
+    session.queue = git_ops.CommitQueue(session, policy=policy, window=window)
+    return session.queue
+
+
+def journal(repo):
+    return [json.loads(line) for line in (repo / ".agent/commits.jsonl").read_text().splitlines()]
+
+
+def test_commit_queue_per_edit_commits_each_edit_in_background(repo):
+    queue = queue_for(repo, "per-edit")
+    for name in ("a.txt", "b.txt"):
+        (repo / name).write_text(f"{name}\n")
+        queue.submit([name], f"feat(agent): update {name}")
+
+    assert queue.flush(timeout=30)
+
+    assert git(repo, "log", "--format=%s").splitlines() == ["feat(agent): update b.txt", "feat(agent): update a.txt"]
+    commits = [r for r in journal(repo) if r["event"] == "commit"]
+    assert [r["paths"] for r in commits] == [["a.txt"], ["b.txt"]]
+    assert commits[-1]["commit"] == git(repo, "rev-parse", "HEAD")
+
+
+def test_commit_queue_session_policy_squashes_until_flush(repo):
+    queue = queue_for(repo, "session")
+    (repo / "a.txt").write_text("a\n")
+    first = queue.submit(["a.txt"], "feat(agent): update a.txt", checkpoint=1)
+    (repo / "b.txt").write_text("b\n")
+    second = queue.submit(["b.txt", "a.txt"], "feat(agent): update b.txt, a.txt", checkpoint=2)
+    time.sleep(0.2)
+    assert queue.pending == 2
+    assert subprocess.run(["git", "rev-parse", "--verify", "-q", "HEAD"], cwd=repo).returncode != 0
+
+    queue.flush()
+
+    assert git(repo, "rev-list", "--count", "HEAD") == "1"
+    assert git(repo, "log", "-1", "--format=%s") == "feat(agent): update a.txt, b.txt"
+    assert "(checkpoint 2)" in git(repo, "log", "-1", "--format=%b")
+    commit = [r for r in journal(repo) if r["event"] == "commit"][-1]
+    assert commit["edits"] == [first, second]
+
+
+def test_commit_queue_window_policy_batches_by_time(repo):
+    queue = queue_for(repo, "window", window=0.3)
+    for name in ("a.txt", "b.txt"):
+        (repo / name).write_text(f"{name}\n")
+        queue.submit([name], f"feat(agent): update {name}")
+
+    deadline = time.monotonic() + 30
+    while queue.pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert git(repo, "rev-list", "--count", "HEAD") == "1"
+    assert git(repo, "ls-files").splitlines() == ["a.txt", "b.txt"]
+
+
+def test_commit_queue_failures_are_journaled_and_reported(repo):
+    (repo / ".gitignore").write_text("ignored.txt\n")
+    (repo / "ignored.txt").write_text("x\n")
+    queue = queue_for(repo, "per-edit")
+    queue.submit(["ignored.txt"], "feat(agent): update ignored.txt")
+    queue.flush()
+
+    assert git_ops.commit_failures(str(repo)) and git_ops.commit_failures(str(repo)) == []
+    assert journal(repo)[-1]["event"] == "commit_failed"
+
+
+def test_rollback_flushes_queued_commits_first(repo):
+    (repo / "a.txt").write_text("a0\n")
+    git_ops.commit_paths(["a.txt"], "base", root=str(repo))
+    queue = queue_for(repo, "session")
+    before = git_ops.snapshot_paths(["a.txt"], root=str(repo))
+    (repo / "a.txt").write_text("a1\n")
+    number = git_ops.record_checkpoint("one", before, git_ops.snapshot_paths(["a.txt"], root=str(repo)), root=str(repo))
+    queue.submit(["a.txt"], "feat(agent): update a.txt", checkpoint=number)
+
+    git_ops.rollback_checkpoints(1, root=str(repo))
+
+    assert git(repo, "log", "--format=%s").splitlines() == [
+        "revert(agent): roll back checkpoint 1",
+        "feat(agent): update a.txt",
+        "base",
+    ]
+    assert git(repo, "status", "--porcelain") == "?? .agent/"
@@ -1,6 +1,6 @@
 import pytest
 
-from intents import parse_intent, EditFile, CreateFile, RunCommand
+from intents import LOCAL_INTENT_THRESHOLD, parse_intent, parse_local_intent, EditFile, CreateFile, RunCommand
 
 
 def test_parse_edit_file_intent():
@@ -41,6 +41,64 @@ def test_parse_run_command_intent():
     assert intent.args == ["-q"]
 
 
+def test_parse_multi_edit_intent():
+    intent = parse_intent(
+        {"type": "multi_edit", "edits": [{"path": "a.py", "instructions": "x"}, {"path": "b.py", "instructions": "y", "patch": "p"}]}
+    )
+    assert [e.path for e in intent.edits] == ["a.py", "b.py"]
+    assert intent.edits[1].patch == "p"
+    with pytest.raises(ValueError):
+        parse_intent({"type": "multi_edit", "edits": []})
+
+
+def test_parse_search_code_intent():
+    intent = parse_intent({"type": "search_code", "pattern": "def main", "globs": ["*.py"]})
+    assert (intent.pattern, intent.literal, intent.globs, intent.max_results) == ("def main", False, ["*.py"], 50)
+    with pytest.raises(ValueError):
+        parse_intent({"type": "search_code", "pattern": ""})
+    with pytest.raises(ValueError):
+        parse_intent({"type": "search_code", "pattern": "x", "max_results": 0})
+
+
 def test_parse_intent_rejects_unknown_type():
     with pytest.raises(ValueError):
         parse_intent({"type": "unknown"})
+
+
+ALLOWLIST = ["python", "pytest", "ruff"]
+
+
+def test_local_intent_recognises_allowlisted_commands():
+    intent, confidence = parse_local_intent("run ruff check .", ALLOWLIST)
+    assert isinstance(intent, RunCommand)
+    assert (intent.command, intent.args) == ("ruff", ["check", "."])
+    assert confidence >= LOCAL_INTENT_THRESHOLD
+
+
+def test_local_intent_leaves_ambiguous_prompts_to_the_model():
+    assert parse_local_intent("run the tests", ALLOWLIST) is None
+    assert parse_local_intent("run pytest and fix whatever fails", ALLOWLIST) is None
+    assert parse_local_intent("run npm install", ALLOWLIST) is None  # not allowlisted
+    assert parse_local_intent("create a file app.py with contents a script that prints hi", ALLOWLIST) is None
+
+
+def test_local_intent_sends_prose_arguments_to_the_model():
+    assert parse_local_intent("run pytest on the planner tests", ALLOWLIST) is None
+    assert parse_local_intent("run pytest for me", ALLOWLIST) is None
+    assert parse_local_intent("run python main.py to check the output", ALLOWLIST) is None
+    assert parse_local_intent("run pytest -q for me", ALLOWLIST) is None
+    intent, _ = parse_local_intent("run pytest tests/test_planner.py -k resolve -x", ALLOWLIST)
+    assert intent.args == ["tests/test_planner.py", "-k", "resolve", "-x"]
+    intent, _ = parse_local_intent("run python -m pytest tests/", ALLOWLIST)
+    assert intent.args == ["-m", "pytest", "tests/"]
+
+
+def test_local_intent_creates_files_from_quoted_contents():
+    intent, _ = parse_local_intent('create file notes/todo.txt with contents "buy milk"', ALLOWLIST)
+    assert isinstance(intent, CreateFile)
+    assert intent.path == "notes/todo.txt"
+    assert intent.contents == "buy milk\n"
+
+
+def test_local_intent_respects_threshold():
+    assert parse_local_intent("run pytest", ALLOWLIST, threshold=0.99) is None
@@ -0,0 +1,209 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import llm
+
+
+def test_usage_tracker_records_cached_tokens(tmp_path):
+    tracker = llm.UsageTracker(tmp_path / "usage.jsonl")
+    usage = SimpleNamespace(input_tokens=1000, output_tokens=50, input_tokens_details=SimpleNamespace(cached_tokens=768))
+    tracker.record("intent", usage)
+    tracker.record("synthesize", {"input_tokens": 1000, "output_tokens": 10, "input_tokens_details": {"cached_tokens": 0}})
+    tracker.record("synthesize", None)
+
+    summary = tracker.summary()
+    assert summary["calls"] == 2
+    assert summary["cached_tokens"] == 768
+    assert summary["cache_hit_rate"] == 768 / 2000
+
+    lines = [json.loads(line) for line in (tmp_path / "usage.jsonl").read_text().splitlines()]
+    assert [entry["stage"] for entry in lines] == ["intent", "synthesize"]
+    assert lines[0]["cached_tokens"] == 768
+
+
+# --- RequestScheduler against a local fake Responses endpoint ---
+
+RESPONSE_BODY = {
+    "id": "resp_1",
+    "object": "response",
+    "created_at": 0,
+    "model": "fake",
+    "status": "completed",
+    "output": [
+        {
+            "type": "message",
+            "id": "msg_1",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": "hello", "annotations": []}],
+        }
+    ],
+    "usage": {"input_tokens": 10, "output_tokens": 2, "total_tokens": 12, "input_tokens_details": {"cached_tokens": 0}},
+}
+
+
+class FakeServer:
+    """Serves scripted (status, headers, delay) replies to POST /v1/responses, then 200s."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.hits = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                server.hits.append(time.monotonic())
+                status, headers, delay = server.script.pop(0) if server.script else (200, {}, 0)
+                time.sleep(delay)
+                body = json.dumps(RESPONSE_BODY if status == 200 else {"error": {"message": "nope"}}).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("content-type", "application/json")
+                    self.send_header("content-length", str(len(body)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.block_on_close = False  # don't wait out deliberately slow replies
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.01,), daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        from openai import OpenAI
+
+        self.client = OpenAI(base_url=f"http://127.0.0.1:{self.httpd.server_port}/v1", api_key="test", max_retries=0)
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_scheduler(**kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return llm.RequestScheduler(**kwargs)
+
+
+def test_scheduler_retries_throttling_and_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(llm, "record_usage", lambda stage, usage: None)
+    script = [(429, {"retry-after-ms": "200"}, 0), (503, {}, 0)]
+    with FakeServer(script) as server:
+        scheduler = make_scheduler()
+        scheduler.start_run(10)
+        resp = scheduler.create("intent", client=server.client, model="fake", input="hi")
+
+    assert resp.output_text == "hello"
+    assert len(server.hits) == 3
+    assert server.hits[1] - server.hits[0] >= 0.2
+    stats = scheduler.stats()
+    assert stats["calls"] == 1 and stats["retries"] == 2 and stats["failures"] == 0
+    assert stats["max_latency"] >= 0.2
+
+
+def test_scheduler_does_not_retry_client_errors(monkeypatch):
+    with FakeServer([(400, {}, 0)]) as server:
+        scheduler = make_scheduler()
+        with pytest.raises(Exception) as info:
+            scheduler.create("intent", client=server.client, model="fake", input="hi")
+
+    assert getattr(info.value, "status_code", None) == 400
+    assert len(server.hits) == 1
+    assert scheduler.stats()["failures"] == 1
+
+
+def test_scheduler_enforces_run_deadline_on_slow_responses(monkeypatch):
+    with FakeServer([(200, {}, 2.0)]) as server:
+        scheduler = make_scheduler(max_retries=0)
+        scheduler.start_run(0.3)
+        started = time.monotonic()
+        with pytest.raises(Exception):
+            scheduler.create("intent", client=server.client, model="fake", input="hi")
+        assert time.monotonic() - started < 1.5
+        with pytest.raises(llm.DeadlineExceeded):
+            time.sleep(0.3)
+            scheduler.create("intent", client=server.client, model="fake", input="hi")
+
+
+def test_scheduler_gives_up_when_retry_after_exceeds_deadline():
+    with FakeServer([(429, {"retry-after": "30"}, 0)]) as server:
+        scheduler = make_scheduler()
+        scheduler.start_run(1)
+        with pytest.raises(llm.DeadlineExceeded):
+            scheduler.create("intent", client=server.client, model="fake", input="hi")
+    assert len(server.hits) == 1
+
+
+def test_rate_limit_headers_throttle_the_token_bucket():
+    now = [0.0]
+    limiter = llm.RateLimiter(max_concurrency=4, clock=lambda: now[0])
+    limiter.update({"x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "1", "x-ratelimit-reset-requests": "1s"})
+    assert limiter.concurrency == 1
+
+    assert limiter.acquire() == 0
+    limiter.release()
+    assert limiter.tokens < 1
+    with pytest.raises(llm.DeadlineExceeded):
+        limiter.acquire(deadline=0.0)
+    now[0] = 1.0  # 60 requests/minute refill one token per second
+    limiter.acquire(deadline=2.0)
+    assert limiter.in_flight == 1
+
+
+def test_parse_duration_handles_openai_reset_format():
+    assert llm.parse_duration("20ms") == pytest.approx(0.02)
+    assert llm.parse_duration("6m0s") == 360
+    assert llm.parse_duration("1.5") == 1.5
+    assert llm.parse_duration("") is None
+
+
+def test_streamed_call_holds_its_concurrency_slot_until_closed():
+    class FakeStream:
+        closed = False
+
+        def __iter__(self):
+            yield "delta"
+
+        def close(self):
+            self.closed = True
+
+    raw = FakeStream()
+    client = SimpleNamespace(responses=SimpleNamespace(create=lambda **kwargs: raw))
+    scheduler = make_scheduler(limiter=llm.RateLimiter(max_concurrency=1))
+
+    stream = scheduler.create("synthesize", client=client, model="fake", input="hi", stream=True)
+    assert scheduler.limiter.in_flight == 1
+    with pytest.raises(llm.DeadlineExceeded):
+        scheduler.limiter.acquire(deadline=time.monotonic() + 0.1)
+
+    assert list(stream) == ["delta"]
+    assert raw.closed and scheduler.limiter.in_flight == 0
+    stream.close()  # closing again does not free a slot twice
+    assert scheduler.limiter.in_flight == 0
+
+
+def test_scheduler_stats_cover_the_current_run_only(monkeypatch):
+    monkeypatch.setattr(llm, "record_usage", lambda stage, usage: None)
+    client = SimpleNamespace(responses=SimpleNamespace(create=lambda **kwargs: SimpleNamespace(usage=None)))
+    scheduler = make_scheduler()
+    scheduler.start_run()
+    for _ in range(3):
+        scheduler.create("intent", client=client, model="fake", input="hi")
+    assert scheduler.stats()["calls"] == 3
+
+    scheduler.start_run()
+    scheduler.create("intent", client=client, model="fake", input="hi")
+    assert scheduler.stats()["calls"] == 1
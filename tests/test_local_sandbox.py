@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from providers.e2b_sandbox import E2BSandbox
+from providers.fake_e2b import FakeSandbox
+from providers.local_sandbox import LocalSandbox
+from providers.output_buffer import OutputBuffer, truncate_output
+
+
+@pytest.fixture
+def sandbox(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    policy = {"allowlist": [Path(sys.executable).name], "timeout_sec": 5, "max_output_bytes": 1000}
+    (tmp_path / ".agent").mkdir()
+    (tmp_path / ".agent/policy.json").write_text(json.dumps(policy))
+    box = LocalSandbox()
+    yield box
+    if box.last_log:
+        os.unlink(box.last_log)
+
+
+def test_streamed_buffer_matches_whole_string_truncation():
+    text = "".join(f"línea {i} ✓\n" for i in range(500))
+    for cap in (0, 1, 7, 100, 999, len(text.encode()), 10**6):
+        for chunk in (1, 3, 64, 4096):
+            buffer = OutputBuffer(cap)
+            data = text.encode()
+            for i in range(0, len(data), chunk):
+                buffer.write(data[i:i + chunk])
+            assert buffer.text() == truncate_output(text, cap), (cap, chunk)
+
+
+def test_truncation_keeps_head_and_tail_within_the_cap():
+    text = "".join(f"line {i}\n" for i in range(1000))
+    capped = truncate_output(text, 200)
+    head, marker, tail = capped.partition("\n...[truncated")
+    assert head == text[:100] and text.endswith(tail.split("]\n", 1)[1])
+    assert f"{len(text) - 200} bytes]" in marker + tail
+    assert truncate_output("short", 200) == "short"
+    assert truncate_output(text, 0) == text
+
+
+def test_e2b_provider_truncates_the_same_way(monkeypatch):
+    monkeypatch.setenv("E2B_MAX_OUTPUT_BYTES", "200")
+    box = E2BSandbox(sdk=FakeSandbox)
+    try:
+        text = "".join(f"line {i}\n" for i in range(1000))
+        assert box._truncate_output(text) == truncate_output(text, 200)
+    finally:
+        box.close()
+
+
+def test_run_streams_lines_and_bounds_memory(sandbox):
+    script = "import sys\nfor i in range(2000):\n    print('out', i)\n    print('err', i, file=sys.stderr)\n"
+    lines = []
+
+    code, out, err = sandbox.run(sys.executable, ["-c", script], on_output=lambda stream, line: lines.append((stream, line)))
+
+    assert code == 0
+    assert [line for stream, line in lines if stream == "stdout"] == [f"out {i}" for i in range(2000)]
+    assert [line for stream, line in lines if stream == "stderr"] == [f"err {i}" for i in range(2000)]
+    assert out.startswith("out 0\n") and out.endswith("out 1999\n") and "...[truncated" in out
+    assert len(out.encode()) < 1100
+    full = Path(sandbox.last_log).read_text()
+    assert full.count("\n") == 4000 and "out 1000" in full
+
+
+def test_small_output_leaves_no_log(sandbox):
+    assert sandbox.run(sys.executable, ["-c", "print('hi')"]) == (0, "hi\n", "")
+    assert sandbox.last_log is None
+
+
+def test_windows_line_endings_are_normalised(sandbox):
+    script = "import sys\nsys.stdout.buffer.write(b'a\\r\\nb\\rc\\n')\nsys.stderr.buffer.write(b'oops\\r\\n')"
+    lines = []
+
+    code, out, err = sandbox.run(sys.executable, ["-c", script], on_output=lambda stream, line: lines.append(line))
+
+    assert (code, out, err) == (0, "a\nb\nc\n", "oops\n")
+    assert lines[0] == "a" and "oops" in lines  # a lone \r stays in live lines, for progress bars
+
+
+def test_timeout_kills_the_command(sandbox):
+    sandbox.policy["timeout_sec"] = 1
+    with pytest.raises(subprocess.TimeoutExpired):
+        sandbox.run(sys.executable, ["-c", "import time\nprint('started', flush=True)\ntime.sleep(30)"])
+
+
+def test_command_outside_allowlist_is_refused(sandbox):
+    with pytest.raises(PermissionError):
+        sandbox.run("ls", [])
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+
+import pytest
+
+import memory
+
+
+def exchange(n, size=0):
+    answer = {
+        "intent": {"type": "create_file", "path": f"f{n}.txt", "contents": "x" * size},
+        "actions": [{"type": "write_file", "path": f"f{n}.txt", "applied": True}],
+    }
+    return [
+        {"role": "user", "content": f"create file {n}"},
+        {"role": "assistant", "content": json.dumps(answer)},
+    ]
+
+
+def session(n, size=0):
+    turns = []
+    for i in range(n):
+        turns += exchange(i, size)
+    return turns
+
+
+def test_trim_turns_keeps_small_histories_verbatim():
+    turns = session(5)
+    assert memory.trim_turns(turns, budget=10_000) is turns
+
+
+def test_trim_turns_folds_old_exchanges_into_a_rolling_summary():
+    trimmed = memory.trim_turns(session(30), budget=1000)
+
+    assert memory.history_tokens(trimmed) <= 1000 * memory.COMPACT_TARGET
+    summary = trimmed[0]
+    assert summary["role"] == "summary"
+    assert "- 'create file 0' -> create_file f0.txt (written)" in summary["content"]
+    assert trimmed[-2]["content"] == "create file 29"
+
+    # The summary keeps rolling forward on the next compaction.
+    again = memory.trim_turns(trimmed + exchange(30, 4000), budget=1000)
+    assert again[0]["role"] == "summary"
+    assert "create file 0" in again[0]["content"]
+    assert again[-2]["content"] == "create file 30"
+
+
+def test_compacted_history_keeps_its_prefix_until_the_next_compaction():
+    turns = memory.trim_turns(session(30), budget=1000)
+    head = turns[0]
+    for i in range(30, 33):
+        turns = memory.trim_turns(turns + exchange(i), budget=1000)
+        assert turns[0] is head
+
+
+def test_compact_payload_digests_long_strings():
+    payload = {"intent": {"contents": "a" * 5000, "path": "x.py"}, "plan": [{"contents": "a" * 5000}]}
+    compacted = memory.compact_payload(payload)
+
+    assert compacted["intent"]["path"] == "x.py"
+    assert compacted["intent"]["contents"].startswith("<5000 chars sha256:")
+    assert compacted["intent"]["contents"] == compacted["plan"][0]["contents"]
+    assert len(json.dumps(compacted)) < 400
+
+
+# --- SessionLog ---
+
+
+def test_session_log_appends_and_reloads(tmp_path):
+    log = memory.SessionLog("work", root=tmp_path)
+    log.append(exchange(0))
+    log.append(exchange(1))
+
+    assert memory.SessionLog("work", root=tmp_path).load() == exchange(0) + exchange(1)
+    assert memory.SessionLog("other", root=tmp_path).load() == []
+    with pytest.raises(ValueError):
+        memory.SessionLog("../escape", root=tmp_path)
+
+
+def test_session_log_loads_only_the_tail_after_a_checkpoint(tmp_path, monkeypatch):
+    log = memory.SessionLog("s", root=tmp_path)
+    turns = []
+    for i in range(40):
+        new = exchange(i, 1000)
+        turns = log.record(turns + new, new)
+    assert turns[0]["role"] == "summary"
+
+    index = json.loads(log.index_path.read_text())
+    assert 0 < index["live"] < index["size"] == log.path.stat().st_size
+
+    read_sizes = []
+    real_open = open
+
+    def spying_open(path, mode="r", *args, **kwargs):
+        fh = real_open(path, mode, *args, **kwargs)
+        if str(path) == str(log.path) and "r" in mode:
+            real_read = fh.read
+            fh.read = lambda *a: read_sizes.append(len(data := real_read(*a))) or data
+        return fh
+
+    monkeypatch.setattr("builtins.open", spying_open)
+    assert memory.SessionLog("s", root=tmp_path).load() == turns
+    assert read_sizes == [index["size"] - index["live"]]
+
+
+def test_session_log_repairs_a_missing_index(tmp_path):
+    log = memory.SessionLog("s", root=tmp_path)
+    log.append(exchange(0))
+    log.checkpoint(exchange(1))
+    log.append(exchange(2))
+    log.index_path.unlink()
+
+    assert log.load() == exchange(1) + exchange(2)
+
+
+def test_session_log_serialises_concurrent_writers(tmp_path):
+    def writer(n):
+        log = memory.SessionLog("shared", root=tmp_path)
+        for i in range(20):
+            log.append(exchange(n * 100 + i))
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    lines = (tmp_path / "shared.jsonl").read_text().splitlines()
+    assert len(lines) == 4 * 20 * 2
+    assert all(json.loads(line)["role"] in ("user", "assistant") for line in lines)
+
+
+def test_session_log_checkpoint_keeps_turns_other_writers_appended(tmp_path):
+    first = memory.SessionLog("shared", root=tmp_path)
+    second = memory.SessionLog("shared", root=tmp_path)
+    turns = []
+    for i in range(10):
+        new = exchange(i, 1000)
+        turns = first.record(turns + new, new)
+    other = second.load()
+    other = second.record(other + exchange(50), exchange(50))  # first never loaded this one
+
+    for i in range(10, 30):
+        new = exchange(i, 1000)
+        turns = first.record(turns + new, new)
+    assert turns[0]["role"] == "summary"
+
+    reloaded = memory.SessionLog("shared", root=tmp_path).load()
+    assert reloaded == turns
+    assert "create file 50" in turns[0]["content"] + json.dumps(turns[1:])
+    assert [t["content"] for t in turns[-2:]] == [t["content"] for t in exchange(29, 1000)]
+
+
+def test_session_log_compacts_dead_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "COMPACT_MIN_BYTES", 1000)
+    log = memory.SessionLog("s", root=tmp_path)
+    log.append(session(30, 100))
+    before = log.path.stat().st_size
+    log.checkpoint(exchange(99))
+    log.wait()
+
+    assert log.path.stat().st_size < before
+    assert json.loads(log.index_path.read_text())["live"] == 0
+    assert log.load() == exchange(99)
+
+
+def test_session_log_imports_legacy_session_json(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(".agent")
+    (tmp_path / ".agent/session.json").write_text(json.dumps(exchange(7)))
+
+    assert memory.SessionLog("default").load() == exchange(7)
+    assert (tmp_path / ".agent/sessions/default.jsonl").exists()
+
+
+def test_session_log_retrieves_relevant_exchanges_outside_the_live_history(tmp_path):
+    log = memory.SessionLog("s", root=tmp_path)
+    old = [
+        {"role": "user", "content": "add a retry loop to fetch_remote in net/client.py"},
+        {"role": "assistant", "content": '{"intent":{"type":"edit_file","path":"net/client.py"}}'},
+    ]
+    turns = []
+    for new in [old] + [exchange(i, 1000) for i in range(40)]:
+        turns = log.record(turns + new, new)
+    assert old[0] not in turns  # compacted out of the live history
+
+    context = memory.SessionLog("s", root=tmp_path).relevant_context("fetch_remote still fails in net/client.py", turns)
+    assert len(context) == 1
+    assert context[0].startswith(memory.RETRIEVAL_HEADER)
+    assert "add a retry loop to fetch_remote" in context[0]
+
+    # Exchanges still in the live history are not repeated.
+    assert "User: create file 39\n" not in "".join(log.relevant_context("create file 39", turns))
+    assert log.relevant_context("fetch_remote", turns, budget=10) == []
@@ -1,5 +1,10 @@
+import difflib
 import textwrap
+from types import SimpleNamespace
 
+import pytest
+
+import patcher
 from patcher import validate_generated_code
 
 
@@ -20,3 +25,234 @@ def test_validate_generated_code_reports_json_issue():
     issues = validate_generated_code("config.json", "{ not: valid }")
     assert issues
     assert "Invalid JSON" in issues[0]
+
+
+class FakeStream:
+    def __init__(self, deltas, interrupt_after=None):
+        self.deltas = deltas
+        self.interrupt_after = interrupt_after
+        self.closed = False
+
+    def __iter__(self):
+        for n, delta in enumerate(self.deltas):
+            if self.interrupt_after is not None and n == self.interrupt_after:
+                raise KeyboardInterrupt
+            yield SimpleNamespace(type="response.output_text.delta", delta=delta)
+        yield SimpleNamespace(type="response.completed")
+
+    def close(self):
+        self.closed = True
+
+
+def fake_client(stream):
+    def create(**kwargs):
+        assert kwargs["stream"] is True
+        return stream
+
+    return SimpleNamespace(responses=SimpleNamespace(create=create))
+
+
+def test_streaming_synthesis_reports_deltas(monkeypatch):
+    stream = FakeStream(["def greet():\n", "    return 'hello'\n"])
+    monkeypatch.setattr(patcher, "get_client", lambda: fake_client(stream))
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+    seen = []
+
+    text, issues = patcher.synthesize_new_contents("app.py", "def greet():\n    return 'hi'\n", "say hello", on_delta=seen.append)
+
+    assert seen == ["def greet():\n", "def greet():\n    return 'hello'\n"]
+    assert text == "def greet():\n    return 'hello'"
+    assert issues == []
+    assert stream.closed is True
+
+
+def test_streaming_synthesis_abort_closes_stream(monkeypatch):
+    stream = FakeStream(["line one\n", "line two\n"], interrupt_after=1)
+    monkeypatch.setattr(patcher, "get_client", lambda: fake_client(stream))
+
+    with pytest.raises(patcher.SynthesisAborted):
+        patcher.synthesize_new_contents("notes.txt", "", "anything", on_delta=lambda text: None)
+    assert stream.closed is True
+
+
+def test_preview_partial_contents_keeps_unreached_original_tail():
+    original = "a\nb\nc\nd\n"
+    assert patcher.preview_partial_contents(original, "a\nB\nc\n") == "a\nB\nc\nd\n"
+    # An unfinished last line is not shown yet.
+    assert patcher.preview_partial_contents(original, "a\nb\nC") == original
+
+
+def test_partial_preview_aligns_only_new_lines_and_restarts_on_a_new_stream(monkeypatch):
+    original = "".join(f"line {i}\n" for i in range(200))
+    edited = original.replace("line 50\n", "line fifty\n").replace("line 120\n", "")
+    lines = edited.splitlines(keepends=True)
+    partials = ["".join(lines[:n]) + "li" for n in range(10, len(lines) + 1, 10)] + [edited]
+    expected = [patcher.preview_partial_contents(original, partial) for partial in partials]
+    compared = []
+    real_matcher = patcher.difflib.SequenceMatcher
+
+    def counting_matcher(isjunk, a, b, **kwargs):
+        compared.append(len(b))
+        return real_matcher(isjunk, a, b, **kwargs)
+
+    monkeypatch.setattr(patcher.difflib, "SequenceMatcher", counting_matcher)
+    preview = patcher.PartialPreview(original)
+
+    assert [preview.update(partial) for partial in partials] == expected
+    assert expected[-1] == edited
+    assert max(compared) == 10  # each redraw aligned just the lines completed since the last one
+    # A fallback request streams a fresh response: the alignment starts over.
+    assert preview.update("line 0\nline 1\n") == original
+
+
+def test_edit_blocks_are_applied_locally(monkeypatch):
+    original = "def greet():\n    return 'hi'\n\n\ndef other():\n    return 1\n"
+    blocks = "<<<<<<< SEARCH\n    return 'hi'\n=======\n    return 'hello'\n>>>>>>> REPLACE\n"
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs["input"][0]["content"][0]["text"])
+        return SimpleNamespace(output_text=blocks, usage=SimpleNamespace(output_tokens=12))
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+    stats = {}
+
+    text, issues = patcher.synthesize_new_contents("app.py", original, "say hello", stats=stats)
+
+    assert text == original.replace("'hi'", "'hello'")
+    assert issues == []
+    assert calls == [patcher.EDIT_SYSTEM]
+    assert stats["mode"] == "edit_blocks"
+    assert stats["output_tokens"] == 12
+    assert stats["saved_tokens_estimate"] > 0
+
+
+def test_unappliable_edit_blocks_fall_back_to_full_file(monkeypatch):
+    replies = iter([
+        SimpleNamespace(output_text="<<<<<<< SEARCH\nnot in the file\n=======\nx\n>>>>>>> REPLACE\n", usage=None),
+        SimpleNamespace(output_text="print('rewritten')\n", usage=None),
+    ])
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=lambda **kw: next(replies))))
+    stats = {}
+
+    text, issues = patcher.synthesize_new_contents("app.py", "print('hi')\n", "rewrite", stats=stats)
+
+    assert text == "print('rewritten')"
+    assert stats["mode"] == "full_file"
+    assert stats["edit_block_failures"]
+
+
+def test_synthesis_cache_skips_second_model_call(tmp_path, monkeypatch):
+    from cache import DiskCache
+
+    calls = []
+
+    def create(**kwargs):
+        calls.append(1)
+        return SimpleNamespace(output_text="print('new')\n", usage=None)
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+    cache = DiskCache(root=tmp_path)
+
+    first = patcher.synthesize_new_contents("app.py", "", "write it", cache=cache)
+    stats = {}
+    second = patcher.synthesize_new_contents("app.py", "", "write it", stats=stats, cache=cache)
+
+    assert first == second == ("print('new')", [])
+    assert len(calls) == 1
+    assert stats["cached"] is True
+
+
+def test_related_signatures_reach_the_synthesis_prompt(monkeypatch):
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs["input"][-1]["content"][0]["text"])
+        return SimpleNamespace(output_text="x = 2\n")
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+
+    patcher.synthesize_new_contents("a.py", "x = 1\n", "bump x", context="util.py\n  def helper(a)  [1-2]")
+
+    assert "SIGNATURES OF IMPORTED MODULES:\nutil.py\n  def helper(a)" in sent[0]
+    assert sent[0].endswith("INSTRUCTIONS:\nbump x")
+
+
+def test_large_file_synthesis_is_region_scoped(monkeypatch):
+    original = "".join(f"def func_{i}(x):\n    return x + {i}\n\n\n" for i in range(150))
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs["input"][-1]["content"][0]["text"])
+        return SimpleNamespace(
+            output_text="<<<<<<< SEARCH\n    return x + 70\n=======\n    return x * 70\n>>>>>>> REPLACE\n"
+        )
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+    stats = {}
+    new_text, issues = patcher.synthesize_new_contents("big.py", original, "make func_70 multiply", stats=stats)
+
+    assert new_text == original.replace("return x + 70\n", "return x * 70\n")
+    assert issues == []
+    assert stats["mode"] == "region_blocks" and stats["regions"] == 1
+    assert "def func_70" in sent[0] and "def func_10(" not in sent[0] and "⟪cherno: lines 1-" in sent[0]
+
+
+def test_region_stream_previews_against_the_whole_file(monkeypatch):
+    original = "".join(f"def func_{i}(x):\n    return x + {i}\n\n\n" for i in range(150))
+    excerpt = patcher.Excerpt(original, patcher.locate_regions("big.py", original, "make func_70 multiply"))
+    edited = excerpt.text.replace("return x + 70\n", "return x * 70\n")
+    stream = FakeStream([line for line in edited.splitlines(keepends=True)])
+    monkeypatch.setattr(patcher, "get_client", lambda: fake_client(stream))
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+    seen = []
+
+    new_text, _ = patcher.synthesize_new_contents("big.py", original, "make func_70 multiply", on_delta=seen.append)
+
+    assert new_text == original.replace("return x + 70\n", "return x * 70\n")
+    assert not any("⟪cherno" in text for text in seen)
+    # Mid-stream, only the change made so far shows up: nothing outside the excerpt is "deleted".
+    for text in seen:
+        preview = patcher.preview_partial_contents(original, text).splitlines()
+        removed = [line for line in difflib.ndiff(original.splitlines(), preview) if line.startswith("- ")]
+        assert removed in ([], ["-     return x + 70"])
+    assert patcher.preview_partial_contents(original, seen[-1]) == new_text
+
+
+def test_failed_region_edit_goes_straight_to_the_whole_file(monkeypatch):
+    original = "".join(f"def func_{i}(x):\n    return x + {i}\n\n\n" for i in range(150))
+    replies = iter(["<<<<<<< SEARCH\nnot in the file\n=======\nx\n>>>>>>> REPLACE\n", original.replace("x + 70", "x * 70")])
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs["input"][0]["content"][0]["text"])
+        return SimpleNamespace(output_text=next(replies))
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+    stats = {}
+    new_text, _ = patcher.synthesize_new_contents("big.py", original, "make func_70 multiply", stats=stats)
+
+    # Region rewrite and whole-file edit blocks are skipped: two model calls, not four.
+    assert sent == [patcher.REGION_EDIT_SYSTEM, patcher.SYNTH_SYSTEM]
+    assert stats["region_fallback"] is True and stats["mode"] == "full_file"
+    assert "x * 70" in new_text
+
+
+def test_region_response_without_markers_falls_back_to_whole_file(monkeypatch):
+    original = "".join(f"def func_{i}(x):\n    return x + {i}\n\n\n" for i in range(150))
+    replies = iter(["def func_70(x):\n    return 0\n", original.replace("x + 70", "x * 70")])
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs["input"][0]["content"][0]["text"])
+        return SimpleNamespace(output_text=next(replies))
+
+    monkeypatch.setattr(patcher, "get_client", lambda: SimpleNamespace(responses=SimpleNamespace(create=create)))
+    monkeypatch.setattr(patcher, "EDIT_BLOCKS_ENABLED", False)
+    stats = {}
+    new_text, _ = patcher.synthesize_new_contents("big.py", original, "make func_70 multiply", stats=stats)
+
+    assert sent == [patcher.REGION_SYNTH_SYSTEM, patcher.SYNTH_SYSTEM]
+    assert stats["region_fallback"] is True and stats["mode"] == "full_file"
+    assert "x * 70" in new_text
@@ -57,15 +57,13 @@ def test_plan_for_edit_file_with_patch(tmp_path, monkeypatch):
     assert plan == [
         {"kind": "read_file", "path": "src/app.py"},
         {
-            "kind": "show_diff",
+            "kind": "apply_patch",
             "path": "src/app.py",
-            "contents": "diff --git a/src/app.py b/src/app.py\n",
-        },
-        {
-            "kind": "write_file",
-            "path": "src/app.py",
-            "contents": "diff --git a/src/app.py b/src/app.py\n",
+            "patch": "diff --git a/src/app.py b/src/app.py\n",
+            "instructions": "Already provided diff",
         },
+        {"kind": "show_diff", "path": "src/app.py"},
+        {"kind": "write_file", "path": "src/app.py"},
     ]
 
 
@@ -98,3 +96,43 @@ def test_plan_returns_error_when_file_missing(tmp_path, monkeypatch):
     assert plan == [
         {"kind": "error", "path": "does/not/exist.py", "message": "Target file 'does/not/exist.py' does not exist."}
     ]
+
+
+def test_plan_for_multi_edit(tmp_path, monkeypatch):
+    (tmp_path / "a.py").write_text("a\n")
+    (tmp_path / "b.py").write_text("b\n")
+    monkeypatch.chdir(tmp_path)
+    edits = [{"path": "a.py", "instructions": "x"}, {"path": "b.py", "instructions": "y"}]
+
+    plan = plan_from_intent({"type": "multi_edit", "edits": edits})
+
+    assert [(s["kind"], s.get("path")) for s in plan] == [
+        ("read_file", "a.py"), ("read_file", "b.py"), ("synthesize_files", None),
+        ("show_diff", "a.py"), ("show_diff", "b.py"), ("write_file", "a.py"), ("write_file", "b.py"),
+    ]
+    missing = plan_from_intent({"type": "multi_edit", "edits": edits + [{"path": "c.py", "instructions": "z"}]})
+    assert missing[0]["kind"] == "error"
+
+
+def test_plan_resolves_mistyped_paths(tmp_path, monkeypatch):
+    (tmp_path / "planner.py").write_text("x\n")
+    (tmp_path / "b.py").write_text("b\n")
+    monkeypatch.chdir(tmp_path)
+    resolve = {"planer.py": "planner.py"}.get
+
+    plan = plan_from_intent({"type": "edit_file", "path": "planer.py", "instructions": "x"}, resolve_path=resolve)
+    assert plan[0] == {"kind": "read_file", "path": "planner.py", "resolved_from": "planer.py"}
+    assert all(step["path"] == "planner.py" for step in plan)
+
+    edits = [{"path": "planer.py", "instructions": "x"}, {"path": "b.py", "instructions": "y"}]
+    multi = plan_from_intent({"type": "multi_edit", "edits": edits}, resolve_path=resolve)
+    assert multi[0]["resolved_from"] == "planer.py"
+    assert [e["path"] for e in multi[2]["edits"]] == ["planner.py", "b.py"]
+
+    unknown = plan_from_intent({"type": "edit_file", "path": "nothing.py", "instructions": "x"}, resolve_path=resolve)
+    assert unknown[0]["kind"] == "error"
+
+
+def test_plan_for_search_code():
+    plan = plan_from_intent({"type": "search_code", "pattern": "TODO", "literal": True, "globs": None})
+    assert plan == [{"kind": "search_code", "pattern": "TODO", "literal": True, "globs": [], "max_results": 50}]
@@ -0,0 +1,71 @@
+from regions import Excerpt, instruction_names, locate_regions
+
+
+def big_module(functions: int = 60) -> str:
+    parts = ["import os\n\n"]
+    for i in range(functions):
+        parts.append(f"def func_{i}(x):\n    y = x + {i}\n    return y\n\n\n")
+    parts.append("class Store:\n    def load(self):\n        return 1\n\n    @property\n    def size(self):\n        return 2\n")
+    return "".join(parts)
+
+
+def test_instruction_names_ignore_plain_words():
+    names = instruction_names("Rename `load` in Store.size and make func_3() run the value; update the method save")
+    assert {"load", "Store.size", "func_3", "save"} <= names
+    assert "run" not in names and "value" not in names and "Rename" not in names
+
+
+def test_locate_python_function_with_context():
+    source = big_module()
+    regions = locate_regions("m.py", source, "make func_30 return x * 2", context=2)
+
+    lines = source.splitlines()
+    start, end = regions[0]
+    assert len(regions) == 1
+    assert lines[start + 1].startswith("def func_30")  # two lines of context before it
+    assert end - start < 10
+
+
+def test_locate_qualified_method_includes_decorator():
+    source = big_module()
+    (start, end), = locate_regions("m.py", source, "change Store.size to return 3", context=0)
+    assert source.splitlines()[start - 1].strip() == "@property"
+    assert source.splitlines()[end - 1].strip() == "return 2"
+
+
+def test_locate_line_hint_and_fallbacks():
+    source = big_module()
+    (start, end), = locate_regions("m.py", source, "fix the bug on line 13", context=0)
+    assert source.splitlines()[start - 1].startswith("def func_2")
+    assert locate_regions("m.py", source, "make it faster") is None
+    assert locate_regions("m.py", big_module(5), "change func_1", min_lines=300) is None
+    every = " ".join(f"func_{i}" for i in range(60))
+    assert locate_regions("m.py", source, f"rename {every}", min_lines=10) is None
+
+
+def test_locate_indented_blocks_in_other_languages():
+    body = "".join(f"function helper{i}(a) {{\n  return a + {i};\n}}\n\n" for i in range(100))
+    source = body + "export function renderPage(props) {\n  if (props) {\n    return 1;\n  }\n  return 0;\n}\n"
+    (start, end), = locate_regions("page.js", source, "make renderPage return 2", context=0)
+    lines = source.splitlines()
+    assert lines[start - 1].startswith("export function renderPage")
+    assert lines[end - 1] == "}" and end == len(lines)
+
+
+def test_excerpt_round_trip_and_splice():
+    source = "".join(f"line {i}\n" for i in range(1, 101))
+    excerpt = Excerpt(source, [(10, 12), (50, 51)])
+
+    assert excerpt.text.count("⟪cherno: lines") == 3
+    assert excerpt.splice(excerpt.text) == source
+    edited = excerpt.text.replace("line 11\n", "line eleven\nline 11b\n").replace("line 51\n", "")
+    spliced = excerpt.splice(edited)
+    assert spliced == source.replace("line 11\n", "line eleven\nline 11b\n").replace("line 51\n", "")
+    assert excerpt.splice(edited.replace("⟪cherno: lines 13-49 unchanged and omitted⟫\n", "")) is None
+    assert excerpt.splice("junk\n" + excerpt.text) is None
+
+
+def test_excerpt_keeps_missing_final_newline():
+    source = "".join(f"line {i}\n" for i in range(1, 21)) + "last"
+    excerpt = Excerpt(source, [(19, 21)])
+    assert excerpt.splice(excerpt.text.replace("last", "final")) == source.replace("last", "final")
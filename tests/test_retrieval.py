@@ -0,0 +1,38 @@
+from retrieval import BM25Index, select_within_budget, tokenize
+
+
+def test_tokenize_keeps_paths_and_identifier_parts():
+    tokens = tokenize("Rename load_policy in executor.py and src/app/main.py")
+    assert "executor.py" in tokens
+    assert "src/app/main.py" in tokens
+    assert {"load_policy", "load", "policy", "rename"} <= set(tokens)
+    assert "and" not in tokens
+
+
+def test_bm25_ranks_matching_documents_first():
+    index = BM25Index()
+    index.add(1, "create README.md with install notes")
+    index.add(2, "run pytest -q")
+    index.add(3, "edit executor.py: add a timeout to run_command")
+    index.add(4, "edit planner.py to add a step")
+
+    ranked = index.search("why does executor.py time out?", k=3)
+    assert ranked[0][0] == 3
+    assert all(score > 0 for _, score in ranked)
+    assert [doc for doc, _ in index.search("pytest", k=5)] == [2]
+    assert index.search("pytest", k=5, exclude=[2]) == []
+
+
+def test_bm25_updates_incrementally():
+    index = BM25Index()
+    index.add(1, "alpha beta")
+    assert index.search("gamma", k=1) == []
+    index.add(2, "gamma delta")
+    assert index.search("gamma", k=1)[0][0] == 2
+    index.add(2, "ignored duplicate")
+    assert len(index) == 2
+
+
+def test_select_within_budget_skips_documents_that_do_not_fit():
+    ranked = [(5, 3.0), (2, 2.0), (9, 1.0)]
+    assert select_within_budget(ranked, {5: 60, 2: 50, 9: 30}, budget=100) == [5, 9]
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+import sandbox as sandbox_module
+from providers.e2b_sandbox import E2BSandbox
+from providers.fake_e2b import FakeSandbox
+from providers.sandbox_pool import PooledSandbox, SandboxPool
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def pool():
+    pools = []
+
+    def make(**options):
+        made = SandboxPool(lambda: E2BSandbox(sdk=FakeSandbox), **options)
+        pools.append(made)
+        return made
+
+    yield make
+    for made in pools:
+        made.close()
+
+
+def test_fake_sdk_runs_commands_in_its_own_home():
+    sandbox = E2BSandbox(sdk=FakeSandbox)
+    try:
+        code, out, err = sandbox.run("echo", ["hello world"])
+        assert (code, out, err) == (0, "hello world\n", "")
+        assert sandbox.run("pwd", [])[1].strip().endswith("/home/user")
+        assert sandbox.healthy()
+    finally:
+        sandbox.close()
+    assert not sandbox.healthy()
+
+
+def test_pool_is_lazy_and_reuses_sandboxes(pool):
+    sandboxes = pool(prewarm=0)
+    runner = PooledSandbox(sandboxes)
+    assert sandboxes.stats["created"] == 0
+
+    runner.run("echo", ["one"])
+    runner.close()
+    runner = PooledSandbox(sandboxes)  # a later prompt
+    runner.run("echo", ["two"])
+
+    assert sandboxes.stats["created"] == 1
+    assert sandboxes.stats["reused"] == 1
+
+
+def test_pool_prewarms_spares_after_first_use(pool):
+    sandboxes = pool(prewarm=2, max_size=4)
+    leased = sandboxes.acquire()
+
+    assert wait_for(lambda: sandboxes.idle == 2)
+    assert sandboxes.stats["created"] == 3
+    sandboxes.release(leased)
+    assert sandboxes.idle == 3
+
+
+def test_pool_evicts_idle_sandboxes_and_stops_warming(pool):
+    sandboxes = pool(prewarm=1, idle_ttl=0.2)
+    leased = sandboxes.acquire()
+    assert wait_for(lambda: sandboxes.idle == 1)  # the spare
+    sandboxes.release(leased)
+
+    assert wait_for(lambda: sandboxes.idle == 0 and sandboxes.stats["evicted"] == 2)
+    time.sleep(0.3)
+    assert sandboxes.stats["created"] == 2
+
+
+def test_pool_replaces_unhealthy_sandboxes(pool):
+    sandboxes = pool(prewarm=0)
+    first = sandboxes.acquire()
+    first._sbx.expire()  # the service reclaimed it
+    sandboxes.release(first, suspect=True)
+
+    second = sandboxes.acquire()
+
+    assert second is not first
+    assert sandboxes.stats["unhealthy"] == 1
+    assert second.run("true", [])[0] == 0
+
+
+def test_pooled_sandbox_marks_failed_commands_suspect(pool):
+    sandboxes = pool(prewarm=0)
+    runner = PooledSandbox(sandboxes)
+    runner.run("true", [])
+    sandboxes._idle[-1][2]._sbx.expire()
+
+    with pytest.raises(RuntimeError, match="not running"):
+        runner.run("true", [])
+
+    assert runner.run("echo", ["ok"])[1] == "ok\n"
+    assert sandboxes.stats == {"created": 2, "reused": 1, "evicted": 0, "unhealthy": 1, "failed": 0}
+
+
+def test_make_sandbox_shares_one_pool_per_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(sandbox_module, "SANDBOX_CONF", tmp_path / "sandbox.json")
+    monkeypatch.setattr(sandbox_module, "E2B_SDK", FakeSandbox)
+    (tmp_path / "sandbox.json").write_text('{"provider": "e2b", "pool": {"prewarm": 0}}')
+    try:
+        first, second = sandbox_module.make_sandbox(), sandbox_module.make_sandbox()
+        assert isinstance(first, PooledSandbox) and first.pool is second.pool
+        first.run("true", [])
+        second.run("true", [])
+        assert first.pool.stats["created"] == 1
+    finally:
+        sandbox_module._close_pools()
+        sandbox_module._pools.clear()
+
+
+def test_sandbox_conf_cannot_select_the_fake_sdk(tmp_path, monkeypatch):
+    monkeypatch.setattr(sandbox_module, "SANDBOX_CONF", tmp_path / "sandbox.json")
+    (tmp_path / "sandbox.json").write_text('{"provider": "e2b", "sdk": "fake"}')
+
+    with pytest.raises(ValueError, match="tests and benchmarks only"):
+        sandbox_module.make_sandbox()
+    assert sandbox_module._pools == {}
@@ -0,0 +1,66 @@
+import pytest
+
+import search
+from search import compile_pattern, iter_matches, matches_globs, search_code
+from workspace import WorkspaceIndex
+
+
+def make_workspace(root):
+    (root / "src").mkdir()
+    (root / "src" / "app.py").write_text("def load_config(path):\n    return open(path)\n\nconfig = load_config('x')\n")
+    (root / "src" / "util.py").write_text("# load_config is defined in app.py\nVALUE = 1\n")
+    (root / "docs.md").write_text("Call load_config() [with markup] first.\n")
+    (root / "image.bin").write_bytes(b"load_config\x00\x01")
+    (root / "ignored").mkdir()
+    (root / "ignored" / "copy.py").write_text("load_config\n")
+    (root / ".gitignore").write_text("ignored/\n")
+    workspace = WorkspaceIndex(str(root))
+    workspace.refresh()
+    return workspace
+
+
+def test_search_is_ordered_and_skips_binaries_and_ignored_files(tmp_path):
+    workspace = make_workspace(tmp_path)
+
+    result = search_code(workspace, r"load_config\(")
+
+    assert [m.snippet() for m in result["matches"]] == [
+        "docs.md:1: Call load_config() [with markup] first.",
+        "src/app.py:1: def load_config(path):",
+        "src/app.py:4: config = load_config('x')",
+    ]
+    assert result["files"] == 2 and result["truncated"] is False
+
+
+def test_search_literal_globs_and_limits(tmp_path):
+    workspace = make_workspace(tmp_path)
+
+    literal = search_code(workspace, "load_config(", literal=True, globs=["*.py"])
+    assert [m.path for m in literal["matches"]] == ["src/app.py", "src/app.py"]
+
+    streamed = []
+    limited = search_code(workspace, "load_config", max_results=2, on_match=streamed.append)
+    assert len(limited["matches"]) == 2 and limited["truncated"] is True
+    assert streamed == limited["matches"]
+
+    with pytest.raises(ValueError, match="Invalid search pattern"):
+        compile_pattern("(unclosed")
+
+
+def test_matches_globs():
+    assert matches_globs("src/app.py", ["*.py"])
+    assert matches_globs("src/app.py", ["src/"])
+    assert matches_globs("src/pkg/app.py", ["**/app.py"])
+    assert matches_globs("src/app.py", ["./src/*.py"])
+    assert not matches_globs("src/app.py", ["docs/*"])
+
+
+def test_one_result_per_line_and_per_file_cap(tmp_path, monkeypatch):
+    (tmp_path / "many.txt").write_text("x x x\n" * 50)
+    workspace = WorkspaceIndex(str(tmp_path))
+    workspace.refresh()
+    monkeypatch.setattr(search, "MAX_MATCHES_PER_FILE", 5)
+
+    found = list(iter_matches(workspace, compile_pattern("x"), workers=4))
+
+    assert [m.line for m in found] == [1, 2, 3, 4, 5]
@@ -0,0 +1,115 @@
+import json
+
+import symbols
+from symbols import SymbolIndex, extract_symbols
+from workspace import INDEX_DIR, WorkspaceIndex
+
+SOURCE = '''
+import os
+
+
+class Store(dict):
+    def get_item(self, key: str, default=None) -> int:
+        return 1
+
+    async def fetch(self, *keys, **opts):
+        pass
+
+
+def helper(a, b: int = 2) -> str:
+    def inner():
+        pass
+    return ""
+'''
+
+
+def test_extract_symbols_signatures_and_spans():
+    found = extract_symbols(SOURCE)
+
+    assert [(s.kind, s.name) for s in found] == [
+        ("class", "Store"), ("method", "get_item"), ("method", "fetch"), ("def", "helper"),
+    ]
+    assert found[0].signature == "class Store(dict)"
+    assert found[1].signature == "def get_item(self, key: str, default=None) -> int"
+    assert found[2].signature == "async def fetch(self, *keys, **opts)"
+    assert (found[3].start, found[3].end) == (13, 16)
+    assert extract_symbols("def broken(:\n") == []
+
+
+def make_repo(root):
+    (root / "pkg").mkdir()
+    (root / "pkg" / "__init__.py").write_text("")
+    (root / "pkg" / "store.py").write_text(SOURCE)
+    (root / "pkg" / "util.py").write_text("def slugify(text: str) -> str:\n    return text\n")
+    (root / "app.py").write_text("from pkg import store\nfrom pkg.util import slugify\n\ndef main():\n    pass\n")
+    (root / "notes.txt").write_text("def not_python(): pass\n")
+    workspace = WorkspaceIndex(str(root))
+    workspace.refresh()
+    return workspace
+
+
+def test_symbols_cached_by_content_hash(tmp_path, monkeypatch):
+    workspace = make_repo(tmp_path)
+    index = SymbolIndex(workspace)
+
+    assert index.refresh() == 4  # three modules plus the empty __init__.py
+    assert index.refresh() == 0
+    assert [s.name for s in index.symbols_for("pkg/util.py")] == ["slugify"]
+    assert index.symbols_for("notes.txt") == []
+
+    # A new process loads the cache from disk and parses only what changed.
+    (tmp_path / "pkg" / "util.py").write_text("def slugify(text: str, sep: str = '-') -> str:\n    return text\n")
+    workspace.refresh()
+    parsed = []
+    monkeypatch.setattr(symbols, "extract_symbols", lambda source: parsed.append(source) or [])
+    fresh = SymbolIndex(workspace)
+    assert fresh.refresh() == 1
+    assert len(parsed) == 1
+    cached = json.loads((tmp_path / INDEX_DIR / "symbols.json").read_text())["symbols"]
+    assert len(cached) == 4
+
+
+def test_repo_map_respects_budget_and_focus(tmp_path):
+    index = SymbolIndex(make_repo(tmp_path))
+    index.refresh()
+
+    full = index.repo_map(budget=10_000)
+    assert "pkg/store.py\n  class Store(dict)  [5-10]\n    def get_item" in full
+    small = index.repo_map(budget=20, focus=["pkg/util.py"])
+    assert small.startswith("pkg/util.py")
+    assert "store.py" not in small
+
+
+def test_import_signatures_resolve_workspace_modules(tmp_path):
+    index = SymbolIndex(make_repo(tmp_path))
+    index.refresh()
+
+    related = index.import_signatures("app.py", (tmp_path / "app.py").read_text())
+
+    assert "pkg/store.py" in related and "def slugify(text: str) -> str" in related
+    assert "app.py" not in related.splitlines()
+    relative = index.import_signatures("pkg/store.py", "from .util import slugify\n")
+    assert relative.startswith("pkg/util.py")
+    assert index.import_signatures("app.py", "import os\n") == ""
+
+
+def test_parallel_extraction_matches_serial(tmp_path, monkeypatch):
+    for i in range(8):
+        (tmp_path / f"m{i}.py").write_text(f"def f{i}(x):\n    return x\n")
+    workspace = WorkspaceIndex(str(tmp_path))
+    workspace.refresh()
+    monkeypatch.setattr(symbols, "PARALLEL_MIN_FILES", 4)
+    monkeypatch.setattr(symbols, "SYMBOL_WORKERS", 2)
+    contexts = []
+    real_pool = symbols.ProcessPoolExecutor
+
+    def recording_pool(**kwargs):
+        contexts.append(kwargs["mp_context"].get_start_method())
+        return real_pool(**kwargs)
+
+    monkeypatch.setattr(symbols, "ProcessPoolExecutor", recording_pool)
+    index = SymbolIndex(workspace)
+
+    assert index.refresh() == 8
+    assert [s.name for s in index.symbols_for("m7.py")] == ["f7"]
+    assert contexts and contexts[0] in ("forkserver", "spawn")  # never fork from the threaded daemon
@@ -0,0 +1,105 @@
+import json
+import os
+import subprocess
+
+from workspace import INDEX_DIR, INDEX_FILE, WorkspaceIndex
+
+
+def make_tree(root):
+    (root / "src").mkdir()
+    (root / "src" / "planner.py").write_text("plan\n")
+    (root / "src" / "patcher.py").write_text("patch\n")
+    (root / "main.py").write_text("main\n")
+    (root / "build").mkdir()
+    (root / "build" / "out.py").write_text("generated\n")
+    (root / "debug.log").write_text("noise\n")
+    (root / ".gitignore").write_text("build/\n*.log\n")
+
+
+def test_walk_honours_gitignore_and_persists(tmp_path):
+    make_tree(tmp_path)
+    index = WorkspaceIndex(str(tmp_path))
+
+    assert index.refresh() is True
+    assert index.paths() == [".gitignore", "main.py", "src/patcher.py", "src/planner.py"]
+    saved = json.loads((tmp_path / INDEX_DIR / INDEX_FILE).read_text())
+    assert len(saved["files"]) == 4
+
+    # A fresh index loads the saved entries and finds nothing to do.
+    again = WorkspaceIndex(str(tmp_path))
+    assert again.refresh() is False
+    assert again.entries == index.entries
+
+
+def test_refresh_rehashes_only_changed_files(tmp_path, monkeypatch):
+    make_tree(tmp_path)
+    index = WorkspaceIndex(str(tmp_path))
+    index.refresh()
+
+    hashed = []
+    import workspace
+
+    original = workspace._hash_file
+    monkeypatch.setattr(workspace, "_hash_file", lambda path: hashed.append(path.name) or original(path))
+    target = tmp_path / "main.py"
+    target.write_text("main changed\n")
+    os.utime(target, ns=(1, 1))
+    (tmp_path / "src" / "patcher.py").unlink()
+
+    assert index.refresh() is True
+    assert hashed == ["main.py"]
+    assert "src/patcher.py" not in index
+    assert index.resolve("patcher.py") is None
+
+
+def test_git_listing_includes_untracked_but_not_ignored(tmp_path):
+    make_tree(tmp_path)
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    subprocess.run(["git", "add", "main.py"], cwd=tmp_path, check=True)
+    index = WorkspaceIndex(str(tmp_path))
+
+    index.refresh()
+
+    assert index.paths() == [".gitignore", "main.py", "src/patcher.py", "src/planner.py"]
+
+
+def test_fuzzy_resolution(tmp_path):
+    make_tree(tmp_path)
+    index = WorkspaceIndex(str(tmp_path))
+    index.refresh()
+
+    assert index.resolve("src/planner.py") == "src/planner.py"
+    assert index.resolve("planer.py") == "src/planner.py"
+    assert index.resolve("src/pathcer.py") == "src/patcher.py"
+    assert index.resolve("completely_unrelated.txt") is None
+    assert index.fuzzy_matches("planner")[0][0] == "src/planner.py"
+
+
+def test_resolution_keeps_leading_dots_of_dotfiles(tmp_path):
+    make_tree(tmp_path)
+    (tmp_path / ".env.example").write_text("KEY=\n")
+    (tmp_path / ".python-version").write_text("3.12\n")
+    (tmp_path / "python-version").write_text("unrelated\n")
+    index = WorkspaceIndex(str(tmp_path))
+    index.refresh()
+
+    assert index.resolve(".gitignore") == ".gitignore"
+    assert index.resolve("./.gitignore") == ".gitignore"
+    assert index.resolve(".python-version") == ".python-version"
+    assert index.resolve("./python-version") == "python-version"
+    assert index.resolve(" ./src/planner.py ") == "src/planner.py"
+    assert index.resolve(".\\src\\planner.py") == "src/planner.py"
+    assert index.fuzzy_matches(".env.exmaple")[0][0] == ".env.example"
+
+
+def test_candidates_for_prompt(tmp_path):
+    for i in range(30):
+        (tmp_path / f"module_{i}.py").write_text("")
+    (tmp_path / "planner.py").write_text("")
+    index = WorkspaceIndex(str(tmp_path))
+    index.refresh()
+
+    assert index.candidates_for("fix the bug in the planer")[0] == "planner.py"
+    small = WorkspaceIndex(str(tmp_path / "missing"))
+    small.refresh()
+    assert small.candidates_for("anything") == []
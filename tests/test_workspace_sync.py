@@ -0,0 +1,108 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from providers.e2b_sandbox import E2BSandbox
+from providers.fake_e2b import FakeSandbox
+from providers.sandbox_pool import PooledSandbox, SandboxPool
+from providers.workspace_sync import WorkspaceSync
+from workspace import WorkspaceIndex
+
+REMOTE = "/home/user/workspace"
+
+
+@pytest.fixture
+def sandbox():
+    box = E2BSandbox(sdk=FakeSandbox)
+    yield box
+    box.close()
+
+
+def remote(box, path=""):
+    return Path(box._sbx.local_path(f"{REMOTE}/{path}"))
+
+
+def remote_files(box):
+    root = remote(box)
+    return {p.relative_to(root).as_posix(): p.read_text() for p in root.rglob("*") if p.is_file()}
+
+
+def make_workspace(tmp_path, files):
+    for name, text in files.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(text)
+    return WorkspaceIndex(str(tmp_path))
+
+
+def test_first_push_uploads_everything_then_only_the_diff(tmp_path, sandbox):
+    workspace = make_workspace(tmp_path, {"a.py": "a = 1\n", "pkg/b.py": "b = 1\n", "gone.txt": "x\n"})
+    sync = WorkspaceSync(workspace)
+
+    first = sync.push(sandbox)
+    assert (first.uploaded, first.deleted, first.archives) == (3, 0, 1)
+    assert remote_files(sandbox) == {"a.py": "a = 1\n", "pkg/b.py": "b = 1\n", "gone.txt": "x\n"}
+
+    (tmp_path / "a.py").write_text("a = 2\n")
+    (tmp_path / "gone.txt").unlink()
+    second = sync.push(sandbox)
+
+    assert (second.uploaded, second.deleted) == (1, 1)
+    assert remote_files(sandbox) == {"a.py": "a = 2\n", "pkg/b.py": "b = 1\n"}
+    assert sync.push(sandbox).uploaded == 0
+
+
+def test_large_push_is_split_across_parallel_archives(tmp_path, sandbox):
+    workspace = make_workspace(tmp_path, {f"d{i % 3}/f{i}.txt": f"{i}\n" * 200 for i in range(20)})
+    sync = WorkspaceSync(workspace, workers=4, parallel_min_bytes=1)
+
+    result = sync.push(sandbox)
+
+    assert (result.uploaded, result.archives) == (20, 4)
+    assert len(remote_files(sandbox)) == 20
+    assert sync.push(sandbox).archives == 0
+
+
+def test_commands_run_in_the_synced_workspace_and_changes_come_back(tmp_path):
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    script = "for name, text in [('a.txt', 'remote'), ('new.txt', 'new'), ('run.log', 'noise')]:\n    open(name, 'w').write(text + '\\n')\n"
+    workspace = make_workspace(tmp_path, {"a.txt": "local\n", ".gitignore": "*.log\n", "gen.py": script})
+    pool = SandboxPool(lambda: E2BSandbox(sdk=FakeSandbox), prewarm=0)
+    runner = PooledSandbox(pool, WorkspaceSync(workspace))
+    try:
+        code, out, _ = runner.run("cat", ["a.txt"])
+        assert (code, out) == (0, "local\n")
+
+        runner.run(sys.executable, ["gen.py"])
+
+        assert runner.sync.last_pulled == ["a.txt", "new.txt"]
+        assert (tmp_path / "a.txt").read_text() == "remote\n"
+        assert (tmp_path / "new.txt").read_text() == "new\n"
+        assert not (tmp_path / "run.log").exists()
+        assert runner.sync.push(pool.acquire()).uploaded == 0  # the pulled files are already there
+    finally:
+        pool.close()
+
+
+def test_remote_change_loses_to_a_local_edit(tmp_path, sandbox):
+    workspace = make_workspace(tmp_path, {"a.txt": "v1\n"})
+    sync = WorkspaceSync(workspace)
+    sync.push(sandbox)
+    sandbox.shell("echo remote > a.txt", cwd=REMOTE)
+    (tmp_path / "a.txt").write_text("edited locally\n")
+
+    assert sync.pull(sandbox) == []
+    assert (tmp_path / "a.txt").read_text() == "edited locally\n"
+    assert sync.push(sandbox).uploaded == 1
+    assert remote_files(sandbox) == {"a.txt": "edited locally\n"}
+
+
+def test_sandbox_reused_by_another_workspace_starts_clean(tmp_path, sandbox):
+    one = make_workspace(tmp_path / "one", {"only_one.txt": "1\n"})
+    two = make_workspace(tmp_path / "two", {"only_two.txt": "2\n"})
+    WorkspaceSync(one).push(sandbox)
+
+    WorkspaceSync(two).push(sandbox)
+
+    assert remote_files(sandbox) == {"only_two.txt": "2\n"}
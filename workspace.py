@@ -0,0 +1,242 @@
+# workspace.py
+"""
+Persistent index of the files in the workspace, kept in .agent/index/files.json.
+
+Each entry records path, size, mtime and a content hash. Refreshing lists files with
+`git ls-files` (tracked plus untracked-but-not-ignored, so .gitignore is honoured) or,
+outside a git repository, a directory walk that applies the root .gitignore; only files
+whose size or mtime changed are re-hashed. A trigram index over the paths resolves
+misspelled or partial paths ("planer.py" -> "planner.py").
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import posixpath
+import re
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+INDEX_DIR = Path(".agent/index")
+INDEX_FILE = "files.json"
+
+# Never indexed, whatever .gitignore says.
+ALWAYS_SKIPPED = {".git", ".agent", "__pycache__", ".venv", "venv", "node_modules"}
+
+# Minimum trigram similarity for a fuzzy path match to be used automatically.
+RESOLVE_THRESHOLD = 0.55
+
+_WORDISH = re.compile(r"[\w./-]{3,}")
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    sha: str
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def _normalize_query(query: str) -> str:
+    """A user-typed path in index form: "./.gitignore" -> ".gitignore", "src\\a.py" -> "src/a.py"."""
+    path = query.strip().replace("\\", "/")
+    if not path:
+        return ""
+    path = posixpath.normpath(path).lstrip("/")
+    return "" if path == "." else path
+
+
+class _GitIgnore:
+    """The subset of .gitignore syntax the walk fallback needs: globs, dir/ and /anchored."""
+
+    def __init__(self, lines: Iterable[str]) -> None:
+        self.rules: List[Tuple[str, bool, bool]] = []  # (pattern, dir_only, anchored)
+        for raw in lines:
+            line = raw.strip()
+            if not line or line.startswith(("#", "!")):
+                continue
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = line.startswith("/") or "/" in line
+            self.rules.append((line.lstrip("/"), dir_only, anchored))
+
+    def ignored(self, rel: str, is_dir: bool) -> bool:
+        name = rel.rsplit("/", 1)[-1]
+        for pattern, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            target = rel if anchored else name
+            if fnmatch.fnmatchcase(target, pattern):
+                return True
+        return False
+
+
+class WorkspaceIndex:
+    def __init__(self, root: str = ".", index_dir: Optional[Path] = None) -> None:
+        self.root = Path(root)
+        self.index_path = (index_dir or self.root / INDEX_DIR) / INDEX_FILE
+        self.entries: Dict[str, FileEntry] = {}
+        self._grams: Dict[str, Set[str]] = {}          # path -> trigrams
+        self._postings: Dict[str, Set[str]] = {}       # trigram -> paths
+        self._loaded = False
+
+    # --- persistence ---
+
+    def load(self) -> None:
+        self._loaded = True
+        try:
+            data = json.loads(self.index_path.read_text())
+            self.entries = {row[0]: FileEntry(*row) for row in data.get("files", [])}
+        except (OSError, ValueError, TypeError):
+            self.entries = {}
+        self._rebuild_grams()
+
+    def save(self) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        rows = [list(entry) for entry in sorted(self.entries.values())]
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        tmp.write_text(json.dumps({"version": 1, "files": rows}, separators=(",", ":")))
+        os.replace(tmp, self.index_path)
+
+    # --- refreshing ---
+
+    def _git_files(self) -> Optional[List[str]]:
+        if not (self.root / ".git").exists():
+            return None
+        try:
+            proc = subprocess.run(
+                ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                cwd=self.root,
+                capture_output=True,
+            )
+        except OSError:
+            return None
+        if proc.returncode != 0:
+            return None
+        return [p for p in proc.stdout.decode("utf-8", "surrogateescape").split("\0") if p]
+
+    def _walk_files(self) -> List[str]:
+        try:
+            ignore = _GitIgnore((self.root / ".gitignore").read_text(encoding="utf-8").splitlines())
+        except OSError:
+            ignore = _GitIgnore([])
+        found: List[str] = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            rel_dir = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            prefix = "" if rel_dir == "." else rel_dir + "/"
+            dirnames[:] = sorted(
+                d for d in dirnames if d not in ALWAYS_SKIPPED and not ignore.ignored(prefix + d, True)
+            )
+            found.extend(prefix + f for f in sorted(filenames) if not ignore.ignored(prefix + f, False))
+        return found
+
+    def refresh(self) -> bool:
+        """Bring the index up to date with the disk. Returns True if anything changed."""
+        if not self._loaded:
+            self.load()
+        paths = self._git_files()
+        if paths is None:
+            paths = self._walk_files()
+        fresh: Dict[str, FileEntry] = {}
+        for rel in paths:
+            if set(rel.split("/")) & ALWAYS_SKIPPED:
+                continue
+            full = self.root / rel
+            try:
+                st = full.stat()
+            except OSError:
+                continue  # deleted but still in the git index
+            if not os.path.isfile(full):
+                continue
+            old = self.entries.get(rel)
+            if old is not None and old.size == st.st_size and old.mtime_ns == st.st_mtime_ns:
+                fresh[rel] = old
+                continue
+            try:
+                fresh[rel] = FileEntry(rel, st.st_size, st.st_mtime_ns, _hash_file(full))
+            except OSError:
+                continue
+        changed = fresh != self.entries
+        paths_changed = fresh.keys() != self.entries.keys()
+        self.entries = fresh
+        if paths_changed:
+            self._rebuild_grams()
+        if changed:
+            self.save()
+        return changed
+
+    # --- lookup ---
+
+    def _rebuild_grams(self) -> None:
+        self._grams = {path: trigrams(path) for path in self.entries}
+        self._postings = {}
+        for path, grams in self._grams.items():
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(path)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.entries
+
+    def paths(self) -> List[str]:
+        return sorted(self.entries)
+
+    def fuzzy_matches(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Paths ranked by trigram similarity to `query` (whole path or file name, whichever is closer)."""
+        query = _normalize_query(query)
+        if not query:
+            return []
+        grams = trigrams(query)
+        candidates: Set[str] = set()
+        for gram in grams:
+            candidates |= self._postings.get(gram, set())
+        scored = []
+        for path in candidates:
+            score = _similarity(grams, self._grams[path])
+            name = path.rsplit("/", 1)[-1]
+            if "/" not in query:
+                score = max(score, _similarity(grams, trigrams(name)))
+            scored.append((path, score))
+        scored.sort(key=lambda item: (-item[1], len(item[0]), item[0]))
+        return scored[:limit]
+
+    def resolve(self, query: str, threshold: float = RESOLVE_THRESHOLD) -> Optional[str]:
+        """The indexed path `query` most likely means, or None if nothing is close enough."""
+        normalized = _normalize_query(query)
+        if normalized in self.entries:
+            return normalized
+        matches = self.fuzzy_matches(normalized, limit=2)
+        if not matches or matches[0][1] < threshold:
+            return None
+        if len(matches) > 1 and matches[1][1] == matches[0][1]:
+            return None  # ambiguous
+        return matches[0][0]
+
+    def candidates_for(self, prompt: str, limit: int = 15) -> List[str]:
+        """Indexed files that the words of `prompt` resemble, best first (all files if few)."""
+        if len(self.entries) <= limit:
+            return self.paths()
+        best: Dict[str, float] = {}
+        for word in _WORDISH.findall(prompt):
+            for path, score in self.fuzzy_matches(word, limit=3):
+                if score >= RESOLVE_THRESHOLD:
+                    best[path] = max(best.get(path, 0.0), score)
+        return [path for path, _ in sorted(best.items(), key=lambda item: (-item[1], item[0]))[:limit]]